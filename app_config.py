@@ -8,6 +8,8 @@ VERSION = Version(0, 3, 0)
 
 # 是否为debug模式，通过参数中是否有`--debug`来判断
 DEBUG = "--debug" in sys.argv
+# 是否强制使用内置的HTTP下载器（而不是aria2），通过参数中是否有`--builtin-downloader`来判断
+FORCE_BUILTIN_DOWNLOADER = "--builtin-downloader" in sys.argv
 
 
 # 临时目录
@@ -16,10 +18,28 @@ TEMP_DIR = os.path.join(os.getenv("TEMP", ""), "PavlovToolboxTemp")
 TEMP_DOWNLOAD_DIR = os.path.join(TEMP_DIR, "downloads")
 # （临时目录下）导入模组时的临时目录
 TEMP_IMPORT_MOD_DIR = os.path.join(TEMP_DIR, "import_mod")
+# （Mod安装目录下）导入模组时的暂存目录名称，与安装目录在同一个卷上，解压完成后只需重命名即可完成安装
+MOD_STAGING_DIR_NAME = ".pavlov_toolbox_staging"
 
 # 本地数据目录
 # cSpell: disable-next-line
 DATA_DIR = os.path.join(os.getenv("LOCALAPPDATA", ""), "PavlovToolboxData")
+# （本地数据目录下）aria2会话文件路径，用于在重启后恢复未完成的下载任务
+ARIA2_SESSION_PATH = os.path.join(DATA_DIR, "aria2", "aria2.session")
+# （本地数据目录下）内置HTTP下载器的会话文件路径，作用与aria2会话文件相同
+HTTP_DOWNLOADER_SESSION_PATH = os.path.join(DATA_DIR, "http_downloader", "session.json")
+# （本地数据目录下）下载任务的附加信息（gid到ModInstallationInfo的映射），与aria2会话文件配合使用
+DOWNLOAD_TASKS_PATH = os.path.join(DATA_DIR, "aria2", "download_tasks.json")
+# （本地数据目录下）下载调度设置（限速、低影响模式）的保存路径
+DOWNLOAD_SCHEDULE_PATH = os.path.join(DATA_DIR, "download_schedule.json")
+# （本地数据目录下）导入调度设置（每个卷同时导入的数量）的保存路径
+IMPORT_SCHEDULE_PATH = os.path.join(DATA_DIR, "import_schedule.json")
+# （本地数据目录下）各下载主机的吞吐量和错误率，用于给下载地址排序
+MIRROR_SCORES_PATH = os.path.join(DATA_DIR, "mirror_scores.json")
+# （本地数据目录下）镜像站清单的缓存目录
+MIRROR_MANIFEST_CACHE_DIR = os.path.join(DATA_DIR, "mirror_manifests")
+# （本地数据目录下）镜像站配置，不存在时使用内置的配置
+MIRROR_PROVIDERS_PATH = os.path.join(DATA_DIR, "mirror_providers.json")
 # （本地数据目录下）日志文件目录
 LOG_DIR = os.path.join(DATA_DIR, "logs")
 # （本地数据目录下）此次的日志文件路径
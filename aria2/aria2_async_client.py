@@ -0,0 +1,82 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Tuple
+from PySide6.QtCore import QObject, QTimer
+from PySide6.QtWidgets import QApplication
+
+from aria2.aria2_client import Aria2Client
+from common.qrequest import QFuturePromise
+
+
+class Aria2AsyncClient(QObject):
+    """Aria2异步客户端
+
+    所有RPC调用都在一个专用的RPC线程中按顺序执行，不会阻塞主线程。
+    每个方法都返回一个QFuturePromise，与QRequestPromise一样，需要调用done才会真正发出请求，
+    then和catch中的函数会回到主线程中执行。
+
+    只有一个RPC线程，因此调用的执行顺序与done的调用顺序一致，
+    且底层Aria2Client的requests.Session始终只在一个线程中使用。
+
+    client也可以是与Aria2Client接口兼容的HttpDownloader（见DownloadEngine）。
+    """
+
+    def __init__(self, client: Aria2Client, parent: QObject | None = None) -> None:
+        super().__init__(parent)
+        self.client = client
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Aria2Rpc")
+
+    def call(self, func: Callable[..., Any], *args: Any) -> QFuturePromise:
+        """在RPC线程中执行func（一般为Aria2Client的方法，或组合了多个调用的函数）"""
+        return QFuturePromise(self, self.executor, func, *args)
+
+    def close(self):
+        """取消还未执行的调用（它们的then和catch都不会被调用），并结束RPC线程"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def multicall(self, *calls: Tuple[Any, ...]) -> QFuturePromise:
+        return self.call(self.client.multicall, *calls)
+
+    def addUri(
+        self, uris: List[str], options: dict | None = None, position: int | None = None
+    ) -> QFuturePromise:
+        return self.call(self.client.addUri, uris, options, position)
+
+    def remove(self, gid: str) -> QFuturePromise:
+        return self.call(self.client.remove, gid)
+
+    def tellStatus(self, gid: str, keys: list | None = None) -> QFuturePromise:
+        return self.call(self.client.tellStatus, gid, keys)
+
+    def getGlobalStat(self) -> QFuturePromise:
+        return self.call(self.client.getGlobalStat)
+
+    def removeDownloadResult(self, gid: str) -> QFuturePromise:
+        return self.call(self.client.removeDownloadResult, gid)
+
+    def getVersion(self) -> QFuturePromise:
+        return self.call(self.client.getVersion)
+
+
+if __name__ == "__main__":
+    from aria2.aria2_supervisor import Aria2Supervisor
+
+    app = QApplication()
+    supervisor = Aria2Supervisor(app)
+    supervisor.start()
+    client = Aria2AsyncClient(supervisor.client, app)
+    client.call(supervisor.waitUntilReady).then(lambda version: print(version)).done()
+
+    def poll():
+        print("不阻塞")
+        (
+            client.multicall(("aria2.tellActive",), ("aria2.getGlobalStat",))
+            .then(lambda results: print(results))
+            .catch(lambda error: print(f"error: {error}"))
+            .done()
+        )
+
+    timer = QTimer()
+    timer.setInterval(1000)
+    timer.timeout.connect(poll)
+    timer.start()
+    app.exec()
@@ -1,14 +1,8 @@
 import json
-import os
 import secrets
-import subprocess
-import sys
 import time
-from typing import Any, List, Optional
+from typing import Any, Iterator, List, Optional, Tuple
 import requests
-import app_config
-from common.log import AppLogger
-from common.path import getResourcePath
 
 
 class Aria2RpcException(Exception):
@@ -23,33 +17,33 @@ class Aria2RpcException(Exception):
 class Aria2Client:
     """Aria2客户端，通过requests库与Aria2进行JsonRPC通信。
 
-    实例化该类后自动启动Aria2子进程，该类被析构时会自动**尝试结束**aria2子进程。
+    该类只负责RPC通信，aria2子进程由Aria2Supervisor启动和管理。
+
+    所有请求都通过同一个`requests.Session`发出，复用与aria2之间的keep-alive连接；
+    需要一次性调用多个方法时，使用`multicall`将它们合并为一次`system.multicall`请求。
 
     参考[Aria2非官方中文文档](https://aria2.document.top/zh/aria2c.html#id42)
     """
 
-    def __init__(self):
-        self.rpcUrl = "http://127.0.0.1:6800/jsonrpc"
+    # 单次RPC请求的默认超时时间（秒），防止aria2卡住时调用方一直等待
+    RPC_TIMEOUT = 10
+
+    def __init__(self, port: int = 6800, rpcSecret: str | None = None):
         self.rpcHeaders = {"Content-Type": "application/json"}
         self.rpcId: int = 0
+        self.rpcTimeout: float = self.RPC_TIMEOUT
+        self.rpcSecret = rpcSecret if rpcSecret is not None else secrets.token_hex(32)
+        self.setPort(port)
+        # 使用Session以复用连接池中的持久连接，避免每次请求都重新建立TCP连接
+        self.session = requests.Session()
+        self.session.headers.update(self.rpcHeaders)
 
-        executablePath = getResourcePath(os.path.join("aria2", "aria2c.exe"))
-        configPath = getResourcePath(os.path.join("aria2", "aria2.conf"))
-        self.rpcSecret = secrets.token_hex(32)
-        command = f"{executablePath} --conf-path {configPath} --rpc-secret {self.rpcSecret} --dir {app_config.TEMP_DOWNLOAD_DIR}"
-        command = command.split()
-
-        self.process = subprocess.Popen(
-            command,
-            stdout=sys.stdout,
-            stderr=sys.stderr,
-            creationflags=subprocess.CREATE_NO_WINDOW,
-        )
-
-    def __del__(self):
-        AppLogger().info("尝试结束 aria2 子进程")
-        if self.process.poll() is None:  # 检查子进程是否还在运行
-            self.process.terminate()
+    def setPort(self, port: int):
+        """设置aria2的RPC端口（aria2重启到新的端口上时使用）"""
+        self.port = port
+        self.rpcUrl = f"http://127.0.0.1:{port}/jsonrpc"
+        # aria2在同一端口上提供WebSocket RPC，用于接收通知
+        self.wsUrl = f"ws://127.0.0.1:{port}/jsonrpc"
 
     def _request(self, method: str, *params: Any):
         """使用给定的params请求给定的method，可能会抛出`requests.exceptions.ConnectionError`"""
@@ -62,15 +56,68 @@ class Aria2Client:
         }
         if params:
             payload["params"].extend(params)
-        response = requests.post(self.rpcUrl, headers=self.rpcHeaders, data=json.dumps(payload))
+        return self._post(payload)
+
+    def _post(self, payload: dict) -> dict:
+        """发送构造好的payload并返回响应对象，可能会抛出`requests.exceptions.ConnectionError`"""
+        response = self.session.post(self.rpcUrl, data=json.dumps(payload), timeout=self.rpcTimeout)
         obj: dict = response.json()
         if "error" in obj.keys():
             raise Aria2RpcException(obj["error"]["code"], obj["error"]["message"])
         return obj
 
-    def addUri(self, uris: List[str]) -> str:
-        """添加下载任务，返回一个gid"""
-        gid = self._request("aria2.addUri", uris)["result"]
+    def multicall(self, *calls: Tuple[Any, ...]) -> List[Any]:
+        """通过`system.multicall`在一次请求中调用多个方法
+
+        每个call是一个元组，第一项为方法名，其余项为参数（不需要传入token），例如：
+        ```
+        active, waiting = aria2.multicall(
+            ("aria2.tellActive",),
+            ("aria2.tellWaiting", 0, 100),
+        )
+        ```
+
+        Returns:
+            List[Any]: 与calls一一对应的各方法的result
+
+        Raises:
+            Aria2RpcException: 任意一个方法调用出错时抛出
+        """
+        methods = [
+            {"methodName": method, "params": [f"token:{self.rpcSecret}", *params]}
+            for method, *params in calls
+        ]
+        self.rpcId += 1
+        # system.multicall本身不接收token，token需要放在每个方法的params中
+        payload = {
+            "jsonrpc": "2.0",
+            "id": self.rpcId,
+            "method": "system.multicall",
+            "params": [methods],
+        }
+        results = self._post(payload)["result"]
+        values = []
+        for result in results:
+            # 调用成功时result为只有一个元素的列表，失败时为包含code和message的字典
+            if isinstance(result, dict):
+                raise Aria2RpcException(result["code"], result["message"])
+            values.append(result[0])
+        return values
+
+    def addUri(
+        self, uris: List[str], options: Optional[dict] = None, position: Optional[int] = None
+    ) -> str:
+        """添加下载任务，返回一个gid
+
+        Args:
+            uris (List[str]): 同一个文件的下载地址
+            options (Optional[dict], optional): 该任务的选项，值需要是字符串. Defaults to None.
+            position (Optional[int], optional): 在等待队列中的位置，None表示放在队尾. Defaults to None.
+        """
+        params: List[Any] = [uris, options or {}]
+        if position is not None:
+            params.append(position)
+        gid = self._request("aria2.addUri", *params)["result"]
         # self.gidList.append(gid)
         return gid
 
@@ -80,6 +127,10 @@ class Aria2Client:
     def pause(self, gid: str):
         self._request("aria2.pause", gid)
 
+    def forcePause(self, gid: str):
+        """暂停任务，不等待断开连接等收尾操作"""
+        self._request("aria2.forcePause", gid)
+
     def pauseAll(self):
         self._request("aria2.pauseAll")
 
@@ -113,6 +164,97 @@ class Aria2Client:
         else:
             return self._request("aria2.tellStopped", offset, num)
 
+    def iterWaiting(self, keys: Optional[list] = None, pageSize: int = 100) -> Iterator[dict]:
+        """按页懒加载等待中的任务，只有当前页被迭代完后才会请求下一页"""
+        return self._iterPages("aria2.tellWaiting", keys, pageSize, 0, None)
+
+    def iterStopped(self, keys: Optional[list] = None, pageSize: int = 100) -> Iterator[dict]:
+        """按页懒加载已停止的任务，只有当前页被迭代完后才会请求下一页"""
+        return self._iterPages("aria2.tellStopped", keys, pageSize, 0, None)
+
+    def tellAll(
+        self, keys: Optional[list] = None, pageSize: int = 100
+    ) -> Tuple[List[dict], List[dict], List[dict]]:
+        """获取下载中、等待中和已停止的全部任务
+
+        第一页与tellActive一起通过一次system.multicall获取，大多数情况下只需要一次请求；
+        只有队列长度超过pageSize时，才会继续分页请求剩余的部分。
+
+        Returns:
+            Tuple[List[dict], List[dict], List[dict]]: (下载中, 等待中, 已停止)
+        """
+        keyParams = (keys,) if keys else ()
+        active, waitingFirstPage, stoppedFirstPage = self.multicall(
+            ("aria2.tellActive", *keyParams),
+            ("aria2.tellWaiting", 0, pageSize, *keyParams),
+            ("aria2.tellStopped", 0, pageSize, *keyParams),
+        )
+        waiting = list(self._iterPages("aria2.tellWaiting", keys, pageSize, 0, waitingFirstPage))
+        stopped = list(self._iterPages("aria2.tellStopped", keys, pageSize, 0, stoppedFirstPage))
+        return active, waiting, stopped
+
+    def _iterPages(
+        self,
+        method: str,
+        keys: Optional[list],
+        pageSize: int,
+        offset: int,
+        firstPage: Optional[List[dict]],
+    ) -> Iterator[dict]:
+        """从offset开始按页迭代tellWaiting/tellStopped的结果，firstPage不为None时作为已经获取的第一页"""
+        page = firstPage
+        if page is None:
+            page = self._tellPage(method, offset, pageSize, keys)
+        while True:
+            yield from page
+            # 不满一页说明已经是最后一页了
+            if len(page) < pageSize:
+                return
+            offset += pageSize
+            page = self._tellPage(method, offset, pageSize, keys)
+
+    def _tellPage(self, method: str, offset: int, num: int, keys: Optional[list]) -> List[dict]:
+        if keys:
+            return self._request(method, offset, num, keys)["result"]
+        else:
+            return self._request(method, offset, num)["result"]
+
+    def changePosition(self, gid: str, pos: int, how: str) -> int:
+        """调整等待中的任务在队列中的位置，how为POS_SET、POS_CUR或POS_END，返回调整后的位置"""
+        return self._request("aria2.changePosition", gid, pos, how)["result"]
+
+    def changeUri(
+        self,
+        gid: str,
+        fileIndex: int,
+        delUris: List[str],
+        addUris: List[str],
+        position: Optional[int] = None,
+    ) -> List[int]:
+        """先从任务的第fileIndex个文件（从1开始）中删除delUris，再添加addUris
+
+        Args:
+            position (Optional[int], optional): addUris插入的位置，None表示放在最后. Defaults to None.
+
+        Returns:
+            List[int]: [删除的URI数量, 添加的URI数量]
+        """
+        params: List[Any] = [gid, fileIndex, delUris, addUris]
+        if position is not None:
+            params.append(position)
+        return self._request("aria2.changeUri", *params)["result"]
+
+    def changeOption(self, gid: str, options: dict):
+        """动态修改任务的选项，选项的值需要是字符串"""
+        self._request("aria2.changeOption", gid, options)
+
+    def changeGlobalOption(self, options: dict):
+        """动态修改全局选项，选项的值需要是字符串"""
+        self._request("aria2.changeGlobalOption", options)
+
+    def getGlobalOption(self) -> dict:
+        return self._request("aria2.getGlobalOption")["result"]
+
     def getGlobalStat(self):
         return self._request("aria2.getGlobalStat")
 
@@ -127,6 +269,10 @@ class Aria2Client:
     def getVersion(self) -> str:
         return self._request("aria2.getVersion")["result"]["version"]
 
+    def saveSession(self):
+        """将当前的任务保存到--save-session指定的会话文件中"""
+        self._request("aria2.saveSession")
+
     def shutdown(self):
         self._request("aria2.shutdown")
 
@@ -135,9 +281,8 @@ class Aria2Client:
 
 
 if __name__ == "__main__":
-    aria2 = Aria2Client()
-    # aria2.startRpcServer()
-    # time.sleep(1)
+    # 需要先手动启动aria2：aria2c --enable-rpc --rpc-secret secret
+    aria2 = Aria2Client(6800, "secret")
     gid = aria2.addUri(
         ["https://g-3959.modapi.io/v1/games/3959/mods/2804502/files/5245410/download"]
     )
@@ -0,0 +1,99 @@
+import json
+from PySide6.QtCore import QObject, QTimer, QUrl, Signal
+from PySide6.QtWebSockets import QWebSocket
+from PySide6.QtWidgets import QApplication
+
+from common.log import AppLogger
+
+
+class Aria2Notifier(QObject):
+    """Aria2事件通知接收器
+
+    通过aria2的WebSocket RPC接收aria2主动推送的通知，并将其转换为Qt信号，
+    每个信号的参数都是对应下载任务的gid。
+
+    连接断开（例如aria2还没有启动完成）时，会每隔`RECONNECT_INTERVAL`毫秒自动重连，
+    重连成功后会发出`connected`信号，此时应当主动检查一次任务状态，以免遗漏断开期间的通知。
+
+    参考[Aria2非官方中文文档](https://aria2.document.top/zh/aria2c.html#id42)中的“通知”一节
+    """
+
+    RECONNECT_INTERVAL = 1000
+
+    connected = Signal()
+    downloadStart = Signal(str)
+    downloadPause = Signal(str)
+    downloadStop = Signal(str)
+    downloadComplete = Signal(str)
+    downloadError = Signal(str)
+    btDownloadComplete = Signal(str)
+
+    def __init__(self, wsUrl: str, parent: QObject | None = None) -> None:
+        super().__init__(parent)
+        self.wsUrl = wsUrl
+        self.isClosing = False
+        # 通知的方法名到信号的映射
+        self.methodToSignal = {
+            "aria2.onDownloadStart": self.downloadStart,
+            "aria2.onDownloadPause": self.downloadPause,
+            "aria2.onDownloadStop": self.downloadStop,
+            "aria2.onDownloadComplete": self.downloadComplete,
+            "aria2.onDownloadError": self.downloadError,
+            "aria2.onBtDownloadComplete": self.btDownloadComplete,
+        }
+
+        self.socket = QWebSocket(parent=self)
+        self.socket.connected.connect(self._onConnected)
+        self.socket.disconnected.connect(self._onDisconnected)
+        self.socket.textMessageReceived.connect(self._onTextMessageReceived)
+
+        self.reconnectTimer = QTimer(self)
+        self.reconnectTimer.setSingleShot(True)
+        self.reconnectTimer.setInterval(self.RECONNECT_INTERVAL)
+        self.reconnectTimer.timeout.connect(self.open)
+
+    @property
+    def isConnected(self) -> bool:
+        return self.socket.isValid()
+
+    def open(self):
+        self.isClosing = False
+        self.socket.open(QUrl(self.wsUrl))
+
+    def close(self):
+        """关闭连接，且不再自动重连"""
+        self.isClosing = True
+        self.reconnectTimer.stop()
+        self.socket.close()
+
+    def _onConnected(self):
+        AppLogger().info(f"已连接到aria2的WebSocket RPC（{self.wsUrl}）")
+        self.connected.emit()
+
+    def _onDisconnected(self):
+        if self.isClosing:
+            return
+        # 连接失败和连接断开都会触发disconnected，因此这里统一处理重连
+        self.reconnectTimer.start()
+
+    def _onTextMessageReceived(self, message: str):
+        obj: dict = json.loads(message)
+        # 带有id的是RPC调用的响应，不是通知
+        if "id" in obj:
+            return
+        signal = self.methodToSignal.get(obj.get("method", ""))
+        if signal is None:
+            AppLogger().warning(f"未知的aria2通知：{message}")
+            return
+        for event in obj.get("params", []):
+            signal.emit(event["gid"])
+
+
+if __name__ == "__main__":
+    app = QApplication()
+    notifier = Aria2Notifier("ws://127.0.0.1:6800/jsonrpc", app)
+    notifier.downloadStart.connect(lambda gid: print(f"start: {gid}"))
+    notifier.downloadComplete.connect(lambda gid: print(f"complete: {gid}"))
+    notifier.downloadError.connect(lambda gid: print(f"error: {gid}"))
+    notifier.open()
+    app.exec()
@@ -0,0 +1,165 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import List
+from PySide6.QtCore import QObject, QTimer, Signal
+from PySide6.QtWidgets import QApplication
+import requests
+
+import app_config
+from aria2.aria2_client import Aria2Client, Aria2RpcException
+from common.log import AppLogger
+from common.path import getResourcePath
+
+
+class Aria2StartupException(Exception):
+    """aria2启动失败"""
+
+    def __init__(self, details: str) -> None:
+        super().__init__(details)
+
+
+def findFreePort() -> int:
+    """获取一个当前空闲的本地端口"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Aria2Supervisor(QObject):
+    """aria2子进程的监管者
+
+    - 启动aria2时使用空闲的端口，不会与其他程序（或另一个aria2）冲突
+    - `waitUntilReady`会轮询getVersion直到aria2可用，应在RPC线程中执行
+    - 定时检查aria2是否崩溃，崩溃后自动重启，并发出`restarted`信号
+    - 使用`--save-session`和`--input-file`保存和恢复任务，重启（包括App重启）后未完成的任务会继续下载
+
+    aria2会保存任务的gid，因此恢复的任务的gid与之前相同。
+    """
+
+    # 检查aria2是否崩溃的间隔（毫秒）
+    CHECK_INTERVAL = 2000
+    # 自动保存会话的间隔（秒），aria2崩溃时最多丢失这段时间内的任务变化
+    SAVE_SESSION_INTERVAL = 10
+    # 在RESTART_WINDOW秒内最多自动重启MAX_RESTARTS次，超过后不再重启，防止无限重启
+    MAX_RESTARTS = 3
+    RESTART_WINDOW = 60
+
+    restarted = Signal()
+    """aria2崩溃后已重新启动（可能使用了新的端口）"""
+
+    def __init__(self, parent: QObject | None = None) -> None:
+        super().__init__(parent)
+        self.client = Aria2Client(findFreePort())
+        self.process: subprocess.Popen | None = None
+        self.isStopping = False
+        self.restartTimes: List[float] = []
+
+        self.checkTimer = QTimer(self)
+        self.checkTimer.setInterval(self.CHECK_INTERVAL)
+        self.checkTimer.timeout.connect(self._checkProcess)
+
+    def _buildCommand(self) -> List[str]:
+        executablePath = getResourcePath(os.path.join("aria2", "aria2c.exe"))
+        configPath = getResourcePath(os.path.join("aria2", "aria2.conf"))
+        command = [
+            executablePath,
+            "--conf-path",
+            configPath,
+            "--rpc-listen-port",
+            str(self.client.port),
+            "--rpc-secret",
+            self.client.rpcSecret,
+            "--dir",
+            app_config.TEMP_DOWNLOAD_DIR,
+            "--save-session",
+            app_config.ARIA2_SESSION_PATH,
+            "--save-session-interval",
+            str(self.SAVE_SESSION_INTERVAL),
+        ]
+        # 会话文件不存在时aria2会报错退出，因此只有存在时才传入
+        if os.path.exists(app_config.ARIA2_SESSION_PATH):
+            command.extend(["--input-file", app_config.ARIA2_SESSION_PATH])
+        return command
+
+    def start(self):
+        """启动aria2子进程（不等待其可用）"""
+        os.makedirs(os.path.dirname(app_config.ARIA2_SESSION_PATH), exist_ok=True)
+        self.isStopping = False
+        AppLogger().info(f"启动aria2（port={self.client.port}）")
+        self.process = subprocess.Popen(
+            self._buildCommand(),
+            stdout=sys.stdout,
+            stderr=sys.stderr,
+            creationflags=subprocess.CREATE_NO_WINDOW,
+        )
+        self.checkTimer.start()
+
+    def waitUntilReady(self, timeout: float = 10) -> str:
+        """轮询getVersion直到aria2可用，返回aria2的版本号
+
+        这个函数会阻塞，应在RPC线程中执行，这样之后提交到RPC线程的调用都会在aria2可用后才执行。
+
+        Raises:
+            Aria2StartupException: aria2进程退出或超时仍不可用时抛出
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process is None or self.process.poll() is not None:
+                raise Aria2StartupException("aria2进程已退出")
+            try:
+                return self.client.getVersion()
+            except requests.exceptions.RequestException:
+                time.sleep(0.1)
+        raise Aria2StartupException(f"aria2在{timeout}秒内没有启动完成")
+
+    def _checkProcess(self):
+        if self.isStopping or self.process is None or self.process.poll() is None:
+            return
+        AppLogger().warning(f"aria2意外退出（returncode={self.process.returncode}）")
+        now = time.monotonic()
+        self.restartTimes = [t for t in self.restartTimes if now - t < self.RESTART_WINDOW]
+        if len(self.restartTimes) >= self.MAX_RESTARTS:
+            AppLogger().error(f"aria2在{self.RESTART_WINDOW}秒内重启次数过多，不再自动重启")
+            self.checkTimer.stop()
+            return
+        self.restartTimes.append(now)
+        # 原来的端口可能已经被占用了（这也可能正是aria2退出的原因），因此换一个端口
+        self.client.setPort(findFreePort())
+        self.start()
+        self.restarted.emit()
+
+    def stop(self, timeout: float = 1):
+        """保存会话并关闭aria2
+
+        会阻塞最多约3倍timeout秒，一般在App关闭时调用。
+        """
+        self.isStopping = True
+        self.checkTimer.stop()
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.client.rpcTimeout = timeout
+        try:
+            self.client.saveSession()
+            self.client.forceShutdown()
+        except (requests.exceptions.RequestException, Aria2RpcException) as e:
+            AppLogger().warning(f"保存aria2会话时发生错误：{e}")
+            self.process.terminate()
+        try:
+            # 等待aria2的进程结束（否则打包后清理临时资源时会出错（应该是因为aria2c.exe占用））
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+if __name__ == "__main__":
+    app = QApplication()
+    supervisor = Aria2Supervisor(app)
+    supervisor.start()
+    print(supervisor.waitUntilReady())
+    # 手动结束aria2进程后，应该会自动重启
+    supervisor.restarted.connect(lambda: print(f"restarted on {supervisor.client.port}"))
+    app.exec()
+    supervisor.stop()
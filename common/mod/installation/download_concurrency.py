@@ -0,0 +1,205 @@
+from statistics import mean
+from typing import Dict, List, NamedTuple
+from PySide6.QtCore import QObject, QTimer
+
+from aria2.aria2_async_client import Aria2AsyncClient
+from common.log import AppLogger
+from common.utils import byteLengthToHumanReadable
+
+
+class ConcurrencyLevel(NamedTuple):
+    """下载并发等级"""
+
+    maxConcurrentDownloads: int
+    """同时下载的任务数量"""
+    split: int
+    """每个任务的分段数量"""
+    maxConnectionPerServer: int
+    """每个任务与每个服务器的最大连接数"""
+
+    def toTaskOptions(self) -> dict:
+        """可以通过changeOption修改的单个任务的选项"""
+        return {
+            "split": str(self.split),
+            "max-connection-per-server": str(self.maxConnectionPerServer),
+        }
+
+    def toGlobalOptions(self) -> dict:
+        return {
+            "max-concurrent-downloads": str(self.maxConcurrentDownloads),
+            **self.toTaskOptions(),
+        }
+
+
+# 从低到高排列的并发等级，控制器只会在相邻的等级之间调整
+CONCURRENCY_LEVELS = [
+    ConcurrencyLevel(1, 4, 2),
+    ConcurrencyLevel(2, 8, 4),
+    ConcurrencyLevel(3, 10, 5),
+    ConcurrencyLevel(4, 12, 8),
+    ConcurrencyLevel(5, 16, 12),
+    ConcurrencyLevel(6, 16, 16),
+]
+# 初始等级，与aria2.conf中的配置一致
+INITIAL_LEVEL_INDEX = 2
+
+
+class DownloadConcurrencyController(QObject):
+    """下载并发控制器
+
+    定时通过getGlobalStat采样总下载速度，使用爬山法在CONCURRENCY_LEVELS中寻找总吞吐量最高的等级：
+
+    1. 每个等级采样SAMPLES_PER_TRIAL次，取平均值作为该等级的吞吐量
+    2. 从已测量的等级中选出最好的（提升不足MIN_IMPROVEMENT时倾向于更低的等级，以减少连接数）
+    3. 尝试最好的等级旁边还没有测量过的等级，都测量过了则收敛到最好的等级
+    4. 收敛后如果吞吐量大幅下降，或者经过了REEXPLORE_TRIALS轮，则重新探索
+
+    等级通过changeGlobalOption修改（影响之后开始的任务），等待中的任务通过changeOption修改。
+    没有下载中的任务时停止采样（不再请求aria2），有任务开始下载时（onDownloadStart）重新开始。
+    """
+
+    # 采样间隔（毫秒）
+    SAMPLE_INTERVAL = 3000
+    # 每个等级的采样次数
+    SAMPLES_PER_TRIAL = 4
+    # 吞吐量至少提升这个比例，才认为更高的等级更好
+    MIN_IMPROVEMENT = 0.05
+    # 收敛后吞吐量下降超过这个比例时重新探索（例如网络环境变了）
+    REEXPLORE_DROP = 0.3
+    # 收敛后经过这么多轮评估，重新探索一次
+    REEXPLORE_TRIALS = 10
+
+    def __init__(self, rpc: Aria2AsyncClient, parent: QObject | None = None) -> None:
+        super().__init__(parent)
+        self.rpc = rpc
+        self.levelIndex = INITIAL_LEVEL_INDEX
+        self.direction = 1
+        self.samples: List[int] = []
+        # 等级索引到测得的吞吐量（字节/秒）
+        self.throughputByLevel: Dict[int, float] = {}
+        self.isConverged = False
+        self.convergedThroughput = 0.0
+        self.trialsSinceConverged = 0
+        self.isStarted = False
+        # 收到的任务开始事件的数量，用于判断“没有下载中的任务”的采样结果是否已经过时
+        self.downloadStartCount = 0
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(self.SAMPLE_INTERVAL)
+        self.timer.timeout.connect(self._sample)
+
+    @property
+    def level(self) -> ConcurrencyLevel:
+        return CONCURRENCY_LEVELS[self.levelIndex]
+
+    def start(self):
+        """开始采样，并将当前等级应用到aria2（aria2重启后需要重新调用）"""
+        self.isStarted = True
+        self._applyLevel(self.levelIndex)
+        self.timer.start()
+
+    def stop(self):
+        self.isStarted = False
+        self.timer.stop()
+
+    def onDownloadStart(self, gid: str):
+        """有任务开始下载时调用，采样已经因为空闲而停止时重新开始"""
+        self.downloadStartCount += 1
+        if self.isStarted and not self.timer.isActive():
+            self.timer.start()
+
+    def _sample(self):
+        startCount = self.downloadStartCount
+        (
+            self.rpc.getGlobalStat()
+            .then(lambda response: self._onGlobalStat(response["result"], startCount))
+            .catch(lambda error: AppLogger().warning(f"获取aria2全局状态时发生错误：{error}"))
+            .done()
+        )
+
+    def _onGlobalStat(self, stat: dict, startCount: int):
+        if int(stat["numActive"]) == 0:
+            # 没有下载中的任务，之前的采样也作废
+            self.samples.clear()
+            # 请求发出后又有任务开始时，这个结果已经过时，继续采样
+            if startCount == self.downloadStartCount:
+                self.timer.stop()
+            return
+        self.samples.append(int(stat["downloadSpeed"]))
+        if len(self.samples) < self.SAMPLES_PER_TRIAL:
+            return
+        throughput = mean(self.samples)
+        self.samples.clear()
+        self._evaluate(throughput)
+
+    def _bestLevelIndex(self) -> int:
+        """已测量的等级中吞吐量最高的，提升不足MIN_IMPROVEMENT时取更低的等级"""
+        bestIndex = min(self.throughputByLevel)
+        for index in sorted(self.throughputByLevel):
+            if self.throughputByLevel[index] > self.throughputByLevel[bestIndex] * (
+                1 + self.MIN_IMPROVEMENT
+            ):
+                bestIndex = index
+        return bestIndex
+
+    def _evaluate(self, throughput: float):
+        if self.isConverged:
+            self.trialsSinceConverged += 1
+            isDropped = throughput < self.convergedThroughput * (1 - self.REEXPLORE_DROP)
+            if not isDropped and self.trialsSinceConverged < self.REEXPLORE_TRIALS:
+                return
+            AppLogger().info(
+                f"下载并发控制：吞吐量{formatSpeed(throughput)}"
+                f"（收敛时{formatSpeed(self.convergedThroughput)}），重新探索"
+            )
+            self.isConverged = False
+            self.throughputByLevel.clear()
+
+        self.throughputByLevel[self.levelIndex] = throughput
+        bestIndex = self._bestLevelIndex()
+        # 优先沿着当前方向继续尝试，其次尝试相反方向
+        for candidate in (bestIndex + self.direction, bestIndex - self.direction):
+            if 0 <= candidate < len(CONCURRENCY_LEVELS) and candidate not in self.throughputByLevel:
+                self.direction = candidate - bestIndex
+                AppLogger().info(
+                    f"下载并发控制：{self.level}的吞吐量为{formatSpeed(throughput)}，"
+                    f"尝试{CONCURRENCY_LEVELS[candidate]}"
+                )
+                self._applyLevel(candidate)
+                return
+
+        self.isConverged = True
+        self.trialsSinceConverged = 0
+        self.convergedThroughput = self.throughputByLevel[bestIndex]
+        AppLogger().info(
+            f"下载并发控制：收敛到{CONCURRENCY_LEVELS[bestIndex]}，"
+            f"吞吐量{formatSpeed(self.convergedThroughput)}，"
+            f"各等级的吞吐量：{ {i: formatSpeed(t) for i, t in self.throughputByLevel.items()} }"
+        )
+        if bestIndex != self.levelIndex:
+            self._applyLevel(bestIndex)
+
+    def _applyLevel(self, index: int):
+        self.levelIndex = index
+        level = CONCURRENCY_LEVELS[index]
+        client = self.rpc.client
+
+        def changeOptions():
+            client.changeGlobalOption(level.toGlobalOptions())
+            # 全局选项只影响之后添加的任务，因此还要修改已经在等待中的任务
+            waitingGids = [task["gid"] for task in client.iterWaiting(["gid"])]
+            if waitingGids:
+                client.multicall(
+                    *[("aria2.changeOption", gid, level.toTaskOptions()) for gid in waitingGids]
+                )
+
+        (
+            self.rpc.call(changeOptions)
+            .catch(lambda error: AppLogger().warning(f"修改aria2并发选项时发生错误：{error}"))
+            .done()
+        )
+
+
+def formatSpeed(bytesPerSecond: float) -> str:
+    num, unit = byteLengthToHumanReadable(int(bytesPerSecond))
+    return f"{num} {unit}/s"
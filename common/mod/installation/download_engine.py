@@ -0,0 +1,152 @@
+import os
+import sys
+from PySide6.QtCore import QObject, Signal
+
+import app_config
+from aria2.aria2_client import Aria2Client
+from aria2.aria2_notifier import Aria2Notifier
+from aria2.aria2_supervisor import Aria2Supervisor
+from common.log import AppLogger
+from common.path import getResourcePath
+from common.tricks import interfaceMethod
+from http_downloader.http_downloader import HttpDownloader
+
+
+class DownloadEngine(QObject):
+    """下载引擎接口类
+
+    下载引擎负责真正的下载工作，ModDownloadManager通过它得到：
+    - `client`：与Aria2Client接口兼容的客户端，所有调用都通过Aria2AsyncClient在RPC线程中执行
+    - 任务事件信号：参数都是对应下载任务的gid，与Aria2Notifier的信号一致
+
+    使用流程：start -> 在RPC线程中waitUntilReady -> 回到主线程onReady -> ... -> stop。
+    引擎发出`restarted`信号后，需要重新执行waitUntilReady和onReady。
+    """
+
+    connected = Signal()
+    """事件通道已（重新）连接，之前的事件可能有遗漏，应当主动刷新一次"""
+    restarted = Signal()
+    """引擎崩溃后已重新启动"""
+    downloadStart = Signal(str)
+    downloadPause = Signal(str)
+    downloadStop = Signal(str)
+    downloadComplete = Signal(str)
+    downloadError = Signal(str)
+
+    def __init__(self, client: Aria2Client | HttpDownloader, parent: QObject | None = None):
+        super().__init__(parent)
+        self.client = client
+
+    @property
+    def name(self) -> str:
+        return type(self).__name__
+
+    @interfaceMethod
+    def start(self) -> None:
+        """启动引擎（不等待其可用）"""
+        pass
+
+    @interfaceMethod
+    def waitUntilReady(self) -> str:
+        """阻塞直到引擎可用，返回引擎的版本号，应在RPC线程中执行"""
+        pass
+
+    @interfaceMethod
+    def onReady(self) -> None:
+        """引擎可用后在主线程中调用"""
+        pass
+
+    @interfaceMethod
+    def stop(self) -> None:
+        """保存未完成的任务并关闭引擎，在App关闭时调用"""
+        pass
+
+
+class Aria2DownloadEngine(DownloadEngine):
+    """使用aria2c.exe下载，由Aria2Supervisor管理进程，通过Aria2Notifier接收事件"""
+
+    def __init__(self, parent: QObject | None = None):
+        self.supervisor = Aria2Supervisor()
+        super().__init__(self.supervisor.client, parent)
+        self.supervisor.setParent(self)
+        self.supervisor.restarted.connect(self._onAria2Restarted)
+        self.notifier = Aria2Notifier(self.supervisor.client.wsUrl, self)
+        self.notifier.connected.connect(self.connected)
+        self.notifier.downloadStart.connect(self.downloadStart)
+        self.notifier.downloadPause.connect(self.downloadPause)
+        self.notifier.downloadStop.connect(self.downloadStop)
+        self.notifier.downloadComplete.connect(self.downloadComplete)
+        self.notifier.downloadError.connect(self.downloadError)
+
+    def start(self):
+        self.supervisor.start()
+
+    def waitUntilReady(self) -> str:
+        return self.supervisor.waitUntilReady()
+
+    def onReady(self):
+        # aria2重启后可能换了端口
+        self.notifier.wsUrl = self.supervisor.client.wsUrl
+        self.notifier.open()
+
+    def _onAria2Restarted(self):
+        self.notifier.close()
+        self.restarted.emit()
+
+    def stop(self):
+        self.notifier.close()
+        self.supervisor.stop()
+
+
+class HttpDownloadEngine(DownloadEngine):
+    """使用内置的纯Python分段下载器HttpDownloader，不依赖aria2c.exe"""
+
+    # HttpDownloader在下载线程中回调，通过这个信号回到主线程
+    _event = Signal(str, str)
+
+    def __init__(self, parent: QObject | None = None):
+        super().__init__(
+            HttpDownloader(
+                app_config.TEMP_DOWNLOAD_DIR,
+                app_config.HTTP_DOWNLOADER_SESSION_PATH,
+                lambda method, gid: self._event.emit(method, gid),
+            ),
+            parent,
+        )
+        self.methodToSignal = {
+            "aria2.onDownloadStart": self.downloadStart,
+            "aria2.onDownloadPause": self.downloadPause,
+            "aria2.onDownloadStop": self.downloadStop,
+            "aria2.onDownloadComplete": self.downloadComplete,
+            "aria2.onDownloadError": self.downloadError,
+        }
+        self._event.connect(lambda method, gid: self.methodToSignal[method].emit(gid))
+
+    def start(self):
+        pass
+
+    def waitUntilReady(self) -> str:
+        # 恢复会话中的任务需要读文件，因此也放在RPC线程中
+        self.client.start()
+        return f"HttpDownloader {self.client.getVersion()}"
+
+    def onReady(self):
+        pass
+
+    def stop(self):
+        self.client.saveSession()
+        self.client.shutdown()
+
+
+def isAria2Available() -> bool:
+    return sys.platform == "win32" and os.path.exists(
+        getResourcePath(os.path.join("aria2", "aria2c.exe"))
+    )
+
+
+def createDownloadEngine(parent: QObject | None = None) -> DownloadEngine:
+    """优先使用aria2，aria2不可用或指定了`--builtin-downloader`时使用内置的HTTP下载器"""
+    if app_config.FORCE_BUILTIN_DOWNLOADER or not isAria2Available():
+        AppLogger().info("使用内置的HTTP下载器")
+        return HttpDownloadEngine(parent)
+    return Aria2DownloadEngine(parent)
@@ -1,7 +1,10 @@
+from typing import List, NamedTuple
 from common.mod.installation.extra_info import ModInstallationInfo
 
 
 class ModDownloadTaskInfo:
+    # 请求aria2时只获取这些键，避免每次都传输bitfield等用不到的大字段
+    # （aria2无法只获取files中的部分字段，因此files中的uris仍然会被传输）
     ARIA2_RPC_KEYS = [
         "gid",
         "status",
@@ -45,6 +48,18 @@ class ModDownloadTaskInfo:
     def fileRelativePath(self):
         return str(self._data["files"][0]["path"])
 
+    @property
+    def uris(self) -> List[str]:
+        """下载地址，按aria2中的顺序"""
+        return [str(uri["uri"]) for uri in self._data["files"][0]["uris"]]
+
+    @property
+    def usedUris(self) -> List[str]:
+        """正在使用（或已经用过）的下载地址"""
+        return [
+            str(uri["uri"]) for uri in self._data["files"][0]["uris"] if uri["status"] == "used"
+        ]
+
     @property
     def errorCode(self):
         return str(self._data.get("errorCode", None))
@@ -52,3 +67,14 @@ class ModDownloadTaskInfo:
     @property
     def errorMessage(self):
         return str(self._data.get("errorMessage", None))
+
+
+class ModDownloadTasksSnapshot(NamedTuple):
+    """某一时刻aria2中所有下载任务的快照，通过一次请求获取"""
+
+    active: List[ModDownloadTaskInfo]
+    """下载中的任务"""
+    waiting: List[ModDownloadTaskInfo]
+    """等待中的任务"""
+    stopped: List[ModDownloadTaskInfo]
+    """已停止（完成、出错或被删除）的任务"""
@@ -0,0 +1,204 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import subprocess
+import sys
+from typing import Callable, List
+from PySide6.QtCore import QObject, QTimer, Signal
+
+import app_config
+from aria2.aria2_async_client import Aria2AsyncClient
+from common.log import AppLogger
+from common.qrequest import QFuturePromise
+
+# 游戏进程的名称，用于判断游戏是否正在运行
+GAME_PROCESS_NAME = "Pavlov-Win64-Shipping.exe"
+
+
+def isGameRunning() -> bool:
+    """判断游戏是否正在运行（会阻塞约100毫秒，不要在主线程中调用）
+
+    游戏只有Windows版本，其他系统上总是返回False。
+    """
+    # tasklist和CREATE_NO_WINDOW只在Windows上存在
+    if sys.platform != "win32":
+        return False
+    try:
+        output = subprocess.run(
+            ["tasklist", "/FI", f"IMAGENAME eq {GAME_PROCESS_NAME}", "/NH"],
+            capture_output=True,
+            text=True,
+            creationflags=subprocess.CREATE_NO_WINDOW,
+        ).stdout
+    except OSError:
+        return False
+    return GAME_PROCESS_NAME.lower() in output.lower()
+
+
+class DownloadScheduler(QObject):
+    """下载调度器，负责下载任务的优先级和带宽
+
+    - 优先任务（用户单独点击安装的Mod）插入到等待队列的最前面，排在批量安装的任务之前
+    - 用户可以设置总下载速度上限（max-overall-download-limit）
+    - 开启低影响模式后，检测到游戏正在运行时会降低总下载速度，
+      并通过max-download-limit限制每个非优先任务的速度，尽量不影响游戏体验
+
+    设置保存在`app_config.DOWNLOAD_SCHEDULE_PATH`中。
+    """
+
+    # 检测游戏是否在运行的间隔（毫秒）
+    GAME_CHECK_INTERVAL = 10_000
+    # 低影响模式下的总下载速度上限（字节/秒）
+    LOW_IMPACT_OVERALL_LIMIT = 2 * 1024 * 1024
+    # 低影响模式下每个非优先任务的下载速度上限（字节/秒）
+    LOW_IMPACT_TASK_LIMIT = 512 * 1024
+
+    lowImpactChanged = Signal(bool)
+    """低影响模式是否生效发生变化"""
+
+    def __init__(
+        self,
+        rpc: Aria2AsyncClient,
+        getNormalGids: Callable[[], List[str]],
+        parent: QObject | None = None,
+    ) -> None:
+        """构造函数
+
+        Args:
+            rpc (Aria2AsyncClient): aria2异步客户端
+            getNormalGids (Callable[[], List[str]]): 返回当前所有非优先任务的gid
+            parent (QObject | None, optional): parent. Defaults to None.
+        """
+        super().__init__(parent)
+        self.rpc = rpc
+        self.getNormalGids = getNormalGids
+        self.bandwidthLimit = 0
+        """用户设置的总下载速度上限（字节/秒），0表示不限速"""
+        self.isLowImpactModeEnabled = True
+        self.isLowImpactActive = False
+        """低影响模式是否正在生效（开启了低影响模式且游戏正在运行）"""
+        self._loadSettings()
+
+        self.gameCheckExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="GameCheck")
+        self.gameCheckTimer = QTimer(self)
+        self.gameCheckTimer.setInterval(self.GAME_CHECK_INTERVAL)
+        self.gameCheckTimer.timeout.connect(self._checkGame)
+
+    def _loadSettings(self):
+        if not os.path.exists(app_config.DOWNLOAD_SCHEDULE_PATH):
+            return
+        try:
+            with open(app_config.DOWNLOAD_SCHEDULE_PATH, "r", encoding="utf-8") as f:
+                obj: dict = json.load(f)
+            self.bandwidthLimit = int(obj.get("bandwidthLimit", 0))
+            self.isLowImpactModeEnabled = bool(obj.get("isLowImpactModeEnabled", True))
+        except (OSError, ValueError) as e:
+            AppLogger().warning(f"读取下载调度设置时发生错误：{e}")
+
+    def _saveSettings(self):
+        os.makedirs(os.path.dirname(app_config.DOWNLOAD_SCHEDULE_PATH), exist_ok=True)
+        with open(app_config.DOWNLOAD_SCHEDULE_PATH, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "bandwidthLimit": self.bandwidthLimit,
+                    "isLowImpactModeEnabled": self.isLowImpactModeEnabled,
+                },
+                f,
+            )
+
+    def start(self):
+        """应用限速设置并开始检测游戏（aria2重启后需要重新调用）"""
+        self._applyLimits()
+        if self.isLowImpactModeEnabled:
+            self.gameCheckTimer.start()
+            self._checkGame()
+
+    def stop(self):
+        self.gameCheckTimer.stop()
+        self.gameCheckExecutor.shutdown(wait=False, cancel_futures=True)
+
+    def setBandwidthLimit(self, bytesPerSecond: int):
+        """设置总下载速度上限，0表示不限速"""
+        self.bandwidthLimit = max(0, bytesPerSecond)
+        self._saveSettings()
+        AppLogger().info(f"设置总下载速度上限为{self.bandwidthLimit}字节/秒")
+        self._applyLimits()
+
+    def setLowImpactModeEnabled(self, isEnabled: bool):
+        self.isLowImpactModeEnabled = isEnabled
+        self._saveSettings()
+        if isEnabled:
+            self.gameCheckTimer.start()
+            self._checkGame()
+        else:
+            self.gameCheckTimer.stop()
+            self._setLowImpactActive(False)
+
+    def taskOptions(self, isPriority: bool) -> dict:
+        """添加任务时传给addUri的选项"""
+        if self.isLowImpactActive and not isPriority:
+            return {"max-download-limit": str(self.LOW_IMPACT_TASK_LIMIT)}
+        return {}
+
+    @staticmethod
+    def taskPosition(isPriority: bool) -> int | None:
+        """添加任务时在等待队列中的位置，None表示放在队尾"""
+        return 0 if isPriority else None
+
+    def promote(self, gid: str):
+        """将已经在等待队列中的任务移动到最前面"""
+        (
+            self.rpc.call(self.rpc.client.changePosition, gid, 0, "POS_SET")
+            .catch(lambda error: AppLogger().warning(f"调整任务{gid}的位置时发生错误：{error}"))
+            .done()
+        )
+
+    def _checkGame(self):
+        (
+            QFuturePromise(self, self.gameCheckExecutor, isGameRunning)
+            .then(
+                lambda isRunning: self._setLowImpactActive(
+                    self.isLowImpactModeEnabled and isRunning
+                )
+            )
+            .catch(lambda error: AppLogger().warning(f"检测游戏是否运行时发生错误：{error}"))
+            .done()
+        )
+
+    def _setLowImpactActive(self, isActive: bool):
+        if isActive == self.isLowImpactActive:
+            return
+        self.isLowImpactActive = isActive
+        AppLogger().info("游戏正在运行，进入低影响模式" if isActive else "退出低影响模式")
+        self._applyLimits()
+        self.lowImpactChanged.emit(isActive)
+
+    def _overallLimit(self) -> int:
+        if not self.isLowImpactActive:
+            return self.bandwidthLimit
+        if self.bandwidthLimit == 0:
+            return self.LOW_IMPACT_OVERALL_LIMIT
+        return min(self.bandwidthLimit, self.LOW_IMPACT_OVERALL_LIMIT)
+
+    def _applyLimits(self):
+        client = self.rpc.client
+        overallLimit = str(self._overallLimit())
+        taskLimit = str(self.LOW_IMPACT_TASK_LIMIT if self.isLowImpactActive else 0)
+        normalGids = self.getNormalGids()
+
+        def changeOptions():
+            client.changeGlobalOption({"max-overall-download-limit": overallLimit})
+            # max-download-limit可以在下载中修改，不会导致任务重新开始
+            if normalGids:
+                client.multicall(
+                    *[
+                        ("aria2.changeOption", gid, {"max-download-limit": taskLimit})
+                        for gid in normalGids
+                    ]
+                )
+
+        (
+            self.rpc.call(changeOptions)
+            .catch(lambda error: AppLogger().warning(f"修改aria2限速选项时发生错误：{error}"))
+            .done()
+        )
@@ -0,0 +1,35 @@
+import json
+import os
+from typing import Dict
+
+import app_config
+from common.log import AppLogger
+from common.mod.installation.extra_info import ModInstallationInfo
+
+
+def loadDownloadTasks() -> Dict[str, ModInstallationInfo]:
+    """读取上次保存的gid到ModInstallationInfo的映射，文件不存在或损坏时返回空字典"""
+    if not os.path.exists(app_config.DOWNLOAD_TASKS_PATH):
+        return {}
+    try:
+        with open(app_config.DOWNLOAD_TASKS_PATH, "r", encoding="utf-8") as f:
+            obj: dict = json.load(f)
+        return {gid: ModInstallationInfo.fromJsonObj(info) for gid, info in obj.items()}
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        AppLogger().warning(f"读取下载任务信息时发生错误：{e}")
+        return {}
+
+
+def saveDownloadTasks(gidToInfo: Dict[str, ModInstallationInfo]):
+    """保存gid到ModInstallationInfo的映射
+
+    先写入临时文件再替换，防止写入过程中App退出导致文件损坏。
+    """
+    os.makedirs(os.path.dirname(app_config.DOWNLOAD_TASKS_PATH), exist_ok=True)
+    tempPath = app_config.DOWNLOAD_TASKS_PATH + ".tmp"
+    try:
+        with open(tempPath, "w", encoding="utf-8") as f:
+            json.dump({gid: info.toJsonObj() for gid, info in gidToInfo.items()}, f)
+        os.replace(tempPath, app_config.DOWNLOAD_TASKS_PATH)
+    except OSError as e:
+        AppLogger().warning(f"保存下载任务信息时发生错误：{e}")
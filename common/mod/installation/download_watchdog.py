@@ -0,0 +1,234 @@
+from collections import deque
+from datetime import datetime
+import time
+from typing import Callable, Deque, Dict, List, NamedTuple, Set
+from PySide6.QtCore import QObject, QTimer, Signal
+
+from aria2.aria2_async_client import Aria2AsyncClient
+from common.log import AppLogger
+from common.mod.installation.download_concurrency import formatSpeed
+from common.mod.installation.download_info import ModDownloadTaskInfo, ModDownloadTasksSnapshot
+from common.mod.mirror_scoreboard import MirrorScoreboard, getHost
+
+
+class DownloadIntervention(NamedTuple):
+    """看门狗对一个下载任务的一次干预"""
+
+    time: str
+    gid: str
+    modName: str
+    action: str
+    """`changeUri`（把慢的下载地址移到最后并重新连接）、`restart`（暂停后继续）或`giveUp`（不再干预）"""
+    speed: int
+    """干预时的下载速度（字节/秒）"""
+    detail: str
+
+
+class _StallState:
+    def __init__(self) -> None:
+        self.lowSpeedSince: float | None = None
+        self.lastInterventionTime = 0.0
+        self.interventionCount = 0
+        self.hasGivenUp = False
+
+
+class DownloadWatchdog(QObject):
+    """下载停滞看门狗
+
+    检查每次刷新得到的任务快照，某个下载中的任务的速度在STALL_WINDOW秒内一直低于STALL_SPEED时，
+    认为它停滞了（例如某个镜像站变慢了），并进行干预：
+
+    - 任务有多个下载地址时，通过changeUri把正在使用的地址移到最后，再暂停并继续任务，
+      让aria2断开慢的连接，使用其他地址重新连接；同时在MirrorScoreboard中记一次该主机的失败
+    - 只有一个下载地址，或者已经换过地址时，只暂停并继续任务（重新建立连接往往就能恢复速度）
+    - 干预MAX_INTERVENTIONS次后仍然停滞，则不再干预（记录一次`giveUp`）
+
+    暂停和继续不在RPC线程中等待：只发送forcePause，收到该任务的暂停事件（onDownloadPause）后再继续，
+    PAUSE_TIMEOUT秒内没有收到事件时查询一次状态，因此不会阻塞其他RPC调用。
+
+    每次干预都会记录在`interventions`中（同时写入日志），并发出`intervened`信号。
+
+    有下载中的任务时，会每隔CHECK_INTERVAL毫秒请求刷新一次快照，因此即使界面没有在轮询也能发现停滞。
+    """
+
+    # 低于这个速度（字节/秒）认为下载缓慢
+    STALL_SPEED = 32 * 1024
+    # 速度持续低于STALL_SPEED这么多秒，认为下载停滞
+    STALL_WINDOW = 30
+    # 请求刷新快照的间隔（毫秒）
+    CHECK_INTERVAL = 5000
+    # 对同一个任务最多干预的次数
+    MAX_INTERVENTIONS = 3
+    # 暂停后等待暂停事件的最长时间（秒），超时后查询一次任务状态
+    PAUSE_TIMEOUT = 5
+    # 最多保留的干预记录数量
+    MAX_RECORDS = 200
+
+    intervened = Signal(str)
+    """对某个任务进行了干预，参数为gid"""
+
+    def __init__(
+        self,
+        rpc: Aria2AsyncClient,
+        requestRefresh: Callable[[], None],
+        parent: QObject | None = None,
+    ) -> None:
+        """构造函数
+
+        Args:
+            rpc (Aria2AsyncClient): aria2异步客户端
+            requestRefresh (Callable[[], None]): 请求刷新任务快照，刷新完成后应调用onSnapshotUpdated
+            parent (QObject | None, optional): parent. Defaults to None.
+        """
+        super().__init__(parent)
+        self.rpc = rpc
+        self.requestRefresh = requestRefresh
+        self.states: Dict[str, _StallState] = {}
+        self.interventions: Deque[DownloadIntervention] = deque(maxlen=self.MAX_RECORDS)
+        # 被看门狗暂停、等待继续的任务
+        self.pausingGids: Set[str] = set()
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(self.CHECK_INTERVAL)
+        self.timer.timeout.connect(self.requestRefresh)
+
+    def stop(self):
+        self.timer.stop()
+
+    def interventionCount(self, gid: str) -> int:
+        state = self.states.get(gid)
+        return state.interventionCount if state else 0
+
+    def onSnapshotUpdated(self, snapshot: ModDownloadTasksSnapshot):
+        now = time.monotonic()
+        activeGids = {task.gid for task in snapshot.active}
+        # 已经结束的任务不需要再跟踪；等待中的任务（包括被看门狗暂停的任务）保留干预次数
+        unfinishedGids = activeGids | {task.gid for task in snapshot.waiting}
+        for gid in [gid for gid in self.states if gid not in unfinishedGids]:
+            self.states.pop(gid)
+        for gid in unfinishedGids - activeGids:
+            if gid in self.states:
+                self.states[gid].lowSpeedSince = None
+        for task in snapshot.active:
+            self._check(task, now)
+        # 只有存在下载中的任务时才需要定时刷新
+        if activeGids and not self.timer.isActive():
+            self.timer.start()
+        elif not activeGids and self.timer.isActive():
+            self.timer.stop()
+
+    def _check(self, task: ModDownloadTaskInfo, now: float):
+        state = self.states.setdefault(task.gid, _StallState())
+        if task.downloadSpeed >= self.STALL_SPEED:
+            state.lowSpeedSince = None
+            return
+        if state.lowSpeedSince is None:
+            state.lowSpeedSince = now
+            return
+        if now - state.lowSpeedSince < self.STALL_WINDOW:
+            return
+        if now - state.lastInterventionTime < self.STALL_WINDOW:
+            # 给上一次干预留出生效的时间
+            return
+        if state.interventionCount >= self.MAX_INTERVENTIONS:
+            if not state.hasGivenUp:
+                state.hasGivenUp = True
+                self._record(task, "giveUp", f"已干预{self.MAX_INTERVENTIONS}次仍然停滞")
+            return
+        state.interventionCount += 1
+        state.lastInterventionTime = now
+        state.lowSpeedSince = now
+        uris = list(dict.fromkeys(task.uris))
+        usedUris = list(dict.fromkeys(task.usedUris))
+        # 第一次（以及之后隔一次）尝试换地址，其余时候只重新连接
+        if (
+            len(uris) > 1
+            and usedUris
+            and len(usedUris) < len(uris)
+            and state.interventionCount % 2 == 1
+        ):
+            self._changeUri(task, usedUris)
+        else:
+            self._restart(task)
+
+    def _changeUri(self, task: ModDownloadTaskInfo, slowUris: List[str]):
+        scoreboard = MirrorScoreboard.getInstance()
+        for uri in slowUris:
+            scoreboard.record(getHost(uri), None)
+        scoreboard.save()
+        self._record(task, "changeUri", f"把{[getHost(uri) for uri in slowUris]}移到最后")
+        client = self.rpc.client
+        gid = task.gid
+        (
+            # 先删除再添加到最后，aria2重新连接时会优先使用其他地址
+            self.rpc.call(client.changeUri, gid, 1, slowUris, slowUris)
+            .then(lambda _: self._pause(gid))
+            .catch(lambda error: AppLogger().warning(f"更换任务{gid}的下载地址时发生错误：{error}"))
+            .done()
+        )
+
+    def _restart(self, task: ModDownloadTaskInfo):
+        self._record(task, "restart", "暂停后继续，重新建立连接")
+        self._pause(task.gid)
+
+    def _pause(self, gid: str):
+        """暂停任务，收到暂停事件（或超时）后再继续，见onDownloadPause"""
+        self.pausingGids.add(gid)
+        (
+            self.rpc.call(self.rpc.client.forcePause, gid)
+            .catch(lambda error: self._whenPauseError(gid, error))
+            .done()
+        )
+        QTimer.singleShot(self.PAUSE_TIMEOUT * 1000, lambda: self._checkPaused(gid))
+
+    def _checkPaused(self, gid: str):
+        """超时仍没有收到暂停事件时，查询一次状态：已经暂停则继续，还在暂停中则再等待，已经结束则不再处理"""
+        if gid not in self.pausingGids:
+            return
+
+        def afterTellStatus(response: dict):
+            status = response["result"]["status"]
+            if status == "paused":
+                self.onDownloadPause(gid)
+            elif status == "active":
+                QTimer.singleShot(self.PAUSE_TIMEOUT * 1000, lambda: self._checkPaused(gid))
+            else:
+                self.pausingGids.discard(gid)
+
+        (
+            self.rpc.tellStatus(gid, ["status"])
+            .then(afterTellStatus)
+            .catch(lambda error: self._whenPauseError(gid, error))
+            .done()
+        )
+
+    def _whenPauseError(self, gid: str, error: Exception):
+        self.pausingGids.discard(gid)
+        AppLogger().warning(f"暂停任务{gid}时发生错误：{error}")
+
+    def onDownloadPause(self, gid: str):
+        """任务暂停时调用（连接到下载引擎的downloadPause信号），继续被看门狗暂停的任务"""
+        if gid not in self.pausingGids:
+            return
+        self.pausingGids.discard(gid)
+        (
+            self.rpc.call(self.rpc.client.unpause, gid)
+            .catch(lambda error: AppLogger().warning(f"继续任务{gid}时发生错误：{error}"))
+            .done()
+        )
+
+    def _record(self, task: ModDownloadTaskInfo, action: str, detail: str):
+        intervention = DownloadIntervention(
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            task.gid,
+            task.installationInfo.modName.mainName,
+            action,
+            task.downloadSpeed,
+            detail,
+        )
+        self.interventions.append(intervention)
+        AppLogger().warning(
+            f"下载停滞：{intervention.modName}（gid={task.gid}）的速度为{formatSpeed(task.downloadSpeed)}，"
+            f"{action}：{detail}"
+        )
+        self.intervened.emit(task.gid)
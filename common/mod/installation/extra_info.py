@@ -13,3 +13,44 @@ class ModInstallationInfo:
     modData: ModData
     modName: ModName
     mirrorStationNames: List[str]
+    isPriority: bool = False
+    """是否为优先任务（用户单独点击安装的Mod及其依赖），优先任务排在批量安装的任务之前"""
+    md5: str | None = None
+    """已经通过checksum选项交给下载器的MD5，下载完成即说明校验通过，导入时不需要再校验；
+    为None时（例如下载完成前没来得及获取MD5）导入时需要自己校验"""
+    fileMd5: str | None = None
+    """Mod文件的MD5，来自Mod数据（modfile.filehash.md5），导入时用它校验，不需要再请求Api。
+    不指定时从modData中获取，Mod数据中没有时为None"""
+    fileSize: int | None = None
+    """Mod文件的大小（字节），来自Mod数据（modfile.filesize），不指定时从modData中获取"""
+
+    def __post_init__(self):
+        if self.fileMd5 is None:
+            self.fileMd5 = self.modData.fileMd5
+        if self.fileSize is None:
+            self.fileSize = self.modData.fileSize
+
+    def toJsonObj(self) -> dict:
+        """转换为可以被json序列化的对象"""
+        return {
+            "modData": self.modData.rawData,
+            "modName": list(self.modName),
+            "mirrorStationNames": self.mirrorStationNames,
+            "isPriority": self.isPriority,
+            "md5": self.md5,
+            "fileMd5": self.fileMd5,
+            "fileSize": self.fileSize,
+        }
+
+    @staticmethod
+    def fromJsonObj(obj: dict) -> "ModInstallationInfo":
+        """从toJsonObj的返回值构造ModInstallationInfo"""
+        return ModInstallationInfo(
+            ModData(obj["modData"]),
+            ModName(*obj["modName"]),
+            obj["mirrorStationNames"],
+            obj.get("isPriority", False),
+            obj.get("md5", None),
+            obj.get("fileMd5", None),
+            obj.get("fileSize", None),
+        )
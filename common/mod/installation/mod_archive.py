@@ -0,0 +1,676 @@
+from concurrent.futures import ThreadPoolExecutor
+import errno
+import hashlib
+import os
+import shutil
+import struct
+import sys
+import threading
+import time
+import json
+from typing import BinaryIO, Callable, Dict, List, NamedTuple
+import zipfile
+
+from common.log import AppLogger
+from common.utils import HASH_CHUNK_SIZE, byteLengthToHumanReadable, hashFile
+
+# 压缩包不小于这个大小并且有多个文件时才并行解压
+PARALLEL_EXTRACT_THRESHOLD = 16 * 1024 * 1024
+# 并行解压的最大线程数
+MAX_EXTRACT_WORKERS = 8
+# 解压压缩过的文件时每次读写的大小
+COPY_BUFFER_SIZE = 1024 * 1024
+# 直接复制（copy_file_range/sendfile）时每次复制的最大大小，每复制一次更新一次进度
+ZERO_COPY_CHUNK_SIZE = 16 * 1024 * 1024
+# 压缩包中每个文件的本地文件头的固定部分的大小
+LOCAL_HEADER_SIZE = 30
+# 已安装的Mod目录（UGC<rid>）下，记录Data目录中各文件大小和CRC32的清单文件名
+INSTALLED_MANIFEST_NAME = "pavlov_toolbox_manifest.json"
+
+
+class Md5MismatchException(Exception):
+    def __str__(self) -> str:
+        return "MD5不匹配"
+
+
+class FileSizeMismatchException(Exception):
+    def __init__(self, actualSize: int, expectedSize: int) -> None:
+        super().__init__()
+        self.actualSize = actualSize
+        self.expectedSize = expectedSize
+
+    def __str__(self) -> str:
+        return f"文件大小不匹配（{self.actualSize}/{self.expectedSize}字节）"
+
+
+class ImportCancelledException(Exception):
+    def __str__(self) -> str:
+        return "导入已取消"
+
+
+class ImportProgress:
+    """导入的进度和取消标记
+
+    导入线程（可能有多个）通过advance更新已经处理的字节数，同时检查是否已被取消，被取消时抛出ImportCancelledException，
+    主线程读取completedBytes/totalBytes显示进度，通过cancel请求取消（协作式，导入线程在下一次更新进度时才会停止）。
+
+    替换安装目录中的Mod之前需要调用disableCancellation，之后的取消请求会被拒绝，避免留下写了一半的Mod。
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.completedBytes = 0
+        self.totalBytes = 0
+        self.isCancelled = False
+        self.isCancellable = True
+
+    def addTotal(self, n: int):
+        with self.lock:
+            self.totalBytes += n
+
+    def advance(self, n: int):
+        """增加已经处理的字节数
+
+        Raises:
+            ImportCancelledException: 已被取消
+        """
+        with self.lock:
+            self.completedBytes += n
+        self.checkCancelled()
+
+    def checkCancelled(self):
+        if self.isCancelled:
+            raise ImportCancelledException()
+
+    def cancel(self) -> bool:
+        """请求取消，返回请求是否被接受"""
+        with self.lock:
+            if self.isCancellable:
+                self.isCancelled = True
+            return self.isCancelled
+
+    def disableCancellation(self):
+        """禁止之后的取消请求
+
+        Raises:
+            ImportCancelledException: 在此之前已被取消
+        """
+        with self.lock:
+            self.isCancellable = False
+        self.checkCancelled()
+
+
+class HashingReader:
+    """一边读取一边计算哈希值的文件包装，交给zipfile.ZipFile使用
+
+    zipfile会先读取文件末尾的中央目录，再按需seek到各个文件的位置读取，因此不能简单地把读到的数据都交给hasher。
+    这里记录已经计算到的位置hashedUpTo：
+    - 读取的数据跨过hashedUpTo时，只计算hashedUpTo之后的部分
+    - 读取的位置在hashedUpTo之后时，先把中间跳过的部分（一般只有几十字节的文件头或数据描述符）补上
+    - 读取的位置在hashedUpTo之前时（重复读取），不计算
+
+    构造ZipFile（读取中央目录）之后再调用startHashing，然后按照文件在压缩包中的顺序解压，
+    最后调用finish补上剩余的部分（中央目录）。这样整个压缩包只会被顺序读取一遍，
+    解压和计算哈希使用的是同一份读到的数据。
+    """
+
+    def __init__(self, f: BinaryIO, algorithm: str = "md5") -> None:
+        self.f = f
+        self.hasher = hashlib.new(algorithm)
+        self.hashedUpTo = 0
+        self.isHashing = False
+
+    def startHashing(self):
+        self.isHashing = True
+
+    def _catchUp(self, position: int):
+        """把hashedUpTo到position之间的数据补上，然后回到原来的位置"""
+        current = self.f.tell()
+        self.f.seek(self.hashedUpTo)
+        while self.hashedUpTo < position:
+            chunk = self.f.read(min(HASH_CHUNK_SIZE, position - self.hashedUpTo))
+            if not chunk:
+                break
+            self.hasher.update(chunk)
+            self.hashedUpTo += len(chunk)
+        self.f.seek(current)
+
+    def read(self, n: int = -1) -> bytes:
+        position = self.f.tell()
+        if self.isHashing and position > self.hashedUpTo:
+            self._catchUp(position)
+        data = self.f.read(n)
+        if self.isHashing and position <= self.hashedUpTo < position + len(data):
+            self.hasher.update(memoryview(data)[self.hashedUpTo - position :])
+            self.hashedUpTo = position + len(data)
+        return data
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self.f.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self.f.tell()
+
+    def seekable(self) -> bool:
+        return True
+
+    def finish(self) -> str:
+        """补上剩余的部分，返回哈希值（十六进制字符串）"""
+        self._catchUp(self.f.seek(0, os.SEEK_END))
+        return self.hasher.hexdigest()
+
+
+def _preallocate(fd: int, size: int):
+    """把输出文件预先分配到最终的大小，减少文件碎片和写入时的元数据更新"""
+    if size <= 0:
+        return
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            # 部分文件系统不支持，退回到ftruncate
+            pass
+    os.ftruncate(fd, size)
+
+
+def _adviseSequential(fd: int):
+    """提示系统将顺序读取该文件，系统会加大预读"""
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+
+
+def _isZeroCopyAvailable() -> bool:
+    # macOS的sendfile只能发送到socket，Windows没有这两个函数
+    return hasattr(os, "copy_file_range") or (
+        hasattr(os, "sendfile") and sys.platform.startswith("linux")
+    )
+
+
+def _copyRange(
+    sourceFd: int,
+    offset: int,
+    targetFd: int,
+    size: int,
+    onCopied: Callable[[int], None] | None = None,
+):
+    """在内核中把sourceFd从offset开始的size个字节复制到targetFd的开头，数据不经过Python
+
+    每次最多复制ZERO_COPY_CHUNK_SIZE字节，之后以这次复制的字节数调用onCopied（可以在其中抛出异常来中止）。
+
+    Raises:
+        OSError: 复制失败（包括两个函数都不支持的情况）
+    """
+    copied = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while copied < size:
+                n = os.copy_file_range(
+                    sourceFd,
+                    targetFd,
+                    min(size - copied, ZERO_COPY_CHUNK_SIZE),
+                    offset + copied,
+                    copied,
+                )
+                if n == 0:
+                    break
+                copied += n
+                if onCopied is not None:
+                    onCopied(n)
+        except OSError as e:
+            # 跨文件系统（旧内核）或文件系统不支持时使用sendfile
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+    if copied < size:
+        os.lseek(targetFd, copied, os.SEEK_SET)
+        while copied < size:
+            n = os.sendfile(
+                targetFd, sourceFd, offset + copied, min(size - copied, ZERO_COPY_CHUNK_SIZE)
+            )
+            if n == 0:
+                break
+            copied += n
+            if onCopied is not None:
+                onCopied(n)
+    if copied != size:
+        raise OSError(errno.EIO, f"只复制了{copied}/{size}字节")
+
+
+def _dataOffset(archiveFd: int, info: zipfile.ZipInfo) -> int:
+    """读取本地文件头，得到文件数据在压缩包中的位置
+
+    本地文件头中的文件名和扩展字段的长度可能与中央目录中的不同，因此必须读取本地文件头。
+    """
+    header = os.pread(archiveFd, LOCAL_HEADER_SIZE, info.header_offset)
+    if len(header) != LOCAL_HEADER_SIZE or header[:4] != b"PK\x03\x04":
+        raise zipfile.BadZipFile(f"{info.filename}的本地文件头错误")
+    filenameLength, extraLength = struct.unpack("<2H", header[26:30])
+    return info.header_offset + LOCAL_HEADER_SIZE + filenameLength + extraLength
+
+
+def memberRelativePath(info: zipfile.ZipInfo) -> str:
+    """文件解压后相对于输出目录的路径，使用`/`分隔，用作清单的键"""
+    return "/".join(_memberPathParts(info))
+
+
+def _targetPath(info: zipfile.ZipInfo, outputDir: str) -> str:
+    return os.path.join(outputDir, *_memberPathParts(info))
+
+
+def _memberPathParts(info: zipfile.ZipInfo) -> List[str]:
+    """与zipfile的extract相同的规则，去掉盘符、绝对路径和`..`，防止解压到输出目录之外"""
+    arcname = info.filename.replace("/", os.path.sep)
+    if os.path.altsep:
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    parts = [
+        part
+        for part in arcname.split(os.path.sep)
+        if part not in ("", os.path.curdir, os.path.pardir)
+    ]
+    if os.path.sep == "\\":
+        # Windows的文件名中不能有这些字符，也不能以.结尾
+        parts = [part.translate(str.maketrans(':<>|"?*', "_______")).rstrip(".") for part in parts]
+        parts = [part for part in parts if part]
+    return parts
+
+
+def _extractMember(
+    zipFile: zipfile.ZipFile,
+    info: zipfile.ZipInfo,
+    outputDir: str,
+    archiveFd: int | None,
+    progress: ImportProgress | None = None,
+):
+    """解压一个文件
+
+    - 未压缩（ZIP_STORED）的文件，在archiveFd不为None且系统支持时，通过copy_file_range/sendfile直接从压缩包中复制，
+      数据不经过Python（也就不校验CRC32，压缩包整体的MD5由下载器或导入时校验）
+    - 其他文件使用较大的缓冲区读写
+    - 输出文件都会预先分配到最终的大小
+    - 按照写入的字节数更新progress（不为None时）
+    """
+    path = _targetPath(info, outputDir)
+    if info.is_dir():
+        os.makedirs(path, exist_ok=True)
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    isZeroCopy = (
+        archiveFd is not None
+        and info.compress_type == zipfile.ZIP_STORED
+        # 加密的文件不能直接复制
+        and not info.flag_bits & 0x1
+        and _isZeroCopyAvailable()
+    )
+    with open(path, "wb") as target:
+        _preallocate(target.fileno(), info.file_size)
+        if isZeroCopy:
+            _copyRange(
+                archiveFd,  # type: ignore
+                _dataOffset(archiveFd, info),  # type: ignore
+                target.fileno(),
+                info.file_size,
+                progress.advance if progress is not None else None,
+            )
+            return
+        with zipFile.open(info) as source:
+            if progress is None:
+                shutil.copyfileobj(source, target, COPY_BUFFER_SIZE)
+                return
+            while chunk := source.read(COPY_BUFFER_SIZE):
+                target.write(chunk)
+                progress.advance(len(chunk))
+
+
+def extractMembers(
+    zipFile: zipfile.ZipFile,
+    infos: List[zipfile.ZipInfo],
+    outputDir: str,
+    archiveFd: int | None = None,
+    progress: ImportProgress | None = None,
+):
+    """按照在压缩包中的顺序解压指定的文件，已经存在的文件会被覆盖
+
+    archiveFd为zipFile底层文件的描述符，为None时所有文件都经过zipfile读取（会校验CRC32），详见_extractMember
+    """
+    for info in sorted(infos, key=lambda info: info.header_offset):
+        _extractMember(zipFile, info, outputDir, archiveFd, progress)
+
+
+def writeTaintFile(modDir: str, content: str):
+    with open(os.path.join(modDir, "taint"), "w", encoding="utf-8") as file:
+        file.write(content)
+
+
+class ManifestEntry(NamedTuple):
+    size: int
+    crc: int
+
+
+def buildManifest(infos: List[zipfile.ZipInfo]) -> Dict[str, ManifestEntry]:
+    """根据压缩包中央目录中的大小和CRC32生成清单（不包括目录）"""
+    return {
+        memberRelativePath(info): ManifestEntry(info.file_size, info.CRC)
+        for info in infos
+        if not info.is_dir()
+    }
+
+
+def loadInstalledManifest(modDir: str) -> Dict[str, ManifestEntry] | None:
+    """读取已安装的Mod的清单，没有清单或清单损坏时返回None"""
+    path = os.path.join(modDir, INSTALLED_MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            obj: dict = json.load(f)
+        return {name: ManifestEntry(*entry) for name, entry in obj["files"].items()}
+    except (OSError, ValueError, TypeError, KeyError) as e:
+        AppLogger().warning(f"读取{modDir}的清单时发生错误：{e}")
+        return None
+
+
+def saveInstalledManifest(modDir: str, manifest: Dict[str, ManifestEntry]):
+    with open(os.path.join(modDir, INSTALLED_MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump({"files": manifest}, f)
+
+
+class ManifestDiff(NamedTuple):
+    """新版本的压缩包与已安装的Mod之间的差异"""
+
+    changedInfos: List[zipfile.ZipInfo]
+    """需要写入的文件和所有目录（目录总是在暂存目录中重新创建）"""
+    removedNames: List[str]
+    """新版本中没有的文件"""
+    newManifest: Dict[str, ManifestEntry]
+
+    @property
+    def changedSize(self) -> int:
+        """需要写入的文件在压缩包中的大小"""
+        return sum(info.compress_size for info in self.changedInfos)
+
+
+def diffInstalledMod(
+    infos: List[zipfile.ZipInfo], modDir: str, installedManifest: Dict[str, ManifestEntry]
+) -> ManifestDiff:
+    """根据中央目录中的大小和CRC32与清单比较，磁盘上不存在或大小不对的文件也视为有变化"""
+    dataDir = os.path.join(modDir, "Data")
+    newManifest = buildManifest(infos)
+
+    def isUpToDate(info: zipfile.ZipInfo) -> bool:
+        name = memberRelativePath(info)
+        path = os.path.join(dataDir, *name.split("/"))
+        if info.is_dir():
+            return False
+        return (
+            installedManifest.get(name) == newManifest[name]
+            and os.path.isfile(path)
+            and os.path.getsize(path) == info.file_size
+        )
+
+    return ManifestDiff(
+        [info for info in infos if not isUpToDate(info)],
+        [name for name in installedManifest if name not in newManifest],
+        newManifest,
+    )
+
+
+def _linkOrCopy(source: str, target: str, progress: ImportProgress | None = None):
+    """硬链接（同一个卷上，不复制数据），无法硬链接时（例如FAT32/exFAT）复制"""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+        if progress is not None:
+            size = os.path.getsize(target)
+            progress.addTotal(size)
+            progress.advance(size)
+
+
+def stageManifestDiff(
+    modDir: str,
+    stagedDir: str,
+    zipFile: zipfile.ZipFile,
+    diff: ManifestDiff,
+    taint: str,
+    archiveFd: int | None = None,
+    progress: ImportProgress | None = None,
+):
+    """在暂存目录stagedDir中生成更新后的完整Mod目录，安装目录中的Mod不会被修改
+
+    没有变化的文件从已安装的Mod目录硬链接过来，有变化的文件从压缩包中解压，新版本中没有的文件不会出现，
+    最后写入taint和清单。之后由调用者通过重命名用stagedDir替换modDir，因此游戏不会看到写了一半的Mod。
+    stagedDir应与modDir在同一个卷上且不存在；出错或被取消时，stagedDir需要调用者清理。
+    """
+    dataDir = os.path.join(modDir, "Data")
+    stagedDataDir = os.path.join(stagedDir, "Data")
+    os.makedirs(stagedDataDir)
+    if progress is not None:
+        progress.addTotal(sum(info.file_size for info in diff.changedInfos))
+    changedNames = {memberRelativePath(info) for info in diff.changedInfos}
+    for name in diff.newManifest:
+        if name not in changedNames:
+            parts = name.split("/")
+            _linkOrCopy(
+                os.path.join(dataDir, *parts), os.path.join(stagedDataDir, *parts), progress
+            )
+            if progress is not None:
+                progress.checkCancelled()
+    extractMembers(zipFile, diff.changedInfos, stagedDataDir, archiveFd, progress)
+    writeTaintFile(stagedDir, taint)
+    saveInstalledManifest(stagedDir, diff.newManifest)
+
+
+def splitMembersBySize(infos: List[zipfile.ZipInfo], n: int) -> List[List[zipfile.ZipInfo]]:
+    """按照压缩后的大小把文件分成不超过n组，使各组的总大小尽量接近
+
+    从大到小依次放进当前总大小最小的组（LPT算法）。每组内按照在压缩包中的顺序排列，保证顺序读取。
+    """
+    groups: List[List[zipfile.ZipInfo]] = [[] for _ in range(n)]
+    groupSizes = [0] * n
+    for info in sorted(infos, key=lambda info: info.compress_size, reverse=True):
+        index = min(range(n), key=groupSizes.__getitem__)
+        groups[index].append(info)
+        # 加1是为了让空文件也能均匀分布
+        groupSizes[index] += info.compress_size + 1
+    return [sorted(group, key=lambda info: info.header_offset) for group in groups if group]
+
+
+def _extractMembers(
+    zipFilePath: str,
+    infos: List[zipfile.ZipInfo],
+    outputDir: str,
+    isZeroCopyAllowed: bool,
+    progress: ImportProgress | None = None,
+):
+    """在工作线程中执行：使用自己的文件句柄解压一组文件"""
+    with open(zipFilePath, "rb") as f, zipfile.ZipFile(f, "r") as zipFile:
+        _adviseSequential(f.fileno())
+        archiveFd = f.fileno() if isZeroCopyAllowed else None
+        for info in infos:
+            _extractMember(zipFile, info, outputDir, archiveFd, progress)
+
+
+def extractArchiveParallel(
+    zipFilePath: str,
+    outputDir: str,
+    workers: int,
+    isZeroCopyAllowed: bool = False,
+    progress: ImportProgress | None = None,
+):
+    """把压缩包中的文件按照压缩后的大小分给多个线程同时解压
+
+    zlib解压、计算CRC32和写文件时都会释放GIL，因此使用线程就可以利用多个核心。
+    被取消时，每个线程都会在下一次更新进度时停止。
+    isZeroCopyAllowed为True时未压缩的文件直接复制，不校验CRC32，只应在压缩包的MD5会被校验时使用。
+    """
+    with zipfile.ZipFile(zipFilePath, "r") as zipFile:
+        infos = zipFile.infolist()
+    groups = splitMembersBySize(infos, workers)
+    with ThreadPoolExecutor(len(groups), thread_name_prefix="Extract") as executor:
+        futures = [
+            executor.submit(
+                _extractMembers, zipFilePath, group, outputDir, isZeroCopyAllowed, progress
+            )
+            for group in groups
+        ]
+        for future in futures:
+            future.result()
+
+
+def _extractArchiveSinglePass(
+    zipFilePath: str,
+    outputDir: str,
+    isHashing: bool,
+    isZeroCopyAllowed: bool,
+    progress: ImportProgress | None = None,
+) -> str | None:
+    """顺序解压，同时计算MD5（isHashing为False时返回None）"""
+    with open(zipFilePath, "rb") as f:
+        _adviseSequential(f.fileno())
+        reader = HashingReader(f)
+        with zipfile.ZipFile(reader, "r") as zipFile:  # type: ignore
+            if isHashing:
+                reader.startHashing()
+            # 按照在压缩包中的顺序解压，保证顺序读取。
+            # 计算哈希时所有数据都要经过reader，不能直接复制未压缩的文件
+            archiveFd = f.fileno() if isZeroCopyAllowed and not isHashing else None
+            for info in sorted(zipFile.infolist(), key=lambda info: info.header_offset):
+                _extractMember(zipFile, info, outputDir, archiveFd, progress)
+        return reader.finish() if isHashing else None
+
+
+def extractArchive(
+    zipFilePath: str,
+    outputDir: str,
+    expectedMd5: str | None = None,
+    workers: int | None = None,
+    progress: ImportProgress | None = None,
+    isMd5Verified: bool = False,
+):
+    """解压压缩包到outputDir，同时校验MD5（expectedMd5为None时不校验）
+
+    - 压缩包较大且有多个文件时，使用workers个线程并行解压（默认为CPU核心数，不超过MAX_EXTRACT_WORKERS），
+      同时在另一个线程中计算MD5（读取的数据大多已经在系统的文件缓存中）
+    - 否则顺序读取一遍压缩包，解压和计算哈希使用同一份数据
+
+    progress不为None时，总字节数会加上解压后的大小（并行时还要加上单独计算MD5的压缩包大小），
+    被取消时抛出ImportCancelledException。
+
+    未压缩的文件只有在压缩包的MD5已经校验过（isMd5Verified，例如由下载器校验）或会被校验时才直接复制，
+    否则都经过zipfile读取，由CRC32发现损坏的文件。
+
+    outputDir应为临时目录：MD5不匹配或被取消时，outputDir中已经解压的文件需要调用者清理。
+    """
+    if workers is None:
+        workers = min(os.cpu_count() or 1, MAX_EXTRACT_WORKERS)
+    fileSize = os.path.getsize(zipFilePath)
+    startTime = time.monotonic()
+    with zipfile.ZipFile(zipFilePath, "r") as zipFile:
+        infos = zipFile.infolist()
+    isParallel = workers > 1 and fileSize >= PARALLEL_EXTRACT_THRESHOLD and len(infos) > 1
+    if progress is not None:
+        progress.addTotal(sum(info.file_size for info in infos))
+        if isParallel and expectedMd5:
+            progress.addTotal(fileSize)
+    if isParallel:
+        with ThreadPoolExecutor(1, thread_name_prefix="ExtractHash") as hashExecutor:
+            hashFuture = (
+                hashExecutor.submit(
+                    hashFile, zipFilePath, "md5", progress.advance if progress else None
+                )
+                if expectedMd5
+                else None
+            )
+            extractArchiveParallel(
+                zipFilePath, outputDir, workers, isMd5Verified or bool(expectedMd5), progress
+            )
+            localMd5 = hashFuture.result() if hashFuture else None
+    else:
+        localMd5 = _extractArchiveSinglePass(
+            zipFilePath, outputDir, expectedMd5 is not None, isMd5Verified, progress
+        )
+    elapsed = max(time.monotonic() - startTime, 1e-3)
+    sizeNumber, sizeUnit = byteLengthToHumanReadable(fileSize)
+    speedNumber, speedUnit = byteLengthToHumanReadable(int(fileSize / elapsed))
+    AppLogger().info(
+        f"解压{os.path.basename(zipFilePath)}{'并校验MD5' if expectedMd5 else ''}"
+        f"（{f'{workers}线程' if isParallel else '单线程'}）："
+        f"{sizeNumber}{sizeUnit}，用时{elapsed:.2f}秒，{speedNumber}{speedUnit}/s"
+    )
+    if localMd5 is not None and localMd5.lower() != expectedMd5.lower():  # type: ignore
+        raise Md5MismatchException()
+
+
+def benchmark():
+    """比较zipfile的extractall和extractArchive的速度
+
+    分别使用压缩（ZIP_DEFLATED）和未压缩（ZIP_STORED，可以直接复制）的压缩包，其中有多个大小不一的pak文件。
+    """
+    import random
+    import tempfile
+
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as workDir:
+        print(
+            f"CPU核心数{os.cpu_count()}，直接复制{'可用' if _isZeroCopyAvailable() else '不可用'}"
+        )
+        for compression in (zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED):
+            zipFilePath = os.path.join(workDir, f"mod{compression}.zip")
+            with zipfile.ZipFile(zipFilePath, "w", compression) as zipFile:
+                for i in range(24):
+                    size = random.randint(1, 16) * 1024 * 1024
+                    # 一半随机、一半重复的数据，压缩率与常见的pak文件接近
+                    block = os.urandom(64 * 1024) + bytes(64 * 1024)
+                    zipFile.writestr(f"Data/Paks/file{i}.pak", block * (size // len(block)))
+            _benchmarkArchive(workDir, zipFilePath)
+
+
+def _benchmarkArchive(workDir: str, zipFilePath: str):
+    fileSize = os.path.getsize(zipFilePath)
+    expectedMd5 = hashFile(zipFilePath)
+    print(f"{os.path.basename(zipFilePath)}：{fileSize / 1024 / 1024:.1f}MiB")
+
+    def measure(name: str, extract):
+        outputDir = os.path.join(workDir, "out")
+        startTime = time.monotonic()
+        extract(outputDir)
+        elapsed = time.monotonic() - startTime
+        print(f"  {name}: {elapsed:6.2f}s, {fileSize / elapsed / 1024 / 1024:7.2f}MiB/s")
+        shutil.rmtree(outputDir)
+
+    def extractall(outputDir: str):
+        with zipfile.ZipFile(zipFilePath, "r") as zipFile:
+            zipFile.extractall(outputDir)
+
+    def extractallAndHash(outputDir: str):
+        # 之前的导入方式：先计算MD5，再解压
+        hashFile(zipFilePath)
+        extractall(outputDir)
+
+    measure("extractall                 ", extractall)
+    measure("hashFile + extractall      ", extractallAndHash)
+    for workers in (1, 2, 4, 8):
+        measure(
+            f"extractArchive({workers})          ",
+            lambda outputDir: extractArchive(
+                zipFilePath, outputDir, None, workers, isMd5Verified=True
+            ),
+        )
+        measure(
+            f"extractArchive({workers}) + MD5校验",
+            lambda outputDir: extractArchive(zipFilePath, outputDir, expectedMd5, workers),
+        )
+    try:
+        extractArchive(zipFilePath, os.path.join(workDir, "out"), "0" * 32)
+    except Md5MismatchException as e:
+        print(f"  错误的MD5：{e}")
+    shutil.rmtree(os.path.join(workDir, "out"), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -1,31 +1,79 @@
-from PySide6.QtCore import QTimer
-from PySide6.QtNetwork import QNetworkReply
+from concurrent.futures import ThreadPoolExecutor
+import os
+from PySide6.QtCore import QTimer, Signal
 from PySide6.QtWidgets import QApplication
-from typing import Dict, List
+from typing import Dict, List, Set, Tuple
 
 from qfluentwidgets import QObject
-from aria2.aria2_client import Aria2Client
+from aria2.aria2_async_client import Aria2AsyncClient
+from aria2.aria2_client import Aria2RpcException
 
 from common.log import AppLogger
 from common.mod.installation.extra_info import ModInstallationInfo
-from common.mod.installation.download_info import ModDownloadTaskInfo
+from common.mod.installation.download_info import ModDownloadTaskInfo, ModDownloadTasksSnapshot
+from common.mod.installation.download_concurrency import DownloadConcurrencyController
+from common.mod.installation.download_engine import createDownloadEngine
+from common.mod.installation.download_scheduler import DownloadScheduler
+from common.mod.installation.download_session import loadDownloadTasks, saveDownloadTasks
+from common.mod.installation.download_watchdog import DownloadWatchdog
+from common.mod.installation.mod_archive import INSTALLED_MANIFEST_NAME
 from common.mod.installation.mod_dependencies import getModDependencies
+from common.mod.installation.mod_file_md5 import getModFileMd5
+from common.mod.installation.mod_import_dispatcher import ModImportTaskDispatcher
 from common.mod.installation.mod_name import (
     ModName,
 )
+from common.mod.installation.mod_partial_update import PartialUpdatePlan, planPartialUpdate
+from common.mod.installation.path import GetModInstallationDirException, getModInstallationDir
 from common.mod.local_mods import (
     checkIsInstalledLatest,
 )
-from common.mod.mod_mirrors import getDownloadUrlFromFrostBladeMirror
+from common.mod.mirror_scoreboard import MirrorScoreboard, getHost
+from common.mod.mod_mirrors import MirrorRegistry, MirrorUrl
 from common.mod.mod_data import ModData
+from common.qrequest import QFuturePromise
 
 
 class ModDownloadManager(QObject):
     """Mod下载管理器
 
     单例对象，使用ModInstallationManager.getInstance()获取
+
+    实际的下载由下载引擎（DownloadEngine）完成，默认使用aria2，没有aria2时使用内置的HTTP下载器，
+    两者的客户端接口相同，下文中的aria2均指下载引擎。
+
+    通过下载引擎的事件信号（aria2的WebSocket通知）得知任务状态的变化，下载完成的任务会立即交给导入调度器，
+    不依赖轮询。任务列表发生变化时会发出`tasksChanged`信号。
+
+    所有对aria2的调用都通过Aria2AsyncClient在RPC线程中执行，不会阻塞主线程。
+    因此retrieve*方法返回的是最近一次refresh得到的任务快照，
+    快照更新后会发出`snapshotUpdated`信号。
+
+    aria2由Aria2Supervisor管理，崩溃后会自动重启。未完成的任务由下载引擎的会话文件恢复，
+    gid到ModInstallationInfo的映射则保存在`app_config.DOWNLOAD_TASKS_PATH`中，
+    因此App重启后，部分下载的Mod会继续下载，而不是重新开始。
     """
 
+    tasksChanged = Signal()
+    """任务列表或任务状态发生变化"""
+
+    snapshotUpdated = Signal()
+    """任务快照已更新"""
+
+    # 在导入线程中发出，由Qt排队到主线程中处理，参数为部分更新失败的Mod的ModInstallationInfo
+    _partialUpdateFailed = Signal(object)
+
+    # 分页获取任务列表时每页的任务数量
+    TASKS_PAGE_SIZE = 100
+    # 清除已处理的下载结果的间隔（毫秒）
+    PURGE_INTERVAL = 30_000
+    # 任务信息变化后延迟保存的时间（毫秒），期间的多次变化只保存一次
+    SAVE_DELAY = 500
+    # aria2的checksum校验失败时的错误码
+    CHECKSUM_ERROR_CODE = "32"
+    # 同一个Mod校验失败后最多重新下载的次数
+    MAX_CHECKSUM_RETRIES = 2
+
     _instance: "ModDownloadManager | None" = None
 
     @classmethod
@@ -45,14 +93,114 @@ class ModDownloadManager(QObject):
 
     def __init__(self) -> None:
         super().__init__()
-        self.aria2c = Aria2Client()
-        self.gidToInfo: Dict[str, ModInstallationInfo] = {}
+        self.engine = createDownloadEngine(self)
+        self.engine.restarted.connect(self._waitForEngine)
+        self.client = self.engine.client
+        self.rpc = Aria2AsyncClient(self.client, self)
+        # 根据实际吞吐量动态调整aria2的并发下载数、分段数和连接数
+        self.concurrencyController = DownloadConcurrencyController(self.rpc, self)
+        self.engine.downloadStart.connect(self.concurrencyController.onDownloadStart)
+        # 负责任务优先级和限速
+        self.scheduler = DownloadScheduler(self.rpc, self._getNormalGids, self)
+        # 发现下载停滞时自动更换下载地址或重新连接
+        self.watchdog = DownloadWatchdog(self.rpc, self.refresh, self)
+        self.snapshotUpdated.connect(lambda: self.watchdog.onSnapshotUpdated(self.snapshot))
+        self.engine.downloadPause.connect(self.watchdog.onDownloadPause)
+        # 恢复上次保存的任务信息，其中已经不存在于aria2中的任务会在第一次刷新后被清除
+        self.gidToInfo: Dict[str, ModInstallationInfo] = loadDownloadTasks()
+        self.saveTimer = QTimer(self)
+        self.saveTimer.setSingleShot(True)
+        self.saveTimer.setInterval(self.SAVE_DELAY)
+        self.saveTimer.timeout.connect(lambda: saveDownloadTasks(self.gidToInfo))
+        self.isRestoredTasksPruned = False
+        # 正在添加（已调用addUri但还未返回gid）的Mod的资源ID，用于去重
+        self.addingRids: Set[int] = set()
+        self.snapshot = ModDownloadTasksSnapshot([], [], [])
+        self.isRefreshing = False
+        self.isRefreshRequested = False
+        self.tasksChanged.connect(self.refresh)
+        # 已经处理过（不再需要）的已停止任务的gid，定期从aria2中清除，避免tellStopped越来越大
+        self.gidsToPurge: Set[str] = set()
+        self.purgeTimer = QTimer(self)
+        self.purgeTimer.setInterval(self.PURGE_INTERVAL)
+        self.purgeTimer.timeout.connect(self.purgeConsumedResults)
+        self.purgeTimer.start()
+
+        self.engine.downloadComplete.connect(self._onDownloadComplete)
+        self.engine.downloadError.connect(self._onDownloadError)
+        # 资源ID到校验失败后重新下载的次数
+        self.checksumRetries: Dict[int, int] = {}
+        # 获取部分更新计划（请求中央目录）的线程
+        self.partialUpdateExecutor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="PartialUpdate"
+        )
+        self._partialUpdateFailed.connect(self._onPartialUpdateFailed)
+        for signal in (
+            self.engine.downloadStart,
+            self.engine.downloadPause,
+            self.engine.downloadStop,
+            self.engine.downloadError,
+        ):
+            signal.connect(lambda _: self.tasksChanged.emit())
+        # 连接（或重连）成功后检查一次，以免遗漏连接断开期间完成的任务
+        self.engine.connected.connect(self.refresh)
+
+        self.engine.start()
+        self._waitForEngine()
+
+    def _waitForEngine(self):
+        """在RPC线程中等待下载引擎可用，之后提交的调用都会排在它后面，因此不需要额外的同步
+
+        aria2重启后也会调用这个函数。
+        """
+
+        def afterReady(version: str):
+            AppLogger().info(f"{self.engine.name}已就绪（version={version}）")
+            self.engine.onReady()
+            # aria2重启后运行时修改的选项会丢失，因此每次就绪后都重新应用
+            self.concurrencyController.start()
+            self.scheduler.start()
+            self.refresh()
+
+        (
+            self.rpc.call(self.engine.waitUntilReady)
+            .then(afterReady)
+            .catch(lambda error: AppLogger().error(f"等待下载引擎启动时发生错误：{error}"))
+            .done()
+        )
+
+    def shutdown(self):
+        """保存任务信息并关闭下载引擎，在App关闭时调用"""
+        self.concurrencyController.stop()
+        self.scheduler.stop()
+        self.watchdog.stop()
+        # 丢弃还未执行的aria2调用
+        self.rpc.close()
+        # 还没有保存的变化在这里一次保存
+        self.saveTimer.stop()
+        saveDownloadTasks(self.gidToInfo)
+        self.engine.stop()
+
+    def _saveTasks(self):
+        """在SAVE_DELAY后保存任务信息，这段时间内的多次变化（例如批量添加）只写一次文件"""
+        # 已经在等待保存时不重新计时，避免持续变化时一直不保存
+        if not self.saveTimer.isActive():
+            self.saveTimer.start()
+
+    def _getNormalGids(self) -> List[str]:
+        """快照中所有未结束的非优先任务的gid"""
+        return [
+            task.gid
+            for task in self.snapshot.active + self.snapshot.waiting
+            if not task.installationInfo.isPriority
+        ]
 
     def addTask(
         self,
         modData: ModData,
         modName: ModName | None = None,
         isCheckInstallationStatus: bool = False,
+        isPriority: bool = False,
     ) -> None:
         """添加安装任务
 
@@ -60,6 +208,7 @@ class ModDownloadManager(QObject):
             modData (ModData): 要安装的Mod的ModData
             modName (ModName | None, optional): Mod名称. Defaults to None.
             isCheckInstallationStatus (bool, optional): 是否启用安装状态检查，即如果本地已经安装且是最新，则跳过. Defaults to False.
+            isPriority (bool, optional): 是否为优先任务（用户单独点击安装），优先任务会排在批量安装的任务之前. Defaults to False.
         """
         if modName is None:
             modName = ModName(modData.name, "")
@@ -67,67 +216,284 @@ class ModDownloadManager(QObject):
         if isCheckInstallationStatus and checkIsInstalledLatest(modData):
             AppLogger().info(f"{modName}已经安装最新版，跳过")
             # 处理该Mod的依赖，处理时还会调用addJob方法，所以依赖如果不是最新就会被安装
-            self.processModDependencies(modData, isCheckInstallationStatus)
+            self.processModDependencies(modData, isCheckInstallationStatus, isPriority)
             return
-        # 下载地址列表
-        downloadUrls: List[str] = []
-        # 镜像站名称，如果有镜像站，会在安装卡片中显示
-        mirrorStationNames: List[str] = []
-
-        # 定义添加下载任务函数
-        def addDownloadTask():
-            # 如果该Mod已经在下载列表中，则不添加，防止在处理依赖时，多个Mod依赖同一个Mod，导致该Mod下载多次
-            ridGidMap = {info.modData.resourceId: gid for gid, info in self.gidToInfo.items()}
-            if modData.resourceId in ridGidMap:
-                # 合并一下两个ModName
-                info = self.gidToInfo[ridGidMap[modData.resourceId]]
-                oldModName = info.modName
-                info.modName = ModName(
-                    oldModName.mainName,
-                    (
-                        f"{oldModName.hintName} | {modName.hintName}"
-                        if oldModName.hintName
-                        else modName.hintName
-                    ),
-                )
-                AppLogger().info(f"{modName}已经在下载列表中，跳过")
+        # 如果该Mod已经在下载列表中，则不添加，防止在处理依赖时，多个Mod依赖同一个Mod，导致该Mod下载多次
+        if modData.resourceId in self.addingRids:
+            AppLogger().info(f"{modName}正在添加到下载列表中，跳过")
+            return
+        ridGidMap = {info.modData.resourceId: gid for gid, info in self.gidToInfo.items()}
+        if modData.resourceId in ridGidMap:
+            # 合并一下两个ModName
+            info = self.gidToInfo[ridGidMap[modData.resourceId]]
+            oldModName = info.modName
+            info.modName = ModName(
+                oldModName.mainName,
+                (
+                    f"{oldModName.hintName} | {modName.hintName}"
+                    if oldModName.hintName
+                    else modName.hintName
+                ),
+            )
+            # 已经在队列中的任务被单独点击安装时，将其提前
+            if isPriority and not info.isPriority:
+                info.isPriority = True
+                self.scheduler.promote(ridGidMap[modData.resourceId])
+            self._saveTasks()
+            AppLogger().info(f"{modName}已经在下载列表中，跳过")
+            return
+        self.addingRids.add(modData.resourceId)
+        # 已经安装过的Mod尝试只下载有变化的文件，不行时再完整下载
+        if not self._tryPartialUpdate(modData, modName, isPriority):
+            self._addDownloadTask(modData, modName, isPriority)
+        # 同时处理依赖，依赖的下载也会马上开始，不需要等待这个Mod的任务添加完成和镜像站查询
+        self.processModDependencies(modData, isCheckInstallationStatus, isPriority)
+
+    def _tryPartialUpdate(self, modData: ModData, modName: ModName, isPriority: bool) -> bool:
+        """Mod已经安装（且有清单）时，在后台通过Range请求获取新版本的中央目录并与已安装的文件比较，
+        只下载有变化的文件（交给导入调度器执行）。不适合部分更新时，会回到完整下载。
+
+        返回是否接手了这个Mod（返回False时调用者应直接完整下载）。
+        """
+        try:
+            modDir = os.path.join(getModInstallationDir(), f"UGC{modData.resourceId}")
+        except GetModInstallationDirException:
+            return False
+        if not os.path.exists(os.path.join(modDir, INSTALLED_MANIFEST_NAME)):
+            return False
+
+        def afterPlan(plan: PartialUpdatePlan | None):
+            if plan is None:
+                AppLogger().info(f"{modName}不适合部分更新，完整下载")
+                self._addDownloadTask(modData, modName, isPriority)
                 return
-            # 把官方的下载地址放在最后，这样镜像站的优先级更高
-            downloadUrls.append(modData.getWindowsDownloadUrl())
-            gid = self.aria2c.addUri(downloadUrls)
-            AppLogger().info(f"添加下载任务：{{modName={modName}, gid={gid}, url={downloadUrls}}}")
+            self.addingRids.discard(modData.resourceId)
+            info = ModInstallationInfo(modData, modName, [], isPriority)
+            ModImportTaskDispatcher.getInstance().addPartialUpdateTask(
+                plan, info, lambda _: self._partialUpdateFailed.emit(info)
+            )
+            self.tasksChanged.emit()
+
+        def whenPlanError(error: Exception):
+            AppLogger().warning(f"{modName}无法部分更新，完整下载：{error}")
+            self._addDownloadTask(modData, modName, isPriority)
+
+        (
+            QFuturePromise(
+                self,
+                self.partialUpdateExecutor,
+                planPartialUpdate,
+                modData.getWindowsDownloadUrl(),
+                modDir,
+            )
+            .then(afterPlan)
+            .catch(whenPlanError)
+            .done()
+        )
+        return True
+
+    def _onPartialUpdateFailed(self, info: ModInstallationInfo):
+        """部分更新在下载或写入时出错（已安装的Mod没有被修改），改为完整下载"""
+        modData = info.modData
+        if modData.resourceId in self.addingRids:
+            return
+        AppLogger().warning(f"{info.modName}部分更新失败，完整下载")
+        self.addingRids.add(modData.resourceId)
+        self._addDownloadTask(modData, info.modName, info.isPriority)
+
+    def _addDownloadTask(self, modData: ModData, modName: ModName, isPriority: bool):
+        """添加完整下载的任务，调用前需要把资源ID加入addingRids"""
+        officialUrl = modData.getWindowsDownloadUrl()
+        # 不等待镜像站的查询结果，先用官方的下载地址开始下载，
+        # 镜像站的下载地址查到后再通过changeUri加入到任务中。
+        # gid和镜像站的下载地址都得到后（两者的先后顺序不确定），才能加入镜像站的下载地址。
+        # MD5同理，得到后如果任务还没开始下载，通过checksum选项交给下载器，下载完成时由下载器校验，
+        # 否则在导入时校验。
+        # Mod数据中一般已经有MD5，此时添加任务时就直接带上checksum选项
+        gid: str | None = None
+        mirrorUrls: List[MirrorUrl] = []
+        md5: str | None = modData.fileMd5
+        options = self.scheduler.taskOptions(isPriority)
+        if md5:
+            options["checksum"] = f"md5={md5}"
+
+        def injectMirrorUrlsIfReady():
+            if gid is not None and mirrorUrls:
+                self._injectMirrorUrls(gid, officialUrl, mirrorUrls)
+
+        def applyChecksumIfReady():
+            if gid is not None and md5:
+                self._applyChecksum(gid, md5)
+
+        def afterAddUri(newGid: str):
+            nonlocal gid
+            gid = newGid
+            self.addingRids.discard(modData.resourceId)
+            AppLogger().info(f"添加下载任务：{{modName={modName}, gid={gid}, url={officialUrl}}}")
             # 添加到extra中
-            self.gidToInfo[gid] = ModInstallationInfo(modData, modName, mirrorStationNames)
-            # 处理依赖
-            self.processModDependencies(modData, isCheckInstallationStatus)
+            # Mod数据中有MD5时，添加任务时已经带上了checksum选项
+            self.gidToInfo[gid] = ModInstallationInfo(
+                modData, modName, [], isPriority, md5=modData.fileMd5, fileMd5=md5
+            )
+            self._saveTasks()
+            self.tasksChanged.emit()
+            injectMirrorUrlsIfReady()
+            if not modData.fileMd5:
+                applyChecksumIfReady()
+
+        def whenAddUriError(error: Exception):
+            self.addingRids.discard(modData.resourceId)
+            AppLogger().error(f"添加下载任务{modName}时发生错误：{error}")
+
+        (
+            self.rpc.addUri(
+                [officialUrl],
+                options,
+                self.scheduler.taskPosition(isPriority),
+            )
+            .then(afterAddUri)
+            .catch(whenAddUriError)
+            .done()
+        )
+
+        def afterGetMd5(result: str):
+            nonlocal md5
+            md5 = result
+            # Mod数据中没有MD5，记录下来供导入时校验（导入时不会再请求）
+            if gid is not None and gid in self.gidToInfo:
+                self.gidToInfo[gid].fileMd5 = md5
+                self._saveTasks()
+            applyChecksumIfReady()
+
+        if not md5:
+            (
+                getModFileMd5(self, modData)
+                .then(afterGetMd5)
+                # 获取失败时导入阶段会自己校验
+                .catch(lambda error: AppLogger().warning(f"获取{modName}的MD5时发生错误：{error}"))
+                .done()
+            )
 
         # 定义获取镜像站下载链接后的处理函数
-        def afterGetMirrorUrl(mirrorUrl: str) -> None:
-            if mirrorUrl:
-                downloadUrls.append(mirrorUrl)
-                mirrorStationNames.append("FrostBlade镜像站")
-            addDownloadTask()
+        def afterGetMirrorUrls(urls: List[MirrorUrl]) -> None:
+            nonlocal mirrorUrls
+            # 官方地址已经在任务中了
+            mirrorUrls = [mirrorUrl for mirrorUrl in urls if mirrorUrl.url != officialUrl]
+            injectMirrorUrlsIfReady()
+
+        (
+            # 同时从所有镜像站获取该Mod的下载链接，没有按时返回的镜像站不会被使用
+            MirrorRegistry.getInstance()
+            .lookupAll(self, modData.resourceId)
+            .then(afterGetMirrorUrls)
+            .catch(lambda error: AppLogger().warning(f"查询{modName}的镜像站时发生错误：{error}"))
+            .done()
+        )
+
+    def _injectMirrorUrls(self, gid: str, officialUrl: str, mirrorUrls: List[MirrorUrl]):
+        """把镜像站的下载地址加入到已经开始的任务中，位置由各下载地址的实测速度决定
+
+        aria2会用新的地址建立更多的连接（多源下载），已经建立的连接不受影响。
+        如果任务已经下载完了（或者被移除了），changeUri会失败，忽略即可。
+        """
+
+        def afterChangeUri(_):
+            info = self.gidToInfo.get(gid)
+            if info is None:
+                return
+            for mirrorUrl in mirrorUrls:
+                if mirrorUrl.displayName not in info.mirrorStationNames:
+                    info.mirrorStationNames.append(mirrorUrl.displayName)
+            self._saveTasks()
+            self.tasksChanged.emit()
+
+        def changeUri(fasterUrls: List[str], slowerUrls: List[str]):
+            # 比官方地址快的放在最前面，其余的放在最后
+            if fasterUrls:
+                self.client.changeUri(gid, 1, [], fasterUrls, 0)
+            if slowerUrls:
+                self.client.changeUri(gid, 1, [], slowerUrls)
+
+        def afterRank(rankedUrls: List[str]):
+            if officialUrl not in rankedUrls:
+                # 不应发生，按未排序处理
+                rankedUrls = [officialUrl] + [url for url in rankedUrls if url != officialUrl]
+            officialPosition = rankedUrls.index(officialUrl)
+            fasterUrls = rankedUrls[:officialPosition]
+            slowerUrls = rankedUrls[officialPosition + 1 :]
+            AppLogger().info(
+                f"向任务{gid}加入{[mirrorUrl.displayName for mirrorUrl in mirrorUrls]}的下载地址："
+                f"{fasterUrls} + 官方地址 + {slowerUrls}"
+            )
+            (
+                self.rpc.call(changeUri, fasterUrls, slowerUrls)
+                .then(afterChangeUri)
+                .catch(
+                    lambda error: AppLogger().info(
+                        f"向任务{gid}加入镜像站的下载地址失败（任务可能已经结束）：{error}"
+                    )
+                )
+                .done()
+            )
+
+        def whenRankError(error: Exception):
+            # 排序失败时仍然加入镜像站的下载地址，放在官方地址之后
+            AppLogger().warning(f"为任务{gid}的下载地址排序时发生错误，按原顺序加入：{error}")
+            afterRank([officialUrl] + [mirrorUrl.url for mirrorUrl in mirrorUrls])
+
+        # 按照各下载地址的实测速度排序，aria2会优先使用靠前的地址
+        (
+            MirrorScoreboard.getInstance()
+            .probeAndRank([mirrorUrl.url for mirrorUrl in mirrorUrls] + [officialUrl])
+            .then(afterRank)
+            .catch(whenRankError)
+            .done()
+        )
+
+    def _applyChecksum(self, gid: str, md5: str):
+        """通过checksum选项把MD5交给下载器，下载器会在下载完成时校验，校验失败时任务会出错（错误码32）
+
+        对正在下载的任务调用changeOption会使任务重新开始，因此只对等待中或暂停的任务设置；
+        其他情况下info.md5仍为None，导入时会自己校验。
+        """
+
+        def changeOptionIfNotActive() -> bool:
+            status = self.client.tellStatus(gid, ["status"])["result"]["status"]
+            if status not in ("waiting", "paused"):
+                return False
+            self.client.changeOption(gid, {"checksum": f"md5={md5}"})
+            return True
 
-        # 定义获取下载站链接出错时的处理函数
-        def whenGetMirrorUrlError(error: QNetworkReply.NetworkError):
-            AppLogger().warning(f"get FrostBlade mirror error: {error.name}")
-            addDownloadTask()
+        def afterChangeOption(isApplied: bool):
+            if not isApplied:
+                AppLogger().info(f"任务{gid}已经开始下载，将在导入时校验MD5")
+                return
+            info = self.gidToInfo.get(gid)
+            if info is None:
+                return
+            info.md5 = md5
+            self._saveTasks()
 
         (
-            # 先从镜像站获取该Mod的下载链接
-            getDownloadUrlFromFrostBladeMirror(self, modData.resourceId)
-            # 如果有镜像链接，则加入下载url列表中并开始下载；如果没有则直接开始下载
-            .then(afterGetMirrorUrl)
-            # 如果获取镜像链接时发生错误，直接开始下载
-            .catch(whenGetMirrorUrlError).done()
+            self.rpc.call(changeOptionIfNotActive)
+            .then(afterChangeOption)
+            .catch(
+                lambda error: AppLogger().info(
+                    f"为任务{gid}设置MD5校验失败（任务可能已经结束），将在导入时校验：{error}"
+                )
+            )
+            .done()
         )
 
-    def processModDependencies(self, modData: ModData, isCheckLocalStatus: bool):
+    def processModDependencies(
+        self, modData: ModData, isCheckLocalStatus: bool, isPriority: bool = False
+    ):
         """处理Mod依赖，如果有依赖则会使用addJob添加下载
 
         Args:
             modData (ModData): 要处理依赖的ModData
             isCheckLocalStatus (bool): 这个参数将在有依赖Mod时传入给addJob，因此请参考`addJob`
+            isPriority (bool, optional): 同上. Defaults to False.
         """
         (
             getModDependencies(self, modData.resourceId)
@@ -137,6 +503,7 @@ class ModDownloadManager(QObject):
                         dependencyModData,
                         ModName(dependencyModData.name, f"{modData.name} 的依赖"),
                         isCheckLocalStatus,
+                        isPriority,
                     )
                     for dependencyModData in modDataList
                 ]
@@ -144,28 +511,229 @@ class ModDownloadManager(QObject):
             .done()
         )
 
+    def _toTaskInfoList(self, rawList: List[dict]) -> List[ModDownloadTaskInfo]:
+        # 跳过不是由管理器添加的任务（例如已经被用户移除的任务）
+        return [
+            ModDownloadTaskInfo(raw, self.gidToInfo[raw["gid"]])
+            for raw in rawList
+            if raw["gid"] in self.gidToInfo
+        ]
+
+    def refresh(self):
+        """在RPC线程中获取全部任务，完成后更新快照并发出snapshotUpdated
+
+        只请求ARIA2_RPC_KEYS中的键，并分页获取整个队列（一般只需要一次system.multicall）。
+
+        如果上一次刷新还没有完成，则在其完成后再刷新一次，避免请求在RPC线程中堆积。
+        """
+        if self.isRefreshing:
+            self.isRefreshRequested = True
+            return
+        self.isRefreshing = True
+
+        def afterTellAll(results: Tuple[List[dict], List[dict], List[dict]]):
+            active, waiting, stopped = results
+            if not self.isRestoredTasksPruned:
+                self._pruneRestoredTasks({raw["gid"] for raw in active + waiting + stopped})
+            # 不在映射中的已停止任务已经被处理过了（例如被用户移除），之后统一清除
+            self.gidsToPurge.update(
+                raw["gid"] for raw in stopped if raw["gid"] not in self.gidToInfo
+            )
+            self.snapshot = ModDownloadTasksSnapshot(
+                self._toTaskInfoList(active),
+                self._toTaskInfoList(waiting),
+                self._toTaskInfoList(stopped),
+            )
+            # 已完成的任务通常已经通过aria2的通知交给了导入调度器，这里只是兜底
+            self.moveCompletedTasksToImportDispatcher(self.snapshot.stopped)
+            self.snapshotUpdated.emit()
+            finishRefreshing()
+
+        def whenTellAllError(error: Exception):
+            AppLogger().warning(f"获取aria2任务列表时发生错误：{error}")
+            finishRefreshing()
+
+        def finishRefreshing():
+            self.isRefreshing = False
+            if self.isRefreshRequested:
+                self.isRefreshRequested = False
+                self.refresh()
+
+        (
+            self.rpc.call(
+                self.client.tellAll, ModDownloadTaskInfo.ARIA2_RPC_KEYS, self.TASKS_PAGE_SIZE
+            )
+            .then(afterTellAll)
+            .catch(whenTellAllError)
+            .done()
+        )
+
+    def _pruneRestoredTasks(self, existingGids: Set[str]):
+        """清除恢复的任务信息中，aria2里已经不存在的任务（例如上次关闭前已经完成的任务）"""
+        self.isRestoredTasksPruned = True
+        staleGids = [gid for gid in self.gidToInfo if gid not in existingGids]
+        for gid in staleGids:
+            self.gidToInfo.pop(gid)
+        if staleGids:
+            AppLogger().info(f"清除{len(staleGids)}个已不存在的下载任务信息")
+            self._saveTasks()
+
+    def retrieveAll(self) -> ModDownloadTasksSnapshot:
+        """返回最近一次refresh得到的全部任务的快照，不会请求aria2"""
+        return self.snapshot
+
     def retrieveActive(self) -> List[ModDownloadTaskInfo]:
-        response = self.aria2c.tellActive()
-        result = response["result"]
-        return [ModDownloadTaskInfo(raw, self.gidToInfo[raw["gid"]]) for raw in result]
+        return self.snapshot.active
 
     def retrieveWaiting(self) -> List[ModDownloadTaskInfo]:
-        response = self.aria2c.tellWaiting(0, 200)
-        result = response["result"]
-        return [ModDownloadTaskInfo(raw, self.gidToInfo[raw["gid"]]) for raw in result]
+        return self.snapshot.waiting
+
+    def retrieveStopped(self) -> List[ModDownloadTaskInfo]:
+        return self.snapshot.stopped
 
     def stopAndRemoveTask(self, gid: str):
-        self.aria2c.remove(gid)
-        self.removeStoppedTask(gid)
+        # 先从映射中移除，这样后续的快照中就不会再包含这个任务
+        self.gidToInfo.pop(gid, None)
+        self._saveTasks()
+
+        def stopAndRemove():
+            try:
+                self.client.remove(gid)
+            except Aria2RpcException:
+                # 已经停止的任务（例如下载出错的任务）无法remove，直接移除下载结果即可
+                pass
+            self.client.removeDownloadResult(gid)
 
-    def retrieveStopped(self) -> List[ModDownloadTaskInfo]:
-        response = self.aria2c.tellStopped(0, 200)
-        result = response["result"]
-        return [ModDownloadTaskInfo(raw, self.gidToInfo[raw["gid"]]) for raw in result]
+        (
+            self.rpc.call(stopAndRemove)
+            .then(lambda _: self.tasksChanged.emit())
+            .catch(lambda error: AppLogger().warning(f"移除下载任务{gid}时发生错误：{error}"))
+            .done()
+        )
+        self.tasksChanged.emit()
 
     def removeStoppedTask(self, gid: str):
-        self.gidToInfo.pop(gid, None)  # 要指定一个默认值，否则键不存在时会抛出异常
-        self.aria2c.removeDownloadResult(gid)
+        self.removeStoppedTasks([gid])
+
+    def removeStoppedTasks(self, gids: List[str]):
+        """批量移除已停止的任务，只需要一次请求"""
+        if not gids:
+            return
+        for gid in gids:
+            self.gidToInfo.pop(gid, None)  # 要指定一个默认值，否则键不存在时会抛出异常
+        self._saveTasks()
+        (
+            self.rpc.multicall(*[("aria2.removeDownloadResult", gid) for gid in gids])
+            .catch(lambda error: AppLogger().warning(f"移除下载结果时发生错误：{error}"))
+            .done()
+        )
+
+    def purgeConsumedResults(self):
+        """从aria2中清除已经处理过的下载结果"""
+        if not self.gidsToPurge:
+            return
+        gids = list(self.gidsToPurge)
+        self.gidsToPurge.clear()
+
+        AppLogger().debug(f"清除{len(gids)}个已处理的下载结果")
+        # 一次请求清除所有下载结果，每个调用单独执行，其中一个出错不影响其他的
+        (
+            self.rpc.multicall(*[("aria2.removeDownloadResult", gid) for gid in gids])
+            # 部分下载结果可能已经被移除了
+            .catch(lambda error: AppLogger().debug(f"清除下载结果时发生错误：{error}")).done()
+        )
+
+    def moveCompletedTasksToImportDispatcher(self, stoppedTasks: List[ModDownloadTaskInfo]):
+        """将已完成的任务交给导入调度器，并从aria2中移除"""
+        importDispatcher = ModImportTaskDispatcher.getInstance()
+        completedGids: List[str] = []
+        for task in stoppedTasks:
+            # 通知和兜底的刷新可能会处理同一个任务，已经移除的任务不再处理
+            if task.status == "complete" and task.gid in self.gidToInfo:
+                importDispatcher.addTask(task.gid, task.fileRelativePath, task.installationInfo)
+                completedGids.append(task.gid)
+        self.removeStoppedTasks(completedGids)
+
+    def _onDownloadError(self, gid: str):
+        if gid not in self.gidToInfo:
+            return
+
+        def afterTellStatus(response: dict):
+            info = self.gidToInfo.get(gid)
+            if info is None:
+                return
+            task = ModDownloadTaskInfo(response["result"], info)
+            if task.errorCode == self.CHECKSUM_ERROR_CODE:
+                self._retryChecksumFailedTask(task)
+
+        (
+            self.rpc.tellStatus(gid, ModDownloadTaskInfo.ARIA2_RPC_KEYS)
+            .then(afterTellStatus)
+            .catch(lambda error: AppLogger().warning(f"获取任务{gid}的状态时发生错误：{error}"))
+            .done()
+        )
+
+    def _retryChecksumFailedTask(self, task: ModDownloadTaskInfo):
+        """下载的文件校验失败时，删除损坏的文件并重新下载，提供这个文件的下载地址会被排到最后"""
+        info = task.installationInfo
+        rid = info.modData.resourceId
+        retries = self.checksumRetries.get(rid, 0)
+        if retries >= self.MAX_CHECKSUM_RETRIES:
+            AppLogger().error(f"{info.modName.mainName}已经重新下载{retries}次，仍然校验失败")
+            return
+        self.checksumRetries[rid] = retries + 1
+        scoreboard = MirrorScoreboard.getInstance()
+        for uri in set(task.usedUris):
+            scoreboard.record(getHost(uri), None)
+        scoreboard.save()
+        uris = scoreboard.rank(list(dict.fromkeys(task.uris)))
+        options = self.scheduler.taskOptions(info.isPriority)
+        if info.md5:
+            options["checksum"] = f"md5={info.md5}"
+        oldGid = task.gid
+        path = task.fileRelativePath
+        AppLogger().warning(
+            f"{info.modName.mainName}（gid={oldGid}）的MD5校验失败，第{retries + 1}次重新下载：{uris}"
+        )
+        # 先从映射中移除，这样后续的快照中就不会再包含这个任务
+        self.gidToInfo.pop(oldGid)
+
+        def removeAndAddAgain() -> str:
+            self.client.removeDownloadResult(oldGid)
+            # 损坏的文件
+            if os.path.exists(path):
+                os.remove(path)
+            return self.client.addUri(uris, options, self.scheduler.taskPosition(info.isPriority))
+
+        def afterAddAgain(newGid: str):
+            self.gidToInfo[newGid] = info
+            self._saveTasks()
+            self.tasksChanged.emit()
+
+        def whenAddAgainError(error: Exception):
+            AppLogger().error(f"重新下载{info.modName.mainName}时发生错误：{error}")
+            self._saveTasks()
+            self.tasksChanged.emit()
+
+        (self.rpc.call(removeAndAddAgain).then(afterAddAgain).catch(whenAddAgainError).done())
+
+    def _onDownloadComplete(self, gid: str):
+        if gid not in self.gidToInfo:
+            return
+
+        def afterTellStatus(response: dict):
+            if gid not in self.gidToInfo:
+                return
+            task = ModDownloadTaskInfo(response["result"], self.gidToInfo[gid])
+            self.moveCompletedTasksToImportDispatcher([task])
+            self.tasksChanged.emit()
+
+        (
+            self.rpc.tellStatus(gid, ModDownloadTaskInfo.ARIA2_RPC_KEYS)
+            .then(afterTellStatus)
+            .catch(lambda error: AppLogger().warning(f"获取任务{gid}的状态时发生错误：{error}"))
+            .done()
+        )
 
 
 def test1():
@@ -185,21 +753,14 @@ def test2():
     )
 
     def poll():
-        infoList = ModDownloadManager.getInstance().retrieveActive()
-        AppLogger().debug(
-            "aria2.tellActive"
-            + str([(info.installationInfo.modName, info.status) for info in infoList])
-        )
-        infoList = ModDownloadManager.getInstance().retrieveWaiting()
-        AppLogger().debug(
-            "aria2.tellWaiting"
-            + str([(info.installationInfo.modName, info.status) for info in infoList])
-        )
-        infoList = ModDownloadManager.getInstance().retrieveStopped()
-        AppLogger().debug(
-            "aria2.tellStopped"
-            + str([(info.installationInfo.modName, info.status) for info in infoList])
-        )
+        # refresh是异步的，这里打印的是上一次刷新得到的快照
+        ModDownloadManager.getInstance().refresh()
+        snapshot = ModDownloadManager.getInstance().retrieveAll()
+        for name, infoList in snapshot._asdict().items():
+            AppLogger().debug(
+                f"aria2.tell{name.capitalize()}"
+                + str([(info.installationInfo.modName, info.status) for info in infoList])
+            )
 
     timer = QTimer()
     timer.setInterval(1000)
@@ -217,6 +778,7 @@ def test3():
     ModDownloadManager.getInstance().addTask(mod)
 
     def poll():
+        ModDownloadManager.getInstance().refresh()
         infoList = ModDownloadManager.getInstance().retrieveActive()
         AppLogger().debug(f"len(aria2.tellActive) == {len(infoList)}")
 
@@ -0,0 +1,30 @@
+import json
+from PySide6.QtWidgets import QApplication
+from qfluentwidgets import QObject
+
+from common.mod.mod_data import ModData
+from common.qrequest import QDataPromise, QPromise, QRequestReady
+
+MOD_FILE_URL = "https://api.pavlov-toolbox.rech.asia/modio/v1/games/3959/mods/%d/files/%d/"
+
+
+def getModFileMd5(parent: QObject, modData: ModData) -> QPromise:
+    """获取Mod当前（Windows平台）的文件的MD5，Mod数据中有时直接使用，没有时才请求Api"""
+    if modData.fileMd5:
+        return QDataPromise(modData.fileMd5)
+    return (
+        QRequestReady(parent)
+        .get(MOD_FILE_URL % (modData.resourceId, modData.taint))
+        .then(lambda content: str(json.loads(content)["filehash"]["md5"]))
+    )
+
+
+if __name__ == "__main__":
+    app = QApplication()
+    (
+        getModFileMd5(app, ModData.constructFromApi(2803451))
+        .then(lambda md5: print(md5))
+        .catch(lambda error: print(error))
+        .done()
+    )
+    app.exec()
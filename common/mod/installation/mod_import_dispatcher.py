@@ -1,20 +1,43 @@
-import hashlib
+import heapq
+import itertools
+import json
 import os
 import random
-import shutil
+import threading
 import time
-from typing import Dict, List, NamedTuple
+from typing import Callable, Dict, List, NamedTuple, Tuple
 from uuid import uuid4
 import zipfile
 
 from PySide6.QtCore import QRunnable, QThreadPool
-import requests
 import app_config
 from common.log import AppLogger
 from common.mod.installation.extra_info import ModInstallationInfo
+from common.mod.installation.mod_archive import (
+    FileSizeMismatchException,
+    ImportCancelledException,
+    ImportProgress,
+    ManifestEntry,
+    Md5MismatchException,
+    buildManifest,
+    diffInstalledMod,
+    extractArchive,
+    loadInstalledManifest,
+    saveInstalledManifest,
+    stageManifestDiff,
+    writeTaintFile,
+)
 from common.mod.installation.mod_name import ModName
-from common.mod.installation.path import getModInstallationDir
+from common.mod.installation.mod_partial_update import PartialUpdatePlan, applyPartialUpdate
+from common.mod.installation.mod_trash import ModTrashCollector
+from common.mod.installation.path import (
+    GetModInstallationDirException,
+    getModInstallationDir,
+    getModStagingDir,
+)
 from common.mod.mod_data import ModData
+from common.path import getVolume
+from common.utils import hashFile
 
 
 class ModImportTaskStatus(NamedTuple):
@@ -22,6 +45,14 @@ class ModImportTaskStatus(NamedTuple):
     installationInfo: ModInstallationInfo
     finished: bool
     error: Exception | None
+    isQueued: bool = False
+    """是否还在排队等待导入"""
+    completedBytes: int = 0
+    """已经处理（计算哈希、解压或下载）的字节数"""
+    totalBytes: int = 0
+    """需要处理的总字节数，开始导入前为0"""
+    isCancellable: bool = False
+    """是否可以取消（排队中或还没有开始写入安装目录）"""
 
 
 class ModImportTaskDispatcher:
@@ -32,11 +63,21 @@ class ModImportTaskDispatcher:
 
     - 向调度器添加任务，调度器会自动执行任务，且不阻塞主线程。
     - 添加任务时，返回一个gid，用于关闭任务
-    - 使用tellAllStatus方法可以获取所有任务的执行状态
-    - 正在执行的任务不可中断
+    - 使用tellAllStatus方法可以获取所有任务的执行状态（包括进度）
+    - 使用cancelTask方法可以取消排队中或正在执行的任务；正在执行的任务是协作式取消的，
+      开始替换安装目录中的Mod后不可取消
     - 使用close方法可以关闭已经完成的任务
+
+    导入任务在专用的线程池中执行（不与Qt的全局线程池共用）。同时写入同一个卷的任务过多时会相互拖慢，
+    因此每个目标卷同时导入的任务数不超过maxImportsPerVolume（保存在`app_config.IMPORT_SCHEDULE_PATH`中），
+    其余任务排队，压缩包小的先导入，使单位时间内完成的Mod尽量多。使用queueDepth获取排队中的任务数。
     """
 
+    # 每个目标卷默认同时导入的任务数
+    DEFAULT_MAX_IMPORTS_PER_VOLUME = 2
+    # 导入线程池的线程数上限（所有卷加起来）
+    MAX_THREADS = 8
+
     _instance: "ModImportTaskDispatcher | None" = None
 
     @classmethod
@@ -56,31 +97,156 @@ class ModImportTaskDispatcher:
 
     def __init__(self) -> None:
         self.tasks: Dict[str, ModImportWorker] = {}
-        self.threadpool = QThreadPool.globalInstance()
-
-    def addTask(self, gid: str, zipFilePath: str, info: ModInstallationInfo):
-        # AppLogger().debug(f"正在为{modData}启动导入线程")
-        worker = ModImportWorker(zipFilePath, info)
-        print(id(worker))
-        self.threadpool.start(worker)
-        self.tasks[gid] = worker
+        self.threadpool = QThreadPool()
+        self.threadpool.setMaxThreadCount(self.MAX_THREADS)
+        self.maxImportsPerVolume = self.DEFAULT_MAX_IMPORTS_PER_VOLUME
+        self._loadSettings()
+        # 以下状态会在导入线程中修改（任务结束时），需要加锁
+        self.lock = threading.Lock()
+        # 排队中的任务，(压缩包大小, 加入顺序, gid)的小根堆
+        self.queue: List[Tuple[int, int, str]] = []
+        self.sequence = itertools.count()
+        # 各个卷正在导入的任务数
+        self.runningPerVolume: Dict[str, int] = {}
+
+    def _loadSettings(self):
+        if not os.path.exists(app_config.IMPORT_SCHEDULE_PATH):
+            return
+        try:
+            with open(app_config.IMPORT_SCHEDULE_PATH, "r", encoding="utf-8") as f:
+                obj: dict = json.load(f)
+            self.maxImportsPerVolume = max(
+                1, int(obj.get("maxImportsPerVolume", self.DEFAULT_MAX_IMPORTS_PER_VOLUME))
+            )
+        except (OSError, ValueError) as e:
+            AppLogger().warning(f"读取导入调度设置时发生错误：{e}")
+
+    def _saveSettings(self):
+        os.makedirs(os.path.dirname(app_config.IMPORT_SCHEDULE_PATH), exist_ok=True)
+        with open(app_config.IMPORT_SCHEDULE_PATH, "w", encoding="utf-8") as f:
+            json.dump({"maxImportsPerVolume": self.maxImportsPerVolume}, f)
+
+    def setMaxImportsPerVolume(self, n: int):
+        """设置每个目标卷同时导入的任务数（至少为1）"""
+        self.maxImportsPerVolume = max(1, n)
+        self._saveSettings()
+        AppLogger().info(f"设置每个卷同时导入的任务数为{self.maxImportsPerVolume}")
+        with self.lock:
+            self._schedule()
+
+    @property
+    def queueDepth(self) -> int:
+        """排队中（还没有开始导入）的任务数"""
+        with self.lock:
+            return len(self.queue)
+
+    def addTask(
+        self,
+        gid: str,
+        zipFilePath: str,
+        info: ModInstallationInfo,
+        isDeltaInstallEnabled: bool = True,
+    ):
+        worker = ModImportWorker(zipFilePath, info, isDeltaInstallEnabled)
+        try:
+            size = os.path.getsize(zipFilePath)
+        except OSError:
+            size = 0
+        self._enqueue(gid, worker, size, _getTargetVolume())
+
+    def addPartialUpdateTask(
+        self,
+        plan: PartialUpdatePlan,
+        info: ModInstallationInfo,
+        onFailed: Callable[[Exception], None] | None = None,
+    ) -> str:
+        """添加部分更新任务（只下载有变化的文件），返回任务的gid
+
+        部分更新出错时（不包括被取消）会在导入线程中调用onFailed，调用者应改为完整下载。
+        """
+        gid = uuid4().hex
+        worker = ModPartialUpdateWorker(plan, info, onFailed)
+        self._enqueue(gid, worker, plan.downloadSize, _getTargetVolume())
+        return gid
 
     def addMockTask(self, n: int = 1):
         for _ in range(n):
             gid = uuid4().hex
             worker = MockModImportWorker()
-            # 运行后不要自动删除对象
-            # worker.setAutoDelete(False)
-            self.threadpool.start(worker)
+            self._enqueue(gid, worker, random.randint(0, 100 * 1024 * 1024), "mock")
+
+    def _enqueue(self, gid: str, worker: "ModImportWorker", size: int, volume: str):
+        worker.volume = volume
+        worker.onFinished = self._onWorkerFinished
+        with self.lock:
             self.tasks[gid] = worker
+            heapq.heappush(self.queue, (size, next(self.sequence), gid))
+            self._schedule()
+            AppLogger().info(
+                f"导入队列：{len(self.queue)}个任务排队，各卷正在导入的任务数{self.runningPerVolume}"
+            )
+
+    def _schedule(self):
+        """按照压缩包从小到大的顺序启动所在卷还有空位的任务，调用时需要持有锁"""
+        blocked: List[Tuple[int, int, str]] = []
+        while self.queue:
+            item = heapq.heappop(self.queue)
+            worker = self.tasks[item[2]]
+            running = self.runningPerVolume.get(worker.volume, 0)
+            if running >= self.maxImportsPerVolume:
+                blocked.append(item)
+                continue
+            self.runningPerVolume[worker.volume] = running + 1
+            worker.isQueued = False
+            self.threadpool.start(worker)
+        for item in blocked:
+            heapq.heappush(self.queue, item)
+
+    def _onWorkerFinished(self, worker: "ModImportWorker"):
+        """在导入线程中调用，释放所在卷的空位并启动排队中的任务"""
+        with self.lock:
+            self.runningPerVolume[worker.volume] -= 1
+            self._schedule()
 
     def retrieveAllStatus(self) -> List[ModImportTaskStatus]:
-        # AppLogger().debug(self.tasks)
         return [
-            ModImportTaskStatus(gid, worker.info, worker.finished, worker.error)
-            for gid, worker in self.tasks.items()
+            ModImportTaskStatus(
+                gid,
+                worker.info,
+                worker.finished,
+                worker.error,
+                worker.isQueued,
+                worker.progress.completedBytes,
+                worker.progress.totalBytes,
+                not worker.finished and worker.progress.isCancellable,
+            )
+            for gid, worker in list(self.tasks.items())
         ]
 
+    def cancelTask(self, gid: str) -> bool:
+        """取消任务，返回取消请求是否被接受
+
+        排队中的任务直接结束；正在执行的任务会在下一次更新进度时停止并清理暂存目录，
+        结束后的错误为ImportCancelledException。
+        """
+        with self.lock:
+            worker = self.tasks.get(gid)
+            if worker is None or worker.finished:
+                return False
+            if worker.isQueued:
+                self.queue = [item for item in self.queue if item[2] != gid]
+                heapq.heapify(self.queue)
+                worker.isQueued = False
+                worker.error = ImportCancelledException()
+                worker.finished = True
+                AppLogger().info(f"取消了排队中的导入任务{worker.info.modData}")
+                return True
+        isAccepted = worker.progress.cancel()
+        AppLogger().info(
+            f"{'请求取消' if isAccepted else '无法取消'}正在执行的导入任务{worker.info.modData}"
+        )
+        return isAccepted
+
     def removeFinishedTask(self, gid: str):
         if gid not in self.tasks:
             AppLogger().warning(f"要移除的导入任务不存在（gid={gid}）")
@@ -88,108 +254,277 @@ class ModImportTaskDispatcher:
         if not self.tasks[gid].finished:
             AppLogger().warning(f"要移除的导入任务未结束（gid={gid}）")
             return
-        del self.tasks[gid]
+        with self.lock:
+            del self.tasks[gid]
 
 
 class ModImportWorker(QRunnable):
-    def __init__(self, zipFilePath: str, info: ModInstallationInfo):
+    def __init__(
+        self, zipFilePath: str, info: ModInstallationInfo, isDeltaInstallEnabled: bool = True
+    ):
+        """构造函数
+
+        Args:
+            zipFilePath (str): 下载好的压缩包
+            info (ModInstallationInfo): Mod安装信息
+            isDeltaInstallEnabled (bool, optional): 已经安装过该Mod（有清单）时，是否只写入有变化的文件.
+                Defaults to True.
+        """
         super().__init__()
         self.zipFilePath: str = zipFilePath
         self.info: ModInstallationInfo = info
+        self.isDeltaInstallEnabled = isDeltaInstallEnabled
         self.finished: bool = False
         self.error: Exception | None = None
+        self.isQueued: bool = True
+        self.progress = ImportProgress()
+        # 以下两项由调度器在加入队列时设置
+        self.volume: str = ""
+        """目标卷"""
+        self.onFinished: Callable[[ModImportWorker], None] | None = None
+        # 调度器持有任务对象，运行后不要自动删除
+        self.setAutoDelete(False)
 
     def run(self):
+        try:
+            self.work()
+        finally:
+            self.finished = True
+            if self.onFinished is not None:
+                self.onFinished(self)
+
+    def work(self):
         try:
             AppLogger().info(f"开始导入{self.info.modData}")
-            _importMod(self.zipFilePath, self.info.modData)
+            _importMod(self.zipFilePath, self.info, self.isDeltaInstallEnabled, self.progress)
         except Exception as e:
             AppLogger().info(f"导入{self.info.modData}时发生错误：{e}")
             self.error = e
         finally:
             AppLogger().info(f"导入{self.info.modData}结束")
-            self.finished = True
 
 
-def _importMod(zipFilePath: str, modData: ModData):
+class ModPartialUpdateWorker(ModImportWorker):
+    """按照部分更新计划下载有变化的文件并更新已安装的Mod，状态的查询方式与导入任务相同
+
+    与完整导入一样在暂存目录中生成新的Mod目录，然后通过重命名替换。
+    """
+
+    def __init__(
+        self,
+        plan: PartialUpdatePlan,
+        info: ModInstallationInfo,
+        onFailed: Callable[[Exception], None] | None = None,
+    ):
+        super().__init__("", info)
+        self.plan = plan
+        self.onFailed = onFailed
+
+    def work(self):
+        modData = self.info.modData
+        try:
+            AppLogger().info(f"开始部分更新{modData}，需要下载{self.plan.downloadSize}字节")
+            workDir = os.path.join(
+                app_config.TEMP_IMPORT_MOD_DIR, f"partial_UGC{modData.resourceId}"
+            )
+            _installStaged(
+                modData.resourceId,
+                self.plan.modDir,
+                lambda stagedDir: applyPartialUpdate(
+                    self.plan, str(modData.taint), workDir, stagedDir, progress=self.progress
+                ),
+                self.progress,
+            )
+        except Exception as e:
+            AppLogger().info(f"部分更新{modData}时发生错误：{e}")
+            self.error = e
+            # 被用户取消时不再完整下载
+            if self.onFailed is not None and not isinstance(e, ImportCancelledException):
+                self.onFailed(e)
+        finally:
+            AppLogger().info(f"部分更新{modData}结束")
+
+
+def _getTargetVolume() -> str:
+    """导入的目标卷（Mod安装目录所在的卷）"""
+    try:
+        return getVolume(getModInstallationDir())
+    except GetModInstallationDirException:
+        return ""
+
+
+def _importMod(
+    zipFilePath: str,
+    info: ModInstallationInfo,
+    isDeltaInstallEnabled: bool = True,
+    progress: ImportProgress | None = None,
+):
     """导入Mod
 
-    分为哈希校验，解压、补全、移动文件夹四个步骤"""
-    _md5Check(zipFilePath, modData)
-    # 定义该Mod解压补全时的临时目录路径
-    tempDir = os.path.join(app_config.TEMP_IMPORT_MOD_DIR, f"UGC{modData.resourceId}")
-    _unzipModData(tempDir, zipFilePath)
-    _writeTaintFile(tempDir, str(modData.taint))
-    _moveModTempDirToInstallationDir(tempDir)
+    分为解压（同时校验哈希）、补全、替换Mod目录三个步骤。
+    解压到与安装目录在同一个卷上的暂存目录中（见getModStagingDir），完成后通过重命名替换旧的Mod目录，
+    因此所有文件只会写入一遍，游戏也不会看到写了一半的Mod。
+    压缩包只会被顺序读取一遍，MD5不匹配时不会替换安装目录中的Mod。
+    下载器已经校验过MD5时（info.md5不为None），不再校验。
+    校验用的大小和MD5来自Mod数据（见_getExpectedMd5），导入时不会有任何网络请求。
+
+    安装后会在Mod目录中保存各文件的大小和CRC32（清单），更新时如果有清单，则进行增量更新（见_deltaImportMod），
+    增量更新同样在暂存目录中进行。
+
+    progress不为None时会更新进度，被取消时暂存目录会被移动到回收区，然后抛出ImportCancelledException"""
+    modData = info.modData
+    modDir = os.path.join(getModInstallationDir(), f"UGC{modData.resourceId}")
+    if isDeltaInstallEnabled and os.path.isdir(modDir):
+        installedManifest = loadInstalledManifest(modDir)
+        if installedManifest is not None:
+            _deltaImportMod(zipFilePath, info, modDir, installedManifest, progress)
+            return
+    expectedMd5 = _getExpectedMd5(zipFilePath, info)
+
+    def build(stagedDir: str):
+        _unzipModData(stagedDir, zipFilePath, expectedMd5, info.md5 is not None, progress)
+        writeTaintFile(stagedDir, str(modData.taint))
+        with zipfile.ZipFile(zipFilePath, "r") as zipFile:
+            saveInstalledManifest(stagedDir, buildManifest(zipFile.infolist()))
+
+    _installStaged(modData.resourceId, modDir, build, progress)
     # 安装完成后删除原始文件
     os.remove(zipFilePath)
 
 
-class Md5MismatchException(Exception):
-    def __str__(self) -> str:
-        return "MD5不匹配"
+def _deltaImportMod(
+    zipFilePath: str,
+    info: ModInstallationInfo,
+    modDir: str,
+    installedManifest: Dict[str, ManifestEntry],
+    progress: ImportProgress | None = None,
+):
+    """增量更新已经安装的Mod
 
+    根据压缩包中央目录中的大小和CRC32与清单比较，只解压有变化的文件（以及磁盘上大小不对或不存在的文件），
+    没有变化的文件从已安装的Mod目录硬链接到暂存目录，完成后与完整导入一样通过重命名替换，详见stageManifestDiff。
+    替换前都可以取消，MD5不匹配时不会替换安装目录中的Mod。
+    """
+    modData = info.modData
+    expectedMd5 = _getExpectedMd5(zipFilePath, info)
+    if expectedMd5 is not None:
+        if progress is not None:
+            progress.addTotal(os.path.getsize(zipFilePath))
+        localMd5 = hashFile(zipFilePath, onProgress=progress.advance if progress else None)
+        if localMd5 != expectedMd5.lower():
+            raise Md5MismatchException()
+
+    def build(stagedDir: str):
+        with open(zipFilePath, "rb") as f, zipfile.ZipFile(f, "r") as zipFile:
+            infos = zipFile.infolist()
+            diff = diffInstalledMod(infos, modDir, installedManifest)
+            # 只有MD5校验过（下载时或上面）才直接复制未压缩的文件，否则经过zipfile读取以校验CRC32
+            isMd5Verified = info.md5 is not None or expectedMd5 is not None
+            archiveFd = f.fileno() if isMd5Verified else None
+            stageManifestDiff(
+                modDir, stagedDir, zipFile, diff, str(modData.taint), archiveFd, progress
+            )
+        AppLogger().info(
+            f"增量更新{modData}：写入{len(diff.changedInfos)}个，删除{len(diff.removedNames)}个，"
+            f"{len(infos) - len(diff.changedInfos)}个没有变化"
+        )
 
-MD5_URL = "https://api.pavlov-toolbox.rech.asia/modio/v1/games/3959/mods/%d/files/%d/"
+    _installStaged(modData.resourceId, modDir, build, progress)
+    os.remove(zipFilePath)
 
 
-def _md5Check(filePath: str, modData: ModData):
-    response = requests.get(MD5_URL % (modData.resourceId, modData.taint))
-    response.raise_for_status()
-    resultObj = response.json()
-    targetMd5 = resultObj["filehash"]["md5"]
-    with open(filePath, "rb") as f:
-        bytes = f.read()  # read file as bytes
-        localMd5 = hashlib.md5(bytes).hexdigest()
-    if localMd5 != targetMd5:
-        raise Md5MismatchException()
+def _getExpectedMd5(zipFilePath: str, info: ModInstallationInfo) -> str | None:
+    """检查压缩包的大小，返回导入时需要校验的MD5（不需要或无法校验时为None）
 
+    大小和MD5都来自Mod数据（info.fileSize和info.fileMd5），不会发出网络请求。
 
-def _unzipModData(outputDir: str, zipFilePath: str):
-    # 如果输出目录存在，则清空
-    if os.path.exists(outputDir):
-        shutil.rmtree(outputDir)
-    else:
-        os.makedirs(outputDir)
+    Raises:
+        FileSizeMismatchException: 压缩包的大小与Mod数据中的不一致
+    """
+    modData = info.modData
+    if info.fileSize is not None and os.path.getsize(zipFilePath) != info.fileSize:
+        raise FileSizeMismatchException(os.path.getsize(zipFilePath), info.fileSize)
+    if info.md5 is not None:
+        AppLogger().info(f"{modData}的MD5已经在下载时校验过，跳过哈希校验")
+        return None
+    if info.fileMd5 is None:
+        AppLogger().warning(f"{modData}的Mod数据中没有MD5，只检查了文件大小，跳过哈希校验")
+        return None
+    return info.fileMd5
+
+
+def _unzipModData(
+    outputDir: str,
+    zipFilePath: str,
+    expectedMd5: str | None = None,
+    isMd5Verified: bool = False,
+    progress: ImportProgress | None = None,
+):
+    os.makedirs(outputDir)
     outputDir = os.path.join(outputDir, "Data")
-    # 使用zipfile模块解压ZIP文件到目标目录
-    with zipfile.ZipFile(zipFilePath, "r") as zip_file:
-        zip_file.extractall(outputDir)
-
-
-def _writeTaintFile(outputDir: str, content: str):
-    taintFilePath = os.path.join(outputDir, "taint")
-    with open(taintFilePath, "w", encoding="utf-8") as file:
-        file.write(content)
-
-
-def _moveModTempDirToInstallationDir(sourceDir: str):
-    r"""将Mod从临时目录移动到安装目录"""
-    modInstallationDir = getModInstallationDir()
-    # 判断安装目录是否存在，如果不存在则新建
-    if not os.path.exists(modInstallationDir):
-        os.makedirs(modInstallationDir)
-    # 获取源目录最后一段（即目录名称）
-    modDirName = os.path.basename(sourceDir)
-    targetDir = os.path.join(modInstallationDir, modDirName)
-    # 如果目录存在，使用shutil递归删除目录
+    extractArchive(
+        zipFilePath, outputDir, expectedMd5, progress=progress, isMd5Verified=isMd5Verified
+    )
+
+
+def _installStaged(
+    resourceId: int,
+    modDir: str,
+    build: Callable[[str], None],
+    progress: ImportProgress | None = None,
+):
+    """调用build在暂存目录中生成新的Mod目录，然后替换安装目录中的Mod目录（见_swapStagedModDir）
+
+    替换前才禁止取消。出错或被取消时暂存目录被移动到回收区，安装目录中的Mod保持不变。
+    """
+    stagedDir = os.path.join(getModStagingDir(), f"UGC{resourceId}")
+    # 如果暂存目录存在（上次导入残留），则移动到回收区（无法移动时直接删除），之后可以马上重新创建
+    if os.path.exists(stagedDir):
+        ModTrashCollector.getInstance().moveToTrash(stagedDir)
+    try:
+        build(stagedDir)
+        if progress is not None:
+            progress.disableCancellation()
+        _swapStagedModDir(stagedDir, modDir)
+    except Exception:
+        if os.path.exists(stagedDir):
+            ModTrashCollector.getInstance().moveToTrash(stagedDir)
+        raise
+
+
+def _swapStagedModDir(stagedDir: str, targetDir: str):
+    """用暂存目录替换安装目录中的Mod目录
+
+    暂存目录与安装目录在同一个卷上，新的Mod目录通过一次重命名就位。
+    已有的旧目录先被重命名到暂存目录中（同样只是重命名），新目录就位后移动到回收区在后台删除；
+    新目录无法就位时，旧目录会被恢复。
+    """
+    oldDir = None
     if os.path.exists(targetDir):
-        shutil.rmtree(targetDir)
-    # 使用shutil移动目录
-    shutil.move(sourceDir, targetDir)
+        oldDir = os.path.join(
+            os.path.dirname(stagedDir), f"old_{os.path.basename(targetDir)}_{uuid4().hex}"
+        )
+        os.rename(targetDir, oldDir)
+    try:
+        os.rename(stagedDir, targetDir)
+    except OSError:
+        if oldDir is not None:
+            os.rename(oldDir, targetDir)
+        raise
+    if oldDir is not None:
+        ModTrashCollector.getInstance().moveToTrash(oldDir)
 
 
 class MockModImportWorker(ModImportWorker):
     def __init__(self):
         super().__init__("", ModInstallationInfo(ModData({}), ModName("", ""), [""]))
 
-    def run(self):
+    def work(self):
         # 随机休眠[2, 5]秒模拟耗时
         time.sleep(random.uniform(2, 5))
         # 一半概率有错误
         if random.choice([True, False]):
             self.error = Exception("模拟错误")
-        self.finished = True
 
 
 if __name__ == "__main__":
@@ -199,6 +534,9 @@ if __name__ == "__main__":
     # time.sleep(4)
     # print(modImportDispatcher.retrieveAllStatus())
     mod = ModData.constructFromApi(2803451)
-    _md5Check(
-        r"C:\Users\kongc\AppData\Local\Temp\PavlovToolboxTemp\downloads\modfile_2803451.87.zip", mod
+    print(
+        mod.fileMd5
+        == hashFile(
+            r"C:\Users\kongc\AppData\Local\Temp\PavlovToolboxTemp\downloads\modfile_2803451.87.zip"
+        )
     )
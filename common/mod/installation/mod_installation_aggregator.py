@@ -44,25 +44,18 @@ class ModInstallationStatus:
     errorReason: str = ""
 
 
-def _moveCompletedDownloadTaskToImportManager():
-    """将下载管理器中的已完成任务移动到导入管理器"""
-    downloadManager = ModDownloadManager.getInstance()
-    importManager = ModImportTaskDispatcher.getInstance()
-    for task in downloadManager.retrieveStopped():
-        if task.status == "complete":
-            importManager.addTask(task.gid, task.fileRelativePath, task.installationInfo)
-            downloadManager.removeStoppedTask(task.gid)
-
-
 def aggregateModInstallationStatus() -> List[ModInstallationStatus]:
-    """从下载管理器和导入管理器中聚合安装信息"""
-    _moveCompletedDownloadTaskToImportManager()
+    """从下载管理器和导入管理器中聚合安装信息
+
+    下载任务的信息来自ModDownloadManager的快照，需要最新的信息时请先调用其refresh方法"""
     downloadManager = ModDownloadManager.getInstance()
     importDispatcher = ModImportTaskDispatcher.getInstance()
+    # 使用下载管理器最近一次刷新得到的快照，不会请求aria2，因此可以在主线程中调用
+    snapshot = downloadManager.retrieveAll()
     result: List[ModInstallationStatus] = []
 
     # 等待下载
-    for task in downloadManager.retrieveWaiting():
+    for task in snapshot.waiting:
         result.append(
             ModInstallationStatus(
                 stage=ModInstallationStage.waiting,
@@ -71,7 +64,7 @@ def aggregateModInstallationStatus() -> List[ModInstallationStatus]:
         )
 
     # 下载中
-    for task in downloadManager.retrieveActive():
+    for task in snapshot.active:
         result.append(
             ModInstallationStatus(
                 stage=ModInstallationStage.downloading,
@@ -80,7 +73,7 @@ def aggregateModInstallationStatus() -> List[ModInstallationStatus]:
         )
 
     # 下载失败
-    for task in downloadManager.retrieveStopped():
+    for task in snapshot.stopped:
         if task.status == "error":
             result.append(
                 ModInstallationStatus(
@@ -115,6 +108,7 @@ def test1():
     app = QApplication()
 
     def poll():
+        ModDownloadManager.getInstance().refresh()
         result = aggregateModInstallationStatus()
         AppLogger().debug(result)
 
@@ -0,0 +1,360 @@
+import bisect
+import io
+import os
+import re
+import shutil
+from typing import BinaryIO, Iterator, List, NamedTuple, Tuple
+import zipfile
+import requests
+
+from common.log import AppLogger
+from common.mod.installation.mod_archive import (
+    ImportProgress,
+    ManifestDiff,
+    diffInstalledMod,
+    loadInstalledManifest,
+    stageManifestDiff,
+)
+
+# 第一次请求文件末尾的字节数，包含结束记录（22字节）和最长的注释（65535字节），一般也能包含整个中央目录
+TAIL_SIZE = 64 * 1024 + 22
+# 两个需要下载的范围之间的间隔不超过这个值时合并为一个请求
+RANGE_MERGE_GAP = 64 * 1024
+# 需要下载的数据超过整个压缩包的这个比例时，不如直接完整下载（可以使用镜像站和多个连接）
+MAX_PARTIAL_RATIO = 0.7
+# 请求的超时时间（秒）
+REQUEST_TIMEOUT = 30
+# 下载时每次写入的大小
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+
+class PartialUpdateUnsupportedException(Exception):
+    """服务器不支持Range请求，或者文件在更新过程中发生了变化"""
+
+    def __init__(self, details: str) -> None:
+        super().__init__(details)
+
+
+class _NeedMoreDataException(Exception):
+    """解析中央目录时读到了还没有下载的位置"""
+
+    def __init__(self, position: int) -> None:
+        super().__init__(position)
+        self.position = position
+
+
+class SegmentedArchiveFile:
+    """只下载了部分范围的远程压缩包，交给zipfile.ZipFile读取
+
+    已经下载的范围依次保存在一个本地文件中，segments记录每个范围在压缩包中的位置[start, end)和在本地文件中的位置。
+    读取没有下载的位置时抛出OSError（isMissingRaisesNeedMore为True时抛出_NeedMoreDataException，用于解析中央目录）。
+    """
+
+    def __init__(self, localFile: BinaryIO, size: int) -> None:
+        self.localFile = localFile
+        self.size = size
+        # (start, end, localOffset)，按start排序
+        self.segments: List[Tuple[int, int, int]] = []
+        self.position = 0
+        self.isMissingRaisesNeedMore = False
+
+    def addSegment(self, start: int, data: bytes):
+        localOffset = self.localFile.seek(0, os.SEEK_END)
+        self.localFile.write(data)
+        bisect.insort(self.segments, (start, start + len(data), localOffset))
+
+    def appendSegmentFrom(self, start: int, chunks) -> int:
+        """把可迭代的chunks作为从start开始的范围写入本地文件，返回写入的字节数"""
+        localOffset = self.localFile.seek(0, os.SEEK_END)
+        size = 0
+        for chunk in chunks:
+            self.localFile.write(chunk)
+            size += len(chunk)
+        bisect.insort(self.segments, (start, start + size, localOffset))
+        return size
+
+    def read(self, n: int = -1) -> bytes:
+        if n < 0:
+            n = self.size - self.position
+        n = min(n, self.size - self.position)
+        result = bytearray()
+        # 读取的范围可能跨过多个相邻的范围
+        while len(result) < n:
+            index = bisect.bisect_right(self.segments, (self.position, float("inf"), 0)) - 1
+            if index < 0 or not self.segments[index][0] <= self.position < self.segments[index][1]:
+                if self.isMissingRaisesNeedMore:
+                    raise _NeedMoreDataException(self.position)
+                raise OSError(f"位置{self.position}的数据没有下载")
+            start, end, localOffset = self.segments[index]
+            self.localFile.seek(localOffset + self.position - start)
+            data = self.localFile.read(min(n - len(result), end - self.position))
+            if not data:
+                break
+            result += data
+            self.position += len(data)
+        return bytes(result)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_SET:
+            self.position = offset
+        elif whence == os.SEEK_CUR:
+            self.position += offset
+        else:
+            self.position = self.size + offset
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+    def seekable(self) -> bool:
+        return True
+
+
+class PartialUpdatePlan(NamedTuple):
+    url: str
+    """跟随重定向后的下载地址"""
+    validator: str | None
+    """强ETag或Last-Modified，通过If-Range保证各次请求得到的是同一个文件"""
+    archiveSize: int
+    modDir: str
+    diff: ManifestDiff
+    tailStart: int
+    """tail在压缩包中的位置"""
+    tail: bytes
+    """压缩包末尾的数据，包含整个中央目录"""
+    ranges: List[Tuple[int, int]]
+    """需要下载的范围[start, end)，已经合并"""
+
+    @property
+    def downloadSize(self) -> int:
+        return sum(end - start for start, end in self.ranges)
+
+
+def _parseContentRange(response: requests.Response) -> Tuple[int, int, int]:
+    """返回(start, end, total)，end不包含"""
+    match = re.fullmatch(r"bytes (\d+)-(\d+)/(\d+)", response.headers.get("Content-Range", ""))
+    if response.status_code != 206 or match is None:
+        raise PartialUpdateUnsupportedException(
+            f"服务器没有返回部分内容（status={response.status_code}）"
+        )
+    return int(match.group(1)), int(match.group(2)) + 1, int(match.group(3))
+
+
+def _getValidator(response: requests.Response) -> str | None:
+    """用作If-Range的验证器：强ETag，没有时使用Last-Modified
+
+    If-Range只接受强验证器，服务器对弱ETag（W/开头）总是返回完整的文件。
+    """
+    etag = response.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("Last-Modified")
+
+
+def _rangeHeaders(rangeValue: str, validator: str | None) -> dict:
+    headers = {"Range": f"bytes={rangeValue}"}
+    if validator:
+        # 文件变化时服务器会返回完整的文件（200），而不是部分内容
+        headers["If-Range"] = validator
+    return headers
+
+
+def _mergeRanges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start - merged[-1][1] <= RANGE_MERGE_GAP:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def planPartialUpdate(
+    url: str, modDir: str, session: requests.Session | None = None
+) -> PartialUpdatePlan | None:
+    """通过Range请求获取远程压缩包的中央目录，与已安装的Mod的清单比较，得到需要下载的范围
+
+    已安装的Mod没有清单，或者需要下载的数据太多（超过MAX_PARTIAL_RATIO）时返回None，此时应完整下载。
+
+    Raises:
+        PartialUpdateUnsupportedException: 服务器不支持Range请求
+        requests.exceptions.RequestException: 请求失败
+        zipfile.BadZipFile: 压缩包格式错误
+    """
+    installedManifest = loadInstalledManifest(modDir)
+    if installedManifest is None:
+        return None
+    session = session or requests.Session()
+    # 使用stream=True，在读取响应体之前检查是否是部分内容，
+    # 服务器忽略Range返回完整的文件（200）时直接关闭连接，不会把整个压缩包下载一遍
+    with session.get(
+        url, headers=_rangeHeaders(f"-{TAIL_SIZE}", None), stream=True, timeout=REQUEST_TIMEOUT
+    ) as response:
+        response.raise_for_status()
+        tailStart, _, archiveSize = _parseContentRange(response)
+        tail = response.content
+        # 之后直接请求重定向后的地址
+        url = response.url
+        validator = _getValidator(response)
+    archive = SegmentedArchiveFile(io.BytesIO(), archiveSize)
+    archive.addSegment(tailStart, tail)
+    archive.isMissingRaisesNeedMore = True
+    try:
+        zipFile = zipfile.ZipFile(archive, "r")  # type: ignore
+    except _NeedMoreDataException as e:
+        # 中央目录比TAIL_SIZE大，补上前面的部分
+        with session.get(
+            url,
+            headers=_rangeHeaders(f"{e.position}-{tailStart - 1}", validator),
+            stream=True,
+            timeout=REQUEST_TIMEOUT,
+        ) as response:
+            response.raise_for_status()
+            _parseContentRange(response)
+            archive.addSegment(e.position, response.content)
+            tail = response.content + tail
+            tailStart = e.position
+        archive.isMissingRaisesNeedMore = False
+        zipFile = zipfile.ZipFile(archive, "r")  # type: ignore
+    with zipFile:
+        infos = zipFile.infolist()
+        centralDirectoryOffset: int = zipFile.start_dir  # type: ignore
+    diff = diffInstalledMod(infos, modDir, installedManifest)
+    # 每个文件的范围是从它的本地文件头到下一个文件的本地文件头（或中央目录），
+    # 已经在tail中的部分不需要再下载
+    offsets = sorted({info.header_offset for info in infos}) + [centralDirectoryOffset]
+    ranges = []
+    for info in diff.changedInfos:
+        if info.is_dir() or info.header_offset >= tailStart:
+            continue
+        nextOffset = offsets[bisect.bisect_right(offsets, info.header_offset)]
+        ranges.append((info.header_offset, min(nextOffset, tailStart)))
+    plan = PartialUpdatePlan(
+        url, validator, archiveSize, modDir, diff, tailStart, tail, _mergeRanges(ranges)
+    )
+    AppLogger().info(
+        f"部分更新{modDir}：{len(diff.changedInfos)}个文件有变化，需要下载{plan.downloadSize}/{archiveSize}字节"
+        f"（{len(plan.ranges)}个范围）"
+    )
+    if plan.downloadSize > archiveSize * MAX_PARTIAL_RATIO:
+        return None
+    return plan
+
+
+def _trackChunks(chunks: Iterator[bytes], progress: ImportProgress | None) -> Iterator[bytes]:
+    """按照下载的字节数更新进度（被取消时抛出ImportCancelledException）"""
+    for chunk in chunks:
+        if progress is not None:
+            progress.advance(len(chunk))
+        yield chunk
+
+
+def applyPartialUpdate(
+    plan: PartialUpdatePlan,
+    taint: str,
+    workDir: str,
+    stagedDir: str,
+    session: requests.Session | None = None,
+    progress: ImportProgress | None = None,
+):
+    """下载plan中的范围，然后在stagedDir中生成更新后的完整Mod目录（详见stageManifestDiff）
+
+    已安装的Mod不会被修改，之后由调用者通过重命名用stagedDir替换plan.modDir。
+    无法校验整个压缩包的MD5，每个文件解压时都会校验CRC32，各次请求通过If-Range保证来自同一个文件。
+
+    Args:
+        plan (PartialUpdatePlan): planPartialUpdate的结果
+        taint (str): 新版本的taint
+        workDir (str): 保存下载的数据的临时目录，结束后会被删除
+        stagedDir (str): 暂存目录，应与plan.modDir在同一个卷上且不存在，出错时需要调用者清理
+        progress (ImportProgress | None): 下载和写入的进度，可以取消
+
+    Raises:
+        PartialUpdateUnsupportedException: 文件在更新过程中发生了变化
+        requests.exceptions.RequestException: 请求失败
+        zipfile.BadZipFile: 数据损坏（CRC32不匹配）
+        ImportCancelledException: 下载完成前被取消
+    """
+    session = session or requests.Session()
+    if progress is not None:
+        progress.addTotal(plan.downloadSize)
+    os.makedirs(workDir, exist_ok=True)
+    try:
+        with open(os.path.join(workDir, "segments.bin"), "w+b") as localFile:
+            archive = SegmentedArchiveFile(localFile, plan.archiveSize)
+            for start, end in plan.ranges:
+                with session.get(
+                    plan.url,
+                    headers=_rangeHeaders(f"{start}-{end - 1}", plan.validator),
+                    stream=True,
+                    timeout=REQUEST_TIMEOUT,
+                ) as response:
+                    response.raise_for_status()
+                    if _parseContentRange(response)[:2] != (start, end):
+                        raise PartialUpdateUnsupportedException("服务器返回的范围不正确")
+                    size = archive.appendSegmentFrom(
+                        start, _trackChunks(response.iter_content(DOWNLOAD_CHUNK_SIZE), progress)
+                    )
+                    if size != end - start:
+                        raise PartialUpdateUnsupportedException("连接在范围下载完成前断开")
+            archive.addSegment(plan.tailStart, plan.tail)
+            with zipfile.ZipFile(archive, "r") as zipFile:  # type: ignore
+                stageManifestDiff(
+                    plan.modDir, stagedDir, zipFile, plan.diff, taint, progress=progress
+                )
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+
+def test():
+    """在本地的Range服务器上测试：已安装旧版本，新版本只修改了一个大文件中的一个、删除和添加了各一个文件"""
+    import tempfile
+    from http_downloader.range_server import RangeHTTPServer
+    from common.mod.installation.mod_archive import buildManifest, saveInstalledManifest
+
+    def makeArchive(path: str, files: dict):
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zipFile:
+            for name, content in files.items():
+                zipFile.writestr(name, content)
+
+    with tempfile.TemporaryDirectory() as workDir:
+        oldFiles = {f"Paks/file{i}.pak": os.urandom(4 * 1024 * 1024) for i in range(8)}
+        oldFiles["Removed/old.txt"] = b"old"
+        newFiles = dict(oldFiles)
+        del newFiles["Removed/old.txt"]
+        newFiles["Paks/file3.pak"] = os.urandom(4 * 1024 * 1024)
+        newFiles["Added/new.txt"] = b"new"
+        serveDir = os.path.join(workDir, "serve")
+        os.makedirs(serveDir)
+        makeArchive(os.path.join(workDir, "old.zip"), oldFiles)
+        makeArchive(os.path.join(serveDir, "new.zip"), newFiles)
+        # 安装旧版本
+        modDir = os.path.join(workDir, "UGC1")
+        with zipfile.ZipFile(os.path.join(workDir, "old.zip"), "r") as zipFile:
+            zipFile.extractall(os.path.join(modDir, "Data"))
+            saveInstalledManifest(modDir, buildManifest(zipFile.infolist()))
+
+        server = RangeHTTPServer(serveDir).startInBackground()
+        plan = planPartialUpdate(f"{server.baseUrl}/new.zip", modDir)
+        assert plan is not None
+        stagedDir = os.path.join(workDir, "staged")
+        applyPartialUpdate(plan, "2", os.path.join(workDir, "partial"), stagedDir)
+        shutil.rmtree(modDir)
+        os.rename(stagedDir, modDir)
+        archiveSize = os.path.getsize(os.path.join(serveDir, "new.zip"))
+        print(
+            f"压缩包{archiveSize}字节，服务器发送了{server.servedBytes}字节"
+            f"（{server.servedBytes / archiveSize:.1%}），{server.requestCount}个请求"
+        )
+        for name, content in newFiles.items():
+            with open(os.path.join(modDir, "Data", *name.split("/")), "rb") as f:
+                assert f.read() == content, name
+        assert not os.path.exists(os.path.join(modDir, "Data", "Removed"))
+        with open(os.path.join(modDir, "taint"), "r", encoding="utf-8") as f:
+            assert f.read() == "2"
+        print("更新后的文件与新版本一致")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    test()
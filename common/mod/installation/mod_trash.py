@@ -0,0 +1,245 @@
+import os
+import queue
+import shutil
+import stat
+import sys
+import threading
+from typing import Dict, Tuple
+from uuid import uuid4
+
+from common.log import AppLogger
+from common.mod.installation.path import GetModInstallationDirException, getModStagingDir
+
+# 回收区在暂存目录下的名称（与安装目录在同一个卷上，移动进来只需要重命名）
+TRASH_DIR_NAME = "trash"
+
+
+def getModTrashDir() -> str:
+    """获取回收区目录，不存在时会创建
+
+    Raises:
+        GetModInstallationDirException: 无法获取Mod安装目录
+    """
+    trashDir = os.path.join(getModStagingDir(), TRASH_DIR_NAME)
+    os.makedirs(trashDir, exist_ok=True)
+    return trashDir
+
+
+def _lowerThreadPriority():
+    """降低当前线程的优先级，避免删除文件时影响游戏、下载和导入"""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+
+            THREAD_PRIORITY_LOWEST = -2
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_PRIORITY_LOWEST)
+        elif sys.platform.startswith("linux"):
+            # Linux上对线程ID设置nice值只影响该线程
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+    except OSError:
+        pass
+
+
+def _removeFile(path: str):
+    try:
+        os.remove(path)
+    except PermissionError:
+        # Windows上不能直接删除只读文件
+        os.chmod(path, stat.S_IWRITE)
+        os.remove(path)
+
+
+def _measureDir(path: str) -> int:
+    """统计目录中所有文件的大小之和"""
+    total = 0
+    dirs = [path]
+    while dirs:
+        with os.scandir(dirs.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+                else:
+                    total += entry.stat(follow_symlinks=False).st_size
+    return total
+
+
+class ModTrashCollector:
+    """被替换或过期的Mod目录的回收器
+
+    单例对象，使用ModTrashCollector.getInstance()获取
+
+    - 使用moveToTrash把目录移动（重命名）到回收区，调用者不需要等待删除
+    - 后台的低优先级线程统计回收区中各目录的大小，然后并行删除（不同的子目录由不同的线程删除），
+      pendingBytes为已经统计但还没有删除的字节数
+    - 删除线程是守护线程，不会阻止App退出，没删完的目录会在下次启动时（resume）继续删除
+    """
+
+    # 删除文件的线程数
+    WORKERS = 4
+
+    _instance: "ModTrashCollector | None" = None
+
+    @classmethod
+    def getInstance(cls) -> "ModTrashCollector":
+        if cls._instance is None:
+            cls._instance = ModTrashCollector()
+        return cls._instance
+
+    def __new__(cls) -> "ModTrashCollector":
+        if ModTrashCollector._instance:
+            AppLogger().warning(
+                "尝试直接构造ModTrashCollector对象，请使用ModTrashCollector.getInstance()"
+            )
+            return ModTrashCollector._instance
+        ModTrashCollector._instance = super().__new__(cls)
+        return ModTrashCollector._instance
+
+    def __init__(self) -> None:
+        # 直接构造时__new__返回的是已有的对象，不要重复启动删除线程
+        if hasattr(self, "threads"):
+            return
+        # 待删除的目录和它的上级目录（回收区中的顶层目录没有上级目录）
+        self.queue: "queue.Queue[Tuple[str, str | None]]" = queue.Queue()
+        self.lock = threading.Lock()
+        self._pendingBytes = 0
+        # 正在删除的目录还没有删完的子目录数量
+        self.remainingChildren: Dict[str, int] = {}
+        self.parents: Dict[str, str | None] = {}
+        self.threads = [
+            threading.Thread(target=self._run, name=f"ModTrash{i}", daemon=True)
+            for i in range(self.WORKERS)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    @property
+    def pendingBytes(self) -> int:
+        """回收区中已经统计但还没有删除的字节数"""
+        with self.lock:
+            return self._pendingBytes
+
+    def moveToTrash(self, path: str):
+        """把目录移动到回收区并在后台删除，返回后调用者可以马上重新使用这个路径
+
+        无法重命名到回收区时（例如目录不在安装目录所在的卷上），在当前线程中直接删除。
+        """
+        try:
+            trashPath = os.path.join(getModTrashDir(), uuid4().hex)
+            os.rename(path, trashPath)
+        except (GetModInstallationDirException, OSError) as e:
+            AppLogger().warning(f"无法将{path}移动到回收区，直接删除：{e}")
+            shutil.rmtree(path, ignore_errors=True)
+            return
+        self.queue.put((trashPath, None))
+
+    def resume(self):
+        """继续删除上次没有删完的目录，同时回收暂存目录中残留的目录（上次导入到一半App被关闭）
+
+        在App启动时（主线程中）调用，任何错误都只记录日志，不会影响启动。
+        """
+        try:
+            stagingDir = getModStagingDir()
+            trashDir = getModTrashDir()
+            # 先处理回收区中已有的目录，再把暂存目录中的残留移进来（moveToTrash会把它们加入队列），
+            # 否则残留的目录会被加入两次
+            for name in os.listdir(trashDir):
+                path = os.path.join(trashDir, name)
+                if os.path.isdir(path):
+                    self.queue.put((path, None))
+                    continue
+                try:
+                    _removeFile(path)
+                except OSError as e:
+                    AppLogger().warning(f"删除{path}时发生错误：{e}")
+            for name in os.listdir(stagingDir):
+                if name != TRASH_DIR_NAME:
+                    self.moveToTrash(os.path.join(stagingDir, name))
+        except (GetModInstallationDirException, OSError) as e:
+            AppLogger().warning(f"无法继续删除回收区中的目录：{e}")
+
+    def _run(self):
+        _lowerThreadPriority()
+        while True:
+            path, parent = self.queue.get()
+            try:
+                if parent is None:
+                    size = _measureDir(path)
+                    with self.lock:
+                        self._pendingBytes += size
+                self._collectDir(path, parent)
+            except Exception as e:
+                # 删除失败的目录（例如文件被占用）会留在回收区，下次启动时重试；
+                # 捕获所有异常，避免一个目录出错导致删除线程退出
+                AppLogger().warning(f"删除{path}时发生错误：{e}")
+
+    def _collectDir(self, path: str, parent: str | None):
+        """删除目录中的文件，子目录交给其他线程删除，全部删完后删除目录本身
+
+        中途出错时，已经删除的文件仍会从pendingBytes中减去。
+        """
+        subdirs = []
+        freedBytes = 0
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                        continue
+                    size = entry.stat(follow_symlinks=False).st_size
+                    _removeFile(entry.path)
+                    freedBytes += size
+        finally:
+            with self.lock:
+                self._pendingBytes -= freedBytes
+        with self.lock:
+            self.parents[path] = parent
+            self.remainingChildren[path] = len(subdirs)
+        for subdir in subdirs:
+            self.queue.put((subdir, path))
+        if not subdirs:
+            self._removeEmptyDir(path)
+
+    def _removeEmptyDir(self, path: str):
+        """删除已经清空的目录，如果它是上级目录最后一个没删完的子目录，继续删除上级目录"""
+        while True:
+            os.rmdir(path)
+            with self.lock:
+                self.remainingChildren.pop(path, None)
+                parent = self.parents.pop(path, None)
+                if parent is None:
+                    AppLogger().info(f"已删除{path}，回收区还有{self._pendingBytes}字节待删除")
+                    return
+                remaining = self.remainingChildren.get(parent)
+                if remaining is None:
+                    return
+                self.remainingChildren[parent] = remaining - 1
+                if remaining - 1 > 0:
+                    return
+            path = parent
+
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    import common.mod.installation.path as modPath
+
+    # 在临时目录中模拟安装目录，删除一个有很多文件的目录
+    with tempfile.TemporaryDirectory() as installDir:
+        modPath.getModInstallationDir = lambda: installDir
+        modDir = os.path.join(installDir, "UGC1")
+        for i in range(50):
+            os.makedirs(os.path.join(modDir, "Data", str(i), "sub"))
+            for j in range(100):
+                with open(os.path.join(modDir, "Data", str(i), "sub", f"{j}.bin"), "wb") as f:
+                    f.write(b"\0" * 1024)
+        collector = ModTrashCollector.getInstance()
+        startTime = time.perf_counter()
+        collector.moveToTrash(modDir)
+        print(f"移动到回收区耗时{(time.perf_counter() - startTime) * 1000:.2f}ms")
+        while os.listdir(getModTrashDir()):
+            time.sleep(0.05)
+        print(
+            f"删除完成，耗时{time.perf_counter() - startTime:.2f}s，剩余{collector.pendingBytes}字节"
+        )
@@ -1,6 +1,8 @@
 import os
-from common.tricks import cached
+import sys
 
+import app_config
+from common.tricks import cached
 
 INI_MOD_DIR_SUFFIX = "ModDirectory="
 GAME_SETTING_PATH_BEHIND_HOME = r"AppData\Local\Pavlov\Saved\Config\Windows\GameUserSettings.ini"
@@ -30,4 +32,29 @@ def getModInstallationDir() -> str:
                 continue
             modDir = line[len(INI_MOD_DIR_SUFFIX) :].strip()
             return modDir
-    raise GetModInstallationDirException("无法找到Mod安装目录配置项")
\ No newline at end of file
+    raise GetModInstallationDirException("无法找到Mod安装目录配置项")
+
+
+def getModStagingDir() -> str:
+    """获取导入Mod时的暂存目录（Mod安装目录下的隐藏目录），不存在时会创建
+
+    暂存目录与安装目录在同一个卷上，Mod解压到这里后只需要一次重命名就能完成安装，不需要再复制一遍。
+
+    Raises:
+        GetModInstallationDirException: 无法获取Mod安装目录
+    """
+    stagingDir = os.path.join(getModInstallationDir(), app_config.MOD_STAGING_DIR_NAME)
+    if not os.path.isdir(stagingDir):
+        os.makedirs(stagingDir)
+        _hideDir(stagingDir)
+    return stagingDir
+
+
+def _hideDir(path: str):
+    """在Windows上给目录加上隐藏属性（其他系统上以.开头的目录本来就是隐藏的）"""
+    if sys.platform != "win32":
+        return
+    import ctypes
+
+    FILE_ATTRIBUTE_HIDDEN = 0x2
+    ctypes.windll.kernel32.SetFileAttributesW(path, FILE_ATTRIBUTE_HIDDEN)
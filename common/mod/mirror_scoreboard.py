@@ -0,0 +1,221 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+import json
+import os
+import time
+from typing import Dict, List, Tuple
+from urllib.parse import urlparse
+from PySide6.QtCore import QObject
+from PySide6.QtWidgets import QApplication
+import requests
+
+import app_config
+from common.log import AppLogger
+from common.qrequest import QDataPromise, QFuturePromise, QPromise
+
+
+def getHost(uri: str) -> str:
+    return urlparse(uri).netloc
+
+
+def probeUri(uri: str, size: int, timeout: float) -> float:
+    """请求uri的前size个字节，返回吞吐量（字节/秒，包含建立连接和重定向的时间）
+
+    Raises:
+        requests.exceptions.RequestException: 请求失败或超时
+    """
+    startTime = time.monotonic()
+    deadline = startTime + timeout
+    received = 0
+    with requests.get(
+        uri, headers={"Range": f"bytes=0-{size - 1}"}, stream=True, timeout=timeout
+    ) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(64 * 1024):
+            received += len(chunk)
+            # 不支持Range的服务器会返回整个文件，读够了就停止
+            if received >= size or time.monotonic() > deadline:
+                break
+    elapsed = max(time.monotonic() - startTime, 1e-3)
+    return received / elapsed
+
+
+@dataclass
+class HostStats:
+    """一个下载主机的历史表现"""
+
+    throughput: float = 0
+    """吞吐量的指数移动平均（字节/秒）"""
+    successes: int = 0
+    failures: int = 0
+    lastProbeTime: float = 0
+    """上次探测的时间（time.time()）"""
+
+    @property
+    def errorRate(self) -> float:
+        # 加上先验（相当于已经有1次成功和1次失败），避免一两次结果就把错误率拉到0或1
+        return (self.failures + 1) / (self.successes + self.failures + 2)
+
+    @property
+    def score(self) -> float:
+        """期望的有效吞吐量，越大越好"""
+        return self.throughput * (1 - self.errorRate)
+
+
+class MirrorScoreboard(QObject):
+    """下载地址评分板
+
+    单例对象，使用MirrorScoreboard.getInstance()获取
+
+    对同一个Mod的多个下载地址（镜像站和官方地址），用一个小的Range请求探测各个主机的吞吐量，
+    记录每个主机的吞吐量和错误率，并保存到`app_config.MIRROR_SCORES_PATH`中，
+    以便App重启后继续使用。排序时按照主机的期望有效吞吐量（吞吐量 * (1 - 错误率)）从高到低排列，
+    aria2会优先使用靠前的地址。
+
+    最近PROBE_INTERVAL秒内探测过的主机不会重复探测，直接使用历史数据；
+    正在探测的主机也不会重复探测，同时排序的多个Mod（例如批量安装时）共用同一次探测的结果。
+    """
+
+    # 探测请求的大小（字节）
+    PROBE_SIZE = 256 * 1024
+    # 探测的超时时间（秒），超时视为失败
+    PROBE_TIMEOUT = 3
+    # 同一个主机两次探测之间的最短间隔（秒）
+    PROBE_INTERVAL = 10 * 60
+    # 新的吞吐量在指数移动平均中的权重
+    THROUGHPUT_WEIGHT = 0.3
+
+    _instance: "MirrorScoreboard | None" = None
+
+    @classmethod
+    def getInstance(cls) -> "MirrorScoreboard":
+        if cls._instance is None:
+            cls._instance = MirrorScoreboard()
+        return cls._instance
+
+    def __new__(cls) -> "MirrorScoreboard":
+        if MirrorScoreboard._instance:
+            AppLogger().warning(
+                "尝试直接构造MirrorScoreboard对象，请使用MirrorScoreboard.getInstance()"
+            )
+            return MirrorScoreboard._instance
+        MirrorScoreboard._instance = super().__new__(cls)
+        return MirrorScoreboard._instance
+
+    def __init__(self) -> None:
+        # 直接构造时__new__返回的是已有的对象，不要重新读取评分和创建线程池
+        if "executor" in self.__dict__:
+            return
+        super().__init__()
+        self.hostStats: Dict[str, HostStats] = self._load()
+        # 等待探测结果的线程
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="MirrorProbe")
+        # 真正执行探测的线程
+        self.probeExecutor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="MirrorProbeHost")
+        # 正在探测的主机到探测结果（吞吐量，失败时为None）的Future，只在主线程中访问
+        self.probingHosts: Dict[str, Future] = {}
+
+    @staticmethod
+    def _load() -> Dict[str, HostStats]:
+        if not os.path.exists(app_config.MIRROR_SCORES_PATH):
+            return {}
+        try:
+            with open(app_config.MIRROR_SCORES_PATH, "r", encoding="utf-8") as f:
+                obj: dict = json.load(f)
+            return {host: HostStats(**stats) for host, stats in obj.items()}
+        except (OSError, ValueError, TypeError) as e:
+            AppLogger().warning(f"读取下载地址评分时发生错误：{e}")
+            return {}
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(app_config.MIRROR_SCORES_PATH), exist_ok=True)
+            with open(app_config.MIRROR_SCORES_PATH, "w", encoding="utf-8") as f:
+                json.dump({host: asdict(stats) for host, stats in self.hostStats.items()}, f)
+        except OSError as e:
+            AppLogger().warning(f"保存下载地址评分时发生错误：{e}")
+
+    def record(self, host: str, throughput: float | None):
+        """记录一次探测或下载的结果，throughput为None表示失败"""
+        stats = self.hostStats.setdefault(host, HostStats())
+        stats.lastProbeTime = time.time()
+        if throughput is None:
+            stats.failures += 1
+            return
+        stats.successes += 1
+        if stats.successes == 1:
+            stats.throughput = throughput
+        else:
+            stats.throughput += self.THROUGHPUT_WEIGHT * (throughput - stats.throughput)
+
+    def rank(self, uris: List[str]) -> List[str]:
+        """按照历史数据从好到差排列uris，没有数据的主机排在有数据的主机后面，保持原来的相对顺序"""
+        # sorted是稳定的，因此分数相同时保持原顺序
+        return sorted(
+            uris,
+            key=lambda uri: (
+                getHost(uri) not in self.hostStats,
+                -self.hostStats[getHost(uri)].score if getHost(uri) in self.hostStats else 0,
+            ),
+        )
+
+    def _needsProbe(self, uri: str) -> bool:
+        stats = self.hostStats.get(getHost(uri))
+        return stats is None or time.time() - stats.lastProbeTime > self.PROBE_INTERVAL
+
+    def _probe(self, uri: str) -> float | None:
+        """在探测线程中探测一个地址，失败时返回None"""
+        try:
+            return probeUri(uri, self.PROBE_SIZE, self.PROBE_TIMEOUT)
+        except Exception as e:
+            AppLogger().info(f"探测下载地址{uri}失败：{e}")
+            return None
+
+    def probeAndRank(self, uris: List[str]) -> QPromise:
+        """探测需要探测的地址，更新评分后返回排好序的uris
+
+        只有一个地址时不需要排序，也不会探测。正在被其他调用者探测的主机不会再次探测，而是等待同一个结果。
+        返回的Promise不会出错（探测失败只会降低该主机的评分）。
+        """
+        urisToProbe = [uri for uri in uris if self._needsProbe(uri)] if len(uris) > 1 else []
+        if not urisToProbe:
+            return QDataPromise(self.rank(uris))
+        hostFutures: Dict[str, Future] = {}
+        for uri in urisToProbe:
+            host = getHost(uri)
+            if host in hostFutures:
+                continue
+            future = self.probingHosts.get(host)
+            if future is None:
+                future = self.probeExecutor.submit(self._probe, uri)
+                self.probingHosts[host] = future
+            hostFutures[host] = future
+
+        def waitForProbes() -> List[Tuple[str, float | None]]:
+            return [(host, future.result()) for host, future in hostFutures.items()]
+
+        def afterProbe(results: List[Tuple[str, float | None]]) -> List[str]:
+            for host, throughput in results:
+                # 共用的探测只记录一次，由最先拿到结果的调用者记录
+                if self.probingHosts.get(host) is hostFutures[host]:
+                    del self.probingHosts[host]
+                    self.record(host, throughput)
+            self.save()
+            ranked = self.rank(uris)
+            AppLogger().info(
+                f"下载地址排序：{[(getHost(uri), int(self.hostStats[getHost(uri)].score)) for uri in ranked]}"
+            )
+            return ranked
+
+        return QFuturePromise(self, self.executor, waitForProbes).then(afterProbe)
+
+
+if __name__ == "__main__":
+    app = QApplication()
+    (
+        MirrorScoreboard.getInstance()
+        .probeAndRank(["https://www.example.com", "https://www.baidu.com"])
+        .then(lambda uris: print(uris))
+        .done()
+    )
+    app.exec()
@@ -65,6 +65,43 @@ class ModData:
     def taint(self) -> int:
         return self.getModFileLive("windows")
 
+    @property
+    def windowsModFile(self) -> dict | None:
+        """Windows平台当前版本的文件对象（mod.io的modfile）
+
+        Mod对象中的modfile是主文件，只有它就是Windows平台当前版本的文件时才会返回，否则（或没有这个字段时）返回None
+        """
+        modFile: dict | None = self._data.get("modfile")
+        if not modFile:
+            return None
+        try:
+            if int(modFile["id"]) != self.taint:
+                return None
+        except (KeyError, TypeError, ValueError, ModDataNotFound):
+            return None
+        return modFile
+
+    @property
+    def fileMd5(self) -> str | None:
+        """Windows平台当前版本的文件的MD5（只读），Mod数据中没有时为None"""
+        modFile = self.windowsModFile
+        if modFile is None:
+            return None
+        return (modFile.get("filehash") or {}).get("md5") or None
+
+    @property
+    def fileSize(self) -> int | None:
+        """Windows平台当前版本的文件的大小（字节，只读），Mod数据中没有时为None"""
+        modFile = self.windowsModFile
+        if modFile is None or not modFile.get("filesize"):
+            return None
+        return int(modFile["filesize"])
+
+    @property
+    def rawData(self) -> dict:
+        """从Api获取的原始数据（只读），可以再传给构造函数重新构造ModData"""
+        return self._data
+
     @property
     def name(self) -> str:
         """Mod名称（只读）"""
@@ -1,33 +1,391 @@
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Sequence, Type
 from PySide6.QtWidgets import QApplication
 from PySide6.QtCore import QObject
+import requests
 
-from common.qrequest import QPromise, QRequestReady
+import app_config
+from common.log import AppLogger
+from common.qrequest import QFuturePromise, QPromise
+from common.tricks import interfaceMethod
 
+FROST_BLADE_MIRROR_MANIFEST_URL = (
+    "https://api.pavlov-toolbox.rech.asia/mod-download-mirrors/FrostBlade"
+)
 
-FROST_BLADE_MIRROR_MANIFEST_URL = "https://api.pavlov-toolbox.rech.asia/mod-download-mirrors/FrostBlade"
 
+class MirrorManifestCache:
+    """镜像站清单的缓存
 
-def getDownloadUrlFromFrostBladeMirror(parent: QObject, rid: int) -> QPromise:
-    """"""
+    镜像站的清单包含了所有Mod的下载地址，体积较大，每个Mod（包括依赖）都下载并解析一次的话非常浪费。
+    这里把清单解析为资源ID到下载地址的索引：
+    - 索引在TTL秒内有效，有效期内的查询直接从内存中得到结果，不需要任何网络请求
+    - 索引会保存到`app_config.MIRROR_MANIFEST_CACHE_DIR`中，App重启后仍然可以使用
+    - 过期后带上ETag和Last-Modified发送条件请求，清单没有变化时服务器返回304，只需要刷新有效期
 
-    def extractDownloadUrl(responseContent: bytes) -> str | None:
-        manifestObj: dict = json.loads(responseContent)
-        result = next((item for item in manifestObj.values() if item["id"] == rid), None)
-        if (
-            result is None
-            or "windows" not in result
-            or result["windows"] is None
-            or "binary_url" not in result["windows"]
-        ):
+    lookup是阻塞的，应在工作线程中调用。刷新时持有锁，因此同时发起的多个查询只会刷新一次
+    （后面的查询拿到锁时索引已经是新的了）。刷新失败时，如果有旧的索引，会继续使用旧的索引。
+    """
+
+    # 索引的有效期（秒）
+    TTL = 30 * 60
+    # 请求清单的超时时间（秒）
+    REQUEST_TIMEOUT = 15
+
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        buildIndex: Callable[[dict], Dict[int, str]],
+    ) -> None:
+        """构造函数
+
+        Args:
+            name (str): 镜像站的名称，也用作缓存文件名
+            url (str): 清单的地址
+            buildIndex (Callable[[dict], Dict[int, str]]): 把清单解析为资源ID到下载地址的索引
+        """
+        self.name = name
+        self.url = url
+        self.buildIndex = buildIndex
+        self.cachePath = os.path.join(app_config.MIRROR_MANIFEST_CACHE_DIR, f"{name}.json")
+        self.index: Dict[int, str] | None = None
+        self.etag: str | None = None
+        self.lastModified: str | None = None
+        self.fetchTime = 0.0
+        """上次确认索引为最新的时间（time.time()）"""
+        self.lock = threading.Lock()
+        self._load()
+
+    def isFresh(self) -> bool:
+        return self.index is not None and time.time() - self.fetchTime < self.TTL
+
+    def _load(self):
+        if not os.path.exists(self.cachePath):
+            return
+        try:
+            with open(self.cachePath, "r", encoding="utf-8") as f:
+                obj: dict = json.load(f)
+            # json的键只能是字符串
+            self.index = {int(rid): url for rid, url in obj["index"].items()}
+            self.etag = obj.get("etag")
+            self.lastModified = obj.get("lastModified")
+            self.fetchTime = float(obj.get("fetchTime", 0))
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            AppLogger().warning(f"读取{self.name}镜像站清单缓存时发生错误：{e}")
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.cachePath), exist_ok=True)
+            with open(self.cachePath, "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "etag": self.etag,
+                        "lastModified": self.lastModified,
+                        "fetchTime": self.fetchTime,
+                        "index": self.index,
+                    },
+                    f,
+                )
+        except OSError as e:
+            AppLogger().warning(f"保存{self.name}镜像站清单缓存时发生错误：{e}")
+
+    def _refresh(self):
+        """索引过期时重新验证或下载清单
+
+        Raises:
+            requests.exceptions.RequestException: 请求失败，并且没有可以使用的旧索引
+            ValueError: 清单格式错误，并且没有可以使用的旧索引
+            KeyError, TypeError, AttributeError: 清单的结构与buildIndex预期的不同，并且没有可以使用的旧索引
+        """
+        with self.lock:
+            if self.isFresh():
+                return
+            headers = {}
+            # 没有索引时条件请求没有意义
+            if self.index is not None:
+                if self.etag:
+                    headers["If-None-Match"] = self.etag
+                if self.lastModified:
+                    headers["If-Modified-Since"] = self.lastModified
+            try:
+                response = requests.get(self.url, headers=headers, timeout=self.REQUEST_TIMEOUT)
+                response.raise_for_status()
+                if response.status_code == 304:
+                    AppLogger().info(f"{self.name}镜像站清单没有变化")
+                else:
+                    index = self.buildIndex(json.loads(response.content))
+                    AppLogger().info(f"{self.name}镜像站清单已更新，共{len(index)}个Mod")
+                    self.index = index
+                    self.etag = response.headers.get("ETag")
+                    self.lastModified = response.headers.get("Last-Modified")
+            # buildIndex由调用者提供，清单的结构不对时可能抛出各种错误，与请求失败一样处理
+            except (
+                requests.exceptions.RequestException,
+                ValueError,
+                KeyError,
+                TypeError,
+                AttributeError,
+            ) as e:
+                if self.index is None:
+                    raise
+                AppLogger().warning(f"刷新{self.name}镜像站清单时发生错误，继续使用旧的清单：{e}")
+                return
+            self.fetchTime = time.time()
+            self._save()
+
+    def lookup(self, rid: int) -> str | None:
+        """查询Mod在镜像站的下载地址，镜像站没有该Mod时返回None
+
+        索引有效时直接查询，否则先刷新索引。
+        """
+        if not self.isFresh():
+            self._refresh()
+        return self.index.get(rid) if self.index is not None else None
+
+
+class MirrorProvider:
+    """镜像站接口类
+
+    每个镜像站提供一个阻塞的lookup方法，由MirrorRegistry在工作线程中并发调用。
+    """
+
+    def __init__(self, name: str, displayName: str) -> None:
+        """构造函数
+
+        Args:
+            name (str): 镜像站的名称，用于日志和缓存文件名
+            displayName (str): 显示在界面上的名称，如“FrostBlade镜像站”
+        """
+        self.name = name
+        self.displayName = displayName
+
+    @interfaceMethod
+    def lookup(self, rid: int) -> str | None:
+        """查询Mod在该镜像站的下载地址，没有该Mod时返回None，出错时抛出异常"""
+        pass
+
+
+class ManifestMirrorProvider(MirrorProvider):
+    """提供清单（所有Mod的下载地址）的镜像站，清单由MirrorManifestCache缓存
+
+    清单是一个json对象，它的每个值对应一个Mod，
+    值中idKey对应的字段为资源ID，沿着urlPath逐层取得的字段为下载地址。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        displayName: str,
+        url: str,
+        idKey: str = "id",
+        urlPath: Sequence[str] = ("windows", "binary_url"),
+    ) -> None:
+        super().__init__(name, displayName)
+        self.idKey = idKey
+        self.urlPath = urlPath
+        self.cache = MirrorManifestCache(name, url, self._buildIndex)
+
+    def _buildIndex(self, manifestObj: dict) -> Dict[int, str]:
+        """解析清单，格式不对的Mod会被跳过
+
+        Raises:
+            ValueError: 清单不是json对象
+        """
+        if not isinstance(manifestObj, dict):
+            raise ValueError(f"清单应为json对象，实际为{type(manifestObj).__name__}")
+        index: Dict[int, str] = {}
+        for item in manifestObj.values():
+            if not isinstance(item, dict):
+                continue
+            value = item
+            for key in self.urlPath:
+                value = value.get(key) if isinstance(value, dict) else None
+            if not isinstance(value, str):
+                continue
+            try:
+                index[int(item[self.idKey])] = value
+            except (KeyError, TypeError, ValueError):
+                continue
+        return index
+
+    def lookup(self, rid: int) -> str | None:
+        return self.cache.lookup(rid)
+
+
+class UrlTemplateMirrorProvider(MirrorProvider):
+    """下载地址可以由资源ID直接拼出的镜像站，用HEAD请求确认该Mod存在
+
+    urlTemplate中的`{rid}`会被替换为资源ID。确认的结果在TTL秒内有效。
+    """
+
+    # 结果的有效期（秒）
+    TTL = 30 * 60
+    # HEAD请求的超时时间（秒）
+    REQUEST_TIMEOUT = 5
+
+    def __init__(self, name: str, displayName: str, urlTemplate: str) -> None:
+        super().__init__(name, displayName)
+        self.urlTemplate = urlTemplate
+        # 资源ID到(下载地址, 确认的时间)
+        self.results: Dict[int, tuple[str | None, float]] = {}
+
+    def lookup(self, rid: int) -> str | None:
+        result = self.results.get(rid)
+        if result is not None and time.time() - result[1] < self.TTL:
+            return result[0]
+        url = self.urlTemplate.format(rid=rid)
+        response = requests.head(url, allow_redirects=True, timeout=self.REQUEST_TIMEOUT)
+        # 只有明确不存在时才缓存None，其他错误交给调用者
+        if response.status_code == 404:
+            self.results[rid] = (None, time.time())
             return None
-        return result["windows"]["binary_url"]
+        response.raise_for_status()
+        self.results[rid] = (url, time.time())
+        return url
+
+
+# 配置中的type到镜像站类的映射
+MIRROR_PROVIDER_TYPES: Dict[str, Type[MirrorProvider]] = {
+    "manifest": ManifestMirrorProvider,
+    "urlTemplate": UrlTemplateMirrorProvider,
+}
+
+# 默认的镜像站配置，`app_config.MIRROR_PROVIDERS_PATH`存在时使用其中的配置（格式相同）
+DEFAULT_MIRROR_PROVIDERS: List[dict] = [
+    {
+        "type": "manifest",
+        "name": "FrostBlade",
+        "displayName": "FrostBlade镜像站",
+        "url": FROST_BLADE_MIRROR_MANIFEST_URL,
+        "idKey": "id",
+        "urlPath": ["windows", "binary_url"],
+    },
+]
+
+
+def createMirrorProvider(config: dict) -> MirrorProvider:
+    """根据配置创建镜像站，配置中除type外的字段都作为构造函数的参数
+
+    Raises:
+        KeyError: 缺少type或未知的type
+        TypeError: 参数错误
+        ValueError: 参数的值错误
+    """
+    kwargs = dict(config)
+    return MIRROR_PROVIDER_TYPES[kwargs.pop("type")](**kwargs)
+
+
+class MirrorUrl(NamedTuple):
+    """某个镜像站中Mod的下载地址"""
+
+    displayName: str
+    url: str
+
+
+class MirrorRegistry(QObject):
+    """镜像站注册表
+
+    单例对象，使用MirrorRegistry.getInstance()获取
+
+    启动时根据配置创建所有镜像站，lookupAll会同时查询所有镜像站，
+    在LOOKUP_DEADLINE秒内返回的下载地址都会被采用，超时的镜像站的结果被丢弃
+    （查询仍会在后台完成，清单类的镜像站下次就可以直接使用缓存）。
+    """
+
+    # 查询所有镜像站的最长等待时间（秒）
+    LOOKUP_DEADLINE = 5
+
+    _instance: "MirrorRegistry | None" = None
+
+    @classmethod
+    def getInstance(cls) -> "MirrorRegistry":
+        if cls._instance is None:
+            cls._instance = MirrorRegistry()
+            for config in cls._loadConfigs():
+                try:
+                    cls._instance.register(createMirrorProvider(config))
+                except (KeyError, TypeError, ValueError) as e:
+                    AppLogger().warning(f"镜像站配置{config}错误：{e}")
+        return cls._instance
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.providers: List[MirrorProvider] = []
+        # 等待查询结果（直到超时）的线程
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="MirrorLookup")
+        # 真正执行查询的线程
+        self.providerExecutor = ThreadPoolExecutor(
+            max_workers=8, thread_name_prefix="MirrorProvider"
+        )
+
+    @staticmethod
+    def _loadConfigs() -> List[dict]:
+        if not os.path.exists(app_config.MIRROR_PROVIDERS_PATH):
+            return DEFAULT_MIRROR_PROVIDERS
+        try:
+            with open(app_config.MIRROR_PROVIDERS_PATH, "r", encoding="utf-8") as f:
+                configs = json.load(f)
+        except (OSError, ValueError) as e:
+            AppLogger().warning(f"读取镜像站配置时发生错误，使用默认配置：{e}")
+            return DEFAULT_MIRROR_PROVIDERS
+        # 配置应为由各镜像站的配置（对象）组成的数组
+        if not isinstance(configs, list) or not all(isinstance(c, dict) for c in configs):
+            AppLogger().warning("镜像站配置的格式错误（应为对象数组），使用默认配置")
+            return DEFAULT_MIRROR_PROVIDERS
+        return configs
+
+    def register(self, provider: MirrorProvider):
+        self.providers.append(provider)
+
+    def _lookupAll(self, rid: int, deadline: float) -> List[MirrorUrl]:
+        futureToProvider: Dict[Future, MirrorProvider] = {
+            self.providerExecutor.submit(provider.lookup, rid): provider
+            for provider in self.providers
+        }
+        done, notDone = wait(futureToProvider, timeout=deadline)
+        for future in notDone:
+            AppLogger().info(f"{futureToProvider[future].name}镜像站查询超时")
+        result: List[MirrorUrl] = []
+        # 按照注册的顺序，而不是返回的顺序
+        for future, provider in futureToProvider.items():
+            if future not in done:
+                continue
+            error = future.exception()
+            if error is not None:
+                AppLogger().warning(f"从{provider.name}镜像站查询{rid}时发生错误：{error}")
+                continue
+            url = future.result()
+            if url and url not in (mirrorUrl.url for mirrorUrl in result):
+                result.append(MirrorUrl(provider.displayName, url))
+        return result
+
+    def lookupAll(self, parent: QObject, rid: int, deadline: float | None = None) -> QPromise:
+        """同时查询所有镜像站，结果为按时返回的List[MirrorUrl]（可能为空）
 
-    return QRequestReady(parent).get(FROST_BLADE_MIRROR_MANIFEST_URL).then(extractDownloadUrl)
+        单个镜像站出错或超时只会被忽略，返回的Promise不会出错。
+        """
+        return QFuturePromise(
+            parent,
+            self.executor,
+            self._lookupAll,
+            rid,
+            self.LOOKUP_DEADLINE if deadline is None else deadline,
+        )
 
 
 if __name__ == "__main__":
     app = QApplication()
-    result = getDownloadUrlFromFrostBladeMirror(app, 3467755)
-    result.then(lambda res: print(res)).done()
+    for rid in [3467755, 3467755, 2804502]:
+        startTime = time.monotonic()
+        (
+            MirrorRegistry.getInstance()
+            .lookupAll(app, rid)
+            .then(lambda res, startTime=startTime: print(res, time.monotonic() - startTime))
+            .done()
+        )
     app.exec()
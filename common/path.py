@@ -11,3 +11,14 @@ def getResourcePath(relativePath: str) -> str:
     else:
         basePath = os.path.abspath(".")
     return os.path.join(basePath, relativePath)
+
+
+def getVolume(path: str) -> str:
+    """返回路径所在的卷的标识（Windows上为盘符，其他系统上为设备号），路径不存在时使用存在的上级目录"""
+    path = os.path.abspath(path)
+    drive = os.path.splitdrive(path)[0]
+    if drive:
+        return drive.upper()
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    return str(os.stat(path).st_dev)
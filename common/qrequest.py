@@ -1,8 +1,9 @@
+from concurrent.futures import Executor, Future
 from enum import Enum
 from typing import Any, Callable, List, Self
 from PySide6 import QtNetwork
 from PySide6 import QtCore
-from PySide6.QtCore import QObject
+from PySide6.QtCore import QObject, Signal
 from PySide6.QtNetwork import QNetworkAccessManager
 from PySide6.QtWidgets import QApplication
 
@@ -160,6 +161,68 @@ class QDataPromise(QPromise):
         return self
 
 
+class QFuturePromise(QObject, QPromise):
+    """在Executor中执行函数的Promise
+
+    调用done后，func会被提交到executor中执行（不阻塞主线程），执行完毕后，
+    then函数和catch函数会回到该对象所在的线程（一般为主线程）中执行，因此可以放心地在其中操作界面。
+
+    func抛出的异常会作为参数传给catch函数；如果没有catch函数，异常会被重新抛出。
+    func执行前被取消时（Executor关闭），then和catch都不会被调用。
+
+    使用示例：
+    ```
+    executor = ThreadPoolExecutor(max_workers=1)
+    (
+        QFuturePromise(app, executor, time.sleep, 1)
+        .then(lambda _: print("done"))
+        .catch(lambda e: print(f"error: {e}"))
+        .done()
+    )
+    ```
+    """
+
+    # 在工作线程中发出，由Qt排队到该对象所在的线程中处理
+    _futureDone = Signal(object)
+
+    def __init__(
+        self, parent: QObject, executor: Executor, func: Callable[..., Any], *args: Any
+    ) -> None:
+        super().__init__(parent)
+        self.executor = executor
+        self.func = func
+        self.args = args
+        self.lastFuncResult: Any = None
+        self._futureDone.connect(self.onFutureDone)
+
+    def done(self) -> Self:
+        future = self.executor.submit(self.func, *self.args)
+        future.add_done_callback(self._futureDone.emit)
+        return self
+
+    def onFutureDone(self, future: Future) -> None:
+        try:
+            # 执行前被取消（例如Executor被shutdown(cancel_futures=True)），不调用then和catch
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is not None:
+                if self.catchFunc:
+                    self.catchFunc(error)
+                else:
+                    raise error
+                return
+            self.lastFuncResult = future.result()
+            for index, thenFunc in enumerate(self.thenFuncList):
+                self.lastFuncResult = thenFunc(self.lastFuncResult)
+                if isinstance(self.lastFuncResult, QPromise):
+                    self.lastFuncResult.thenFuncList.extend(self.thenFuncList[index + 1 :])
+                    self.lastFuncResult.done()
+                    break
+        finally:
+            self.deleteLater()
+
+
 # 这个类必须要继承QObject，QRequestPromise也一样，否则Qt会把它们清理掉，导致回调无法正常使用
 class QRequestReady(QObject):
     """Qt异步请求的封装
@@ -1,3 +1,7 @@
+import hashlib
+from typing import Callable
+
+
 def byteLengthToHumanReadable(bytes: int):
     """将字节长度转化为人类可读的形式，返回一个元组`(数量，单位)`"""
     if bytes >= 1024 * 1024 * 1024:
@@ -13,3 +17,26 @@ def byteLengthToHumanReadable(bytes: int):
         number = bytes
         unit = "B"
     return number, unit
+
+
+# 计算文件哈希值时每次读取的大小，hashlib在数据大于2047字节时会释放GIL
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hashFile(
+    path: str, algorithm: str = "md5", onProgress: Callable[[int], None] | None = None
+) -> str:
+    """分块计算文件的哈希值（十六进制字符串），内存占用与文件大小无关
+
+    读取时复用同一个缓冲区，不会为每一块分配新的bytes对象。
+    每计算完一块，以这一块的字节数调用onProgress（可以在其中抛出异常来中止）。
+    """
+    hasher = hashlib.new(algorithm)
+    buffer = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while size := f.readinto(buffer):
+            hasher.update(view[:size])
+            if onProgress is not None:
+                onProgress(size)
+    return hasher.hexdigest()
@@ -0,0 +1,999 @@
+import json
+import math
+import os
+import re
+import secrets
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import unquote, urlparse
+import requests
+from requests.adapters import HTTPAdapter
+
+from aria2.aria2_client import Aria2RpcException
+from common.log import AppLogger
+from common.utils import hashFile
+
+VERSION = "1.0.0"
+
+# aria2的错误码，tellStatus返回的errorCode与aria2保持一致
+ERROR_UNKNOWN = "1"
+ERROR_RESOURCE_NOT_FOUND = "3"
+ERROR_NETWORK = "6"
+ERROR_FILE_IO = "15"
+ERROR_CHECKSUM = "32"
+
+
+def parseSize(value: str) -> int:
+    """解析aria2格式的大小（例如`512K`、`2M`），0表示不限制"""
+    match = re.fullmatch(r"\s*(\d+)\s*([kKmM]?)\s*", value)
+    if not match:
+        raise ValueError(f"无效的大小：{value}")
+    unit = {"": 1, "k": 1024, "m": 1024 * 1024}[match.group(2).lower()]
+    return int(match.group(1)) * unit
+
+
+class _DownloadError(Exception):
+    def __init__(self, code: str, message: str) -> None:
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class _Cancelled(Exception):
+    """任务被暂停或移除"""
+
+
+class _RateLimiter:
+    """令牌桶限速器，rate为0时不限速，最多允许1秒的突发流量"""
+
+    def __init__(self, rate: int = 0) -> None:
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.allowance = 0.0
+        self.lastTime = time.monotonic()
+
+    def setRate(self, rate: int):
+        with self.lock:
+            self.rate = rate
+            self.allowance = 0.0
+
+    def consume(self, n: int):
+        with self.lock:
+            if self.rate <= 0:
+                return
+            now = time.monotonic()
+            self.allowance = min(self.rate, self.allowance + (now - self.lastTime) * self.rate)
+            self.lastTime = now
+            self.allowance -= n
+            delay = -self.allowance / self.rate
+        if delay > 0:
+            time.sleep(delay)
+
+
+class _Segment:
+    """文件中的一段[start, end)，pos为下一个要写入的位置"""
+
+    def __init__(self, start: int, end: int, pos: int | None = None) -> None:
+        self.start = start
+        self.end = end
+        self.pos = start if pos is None else pos
+        self.isAssigned = False
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.end - self.pos)
+
+    @property
+    def completedLength(self) -> int:
+        return min(self.pos, self.end) - self.start
+
+
+class _DownloadTask:
+    def __init__(self, gid: str, uris: List[str], options: Dict[str, str]) -> None:
+        self.gid = gid
+        self.uris = uris
+        self.options = options
+        self.status = "waiting"
+        self.path = options.get("out", "")
+        self.totalLength = 0
+        self.isRangeSupported = False
+        self.segments: List[_Segment] = []
+        self.errorCode = "0"
+        self.errorMessage = ""
+        self.downloadSpeed = 0
+        # (时间, 已完成长度)的采样，用于计算下载速度
+        self.speedSamples: Deque[Tuple[float, int]] = deque(maxlen=8)
+        self.limiter = _RateLimiter(parseSize(options.get("max-download-limit", "0")))
+        # 用过的URI和失败的次数
+        self.usedUris: Set[str] = set()
+        self.uriFailures: Dict[str, int] = {}
+        self.uriConnections: Dict[str, int] = {}
+        self.responses: Set[requests.Response] = set()
+        # 每次运行时重新创建，旧的运行线程只会看到自己的cancelEvent
+        self.cancelEvent = threading.Event()
+        self.thread: threading.Thread | None = None
+        # 保护segments、uri*和responses
+        self.lock = threading.Lock()
+
+    @property
+    def dir(self) -> str:
+        return self.options["dir"]
+
+    @property
+    def controlFilePath(self) -> str:
+        return self.path + HttpDownloader.CONTROL_FILE_SUFFIX
+
+    @property
+    def completedLength(self) -> int:
+        with self.lock:
+            return sum(segment.completedLength for segment in self.segments)
+
+    @property
+    def connections(self) -> int:
+        with self.lock:
+            return sum(self.uriConnections.values())
+
+    def toStatus(self) -> dict:
+        totalLength = max(self.totalLength, 0)
+        completedLength = self.completedLength
+        status = {
+            "gid": self.gid,
+            "status": self.status,
+            "totalLength": str(totalLength),
+            "completedLength": str(completedLength),
+            "downloadSpeed": str(self.downloadSpeed if self.status == "active" else 0),
+            "uploadSpeed": "0",
+            "connections": str(self.connections),
+            "dir": self.dir,
+            "files": [
+                {
+                    "index": "1",
+                    "path": self.path,
+                    "length": str(totalLength),
+                    "completedLength": str(completedLength),
+                    "selected": "true",
+                    "uris": [
+                        {"uri": uri, "status": "used" if uri in self.usedUris else "waiting"}
+                        for uri in self.uris
+                    ],
+                }
+            ],
+        }
+        if self.status == "error":
+            status["errorCode"] = self.errorCode
+            status["errorMessage"] = self.errorMessage
+        return status
+
+
+class HttpDownloader:
+    """纯Python实现的分段HTTP下载器，在没有aria2（例如非Windows系统）时使用
+
+    - 使用多个连接通过Range请求同时下载同一个文件的不同部分，某一段下载完后会拆分剩余最多的一段，
+      避免最后只剩一个慢连接
+    - 一个任务可以有多个URI（例如镜像站和官方地址），连接会分散到各个URI上，失败的URI会被跳过
+    - 进度保存在文件旁的控制文件中（类似aria2的.aria2文件），暂停或重启后从断点继续
+    - 未完成的任务保存在会话文件中（类似aria2的--save-session），重启后会以相同的gid恢复
+
+    为了能够直接替换Aria2Client，公开的方法与Aria2Client同名、参数和返回值的格式相同，
+    出错时同样抛出Aria2RpcException；支持的选项为aria2选项的一个子集（见GLOBAL_OPTIONS）。
+    任务状态变化时会以aria2通知的方法名（如`aria2.onDownloadComplete`）调用onEvent，
+    onEvent会在下载线程中调用。
+    """
+
+    # 控制文件的后缀名
+    CONTROL_FILE_SUFFIX = ".segments.json"
+    # 小于两倍这个大小的段不再拆分
+    MIN_SPLIT_SIZE = 1024 * 1024
+    CHUNK_SIZE = 64 * 1024
+    # 一个URI失败这么多次后不再使用
+    MAX_URI_FAILURES = 2
+    # 连接和读取的超时时间（秒）
+    TIMEOUT = 15
+    # 检查进度、计算速度和保存控制文件的间隔（秒）
+    MONITOR_INTERVAL = 0.5
+    # 默认值与aria2.conf保持一致
+    GLOBAL_OPTIONS = {
+        "dir": "",
+        "split": "10",
+        "max-connection-per-server": "5",
+        "max-concurrent-downloads": "3",
+        "max-overall-download-limit": "0",
+        "max-download-limit": "0",
+    }
+    # 会被新任务继承的全局选项
+    TASK_OPTION_KEYS = ["dir", "split", "max-connection-per-server", "max-download-limit"]
+    # 返回值被包装在{"result": ...}中的方法（与Aria2Client一致），multicall时需要解包
+    _WRAPPED_METHODS = {"tellStatus", "tellActive", "tellWaiting", "tellStopped", "getGlobalStat"}
+
+    def __init__(
+        self,
+        downloadDir: str,
+        sessionPath: str | None = None,
+        onEvent: Callable[[str, str], None] | None = None,
+    ) -> None:
+        """构造函数
+
+        Args:
+            downloadDir (str): 默认的下载目录（即aria2的--dir）
+            sessionPath (str | None, optional): 会话文件的路径，None表示不保存会话. Defaults to None.
+            onEvent (Callable[[str, str], None] | None, optional): 事件回调，参数为通知的方法名和gid. Defaults to None.
+        """
+        self.globalOptions = {**self.GLOBAL_OPTIONS, "dir": downloadDir}
+        self.sessionPath = sessionPath
+        self.onEvent = onEvent
+        self.tasks: Dict[str, _DownloadTask] = {}
+        # 等待中（包括已暂停）的任务，按队列顺序
+        self.waitingGids: List[str] = []
+        # 已停止的任务，按停止的顺序
+        self.stoppedGids: List[str] = []
+        self.overallLimiter = _RateLimiter(0)
+        self.isShutdown = False
+        # 保护tasks、waitingGids、stoppedGids和任务的status
+        self.lock = threading.RLock()
+        self.session = requests.Session()
+        # 默认的连接池每个主机只保留10个连接，分段下载时不够用
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=64)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    # ---------------------------------------------------------------- 会话
+
+    def start(self):
+        """恢复会话文件中的任务并开始下载"""
+        if self.sessionPath and os.path.exists(self.sessionPath):
+            try:
+                with open(self.sessionPath, "r", encoding="utf-8") as f:
+                    entries: List[dict] = json.load(f)
+            except (OSError, ValueError) as e:
+                AppLogger().warning(f"读取下载会话时发生错误：{e}")
+                entries = []
+            with self.lock:
+                for entry in entries:
+                    task = _DownloadTask(entry["gid"], entry["uris"], entry["options"])
+                    task.path = entry.get("path", "")
+                    task.status = "paused" if entry.get("isPaused") else "waiting"
+                    self.tasks[task.gid] = task
+                    self.waitingGids.append(task.gid)
+            AppLogger().info(f"从下载会话中恢复了{len(entries)}个任务")
+        self._schedule()
+
+    def saveSession(self):
+        """将未完成的任务保存到会话文件中"""
+        if not self.sessionPath:
+            return
+        with self.lock:
+            entries = [
+                {
+                    "gid": task.gid,
+                    "uris": task.uris,
+                    "options": task.options,
+                    "path": task.path,
+                    "isPaused": task.status == "paused",
+                }
+                for task in self.tasks.values()
+                if task.status in ("active", "waiting", "paused")
+            ]
+        os.makedirs(os.path.dirname(self.sessionPath), exist_ok=True)
+        tempPath = self.sessionPath + ".tmp"
+        with open(tempPath, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tempPath, self.sessionPath)
+
+    def shutdown(self, timeout: float = 1):
+        """停止所有下载（进度会保存到控制文件中），最多等待timeout秒"""
+        with self.lock:
+            self.isShutdown = True
+            activeTasks = [task for task in self.tasks.values() if task.status == "active"]
+            for task in activeTasks:
+                self._cancel(task)
+        deadline = time.monotonic() + timeout
+        for task in activeTasks:
+            if task.thread:
+                task.thread.join(max(0, deadline - time.monotonic()))
+        self.session.close()
+
+    def forceShutdown(self):
+        self.shutdown()
+
+    def getVersion(self) -> str:
+        return VERSION
+
+    # ---------------------------------------------------------------- 添加和控制任务
+
+    def _newGid(self) -> str:
+        while True:
+            gid = secrets.token_hex(8)
+            if gid not in self.tasks:
+                return gid
+
+    def addUri(
+        self, uris: List[str], options: Optional[dict] = None, position: Optional[int] = None
+    ) -> str:
+        """添加下载任务，返回一个gid，参数与Aria2Client.addUri相同"""
+        if not uris:
+            raise Aria2RpcException(ERROR_UNKNOWN, "No URI to download.")
+        with self.lock:
+            taskOptions = {key: self.globalOptions[key] for key in self.TASK_OPTION_KEYS}
+            taskOptions.update({key: str(value) for key, value in (options or {}).items()})
+            task = _DownloadTask(self._newGid(), list(uris), taskOptions)
+            self.tasks[task.gid] = task
+            if position is None:
+                self.waitingGids.append(task.gid)
+            else:
+                self.waitingGids.insert(position, task.gid)
+        self._saveSessionQuietly()
+        self._schedule()
+        return task.gid
+
+    def _getTask(self, gid: str) -> _DownloadTask:
+        task = self.tasks.get(gid)
+        if task is None:
+            raise Aria2RpcException(ERROR_UNKNOWN, f"GID {gid} is not found")
+        return task
+
+    def remove(self, gid: str):
+        with self.lock:
+            task = self._getTask(gid)
+            if task.status in ("complete", "error", "removed"):
+                raise Aria2RpcException(ERROR_UNKNOWN, f"Active Download not found for GID#{gid}")
+            if task.status == "active":
+                self._cancel(task)
+            else:
+                self.waitingGids.remove(gid)
+            task.status = "removed"
+            self.stoppedGids.append(gid)
+        self._saveSessionQuietly()
+        self._emit("aria2.onDownloadStop", gid)
+        self._schedule()
+
+    def pause(self, gid: str):
+        with self.lock:
+            task = self._getTask(gid)
+            if task.status == "active":
+                self._cancel(task)
+                self.waitingGids.insert(0, gid)
+            elif task.status != "waiting":
+                raise Aria2RpcException(ERROR_UNKNOWN, f"GID#{gid} cannot be paused now")
+            task.status = "paused"
+        self._saveSessionQuietly()
+        self._emit("aria2.onDownloadPause", gid)
+        self._schedule()
+
+    def forcePause(self, gid: str):
+        self.pause(gid)
+
+    def pauseAll(self):
+        with self.lock:
+            gids = [gid for gid, task in self.tasks.items() if task.status in ("active", "waiting")]
+        for gid in gids:
+            self.pause(gid)
+
+    def unpause(self, gid: str):
+        with self.lock:
+            task = self._getTask(gid)
+            if task.status != "paused":
+                raise Aria2RpcException(ERROR_UNKNOWN, f"GID#{gid} cannot be unpaused now")
+            task.status = "waiting"
+        self._saveSessionQuietly()
+        self._schedule()
+
+    def unpauseAll(self):
+        with self.lock:
+            gids = [gid for gid, task in self.tasks.items() if task.status == "paused"]
+        for gid in gids:
+            self.unpause(gid)
+
+    def changePosition(self, gid: str, pos: int, how: str) -> int:
+        """调整等待中的任务在队列中的位置，how为POS_SET、POS_CUR或POS_END，返回调整后的位置"""
+        with self.lock:
+            if gid not in self.waitingGids:
+                raise Aria2RpcException(ERROR_UNKNOWN, f"GID#{gid} not found in the waiting queue.")
+            current = self.waitingGids.index(gid)
+            base = {"POS_SET": 0, "POS_CUR": current, "POS_END": len(self.waitingGids) - 1}[how]
+            newPosition = min(max(base + pos, 0), len(self.waitingGids) - 1)
+            self.waitingGids.remove(gid)
+            self.waitingGids.insert(newPosition, gid)
+            return newPosition
+
+    def changeUri(
+        self,
+        gid: str,
+        fileIndex: int,
+        delUris: List[str],
+        addUris: List[str],
+        position: Optional[int] = None,
+    ) -> List[int]:
+        """先删除delUris再添加addUris，返回[删除的数量, 添加的数量]
+
+        已经建立的连接不受影响，新的连接会使用修改后的URI列表。
+        """
+        if fileIndex != 1:
+            raise Aria2RpcException(ERROR_UNKNOWN, f"fileIndex is out of range: {fileIndex}")
+        with self.lock:
+            task = self._getTask(gid)
+            with task.lock:
+                deleted = 0
+                for uri in delUris:
+                    if uri in task.uris:
+                        task.uris.remove(uri)
+                        deleted += 1
+                if position is None:
+                    task.uris.extend(addUris)
+                else:
+                    task.uris[position:position] = addUris
+                for uri in addUris:
+                    # 重新添加的URI重新获得机会
+                    task.uriFailures.pop(uri, None)
+        self._saveSessionQuietly()
+        return [deleted, len(addUris)]
+
+    def changeOption(self, gid: str, options: dict):
+        """修改任务的选项
+
+        max-download-limit会立即生效，checksum在下载完成时生效，其余选项在任务下次开始时生效
+        """
+        with self.lock:
+            task = self._getTask(gid)
+            task.options.update({key: str(value) for key, value in options.items()})
+            if "max-download-limit" in options:
+                task.limiter.setRate(parseSize(str(options["max-download-limit"])))
+
+    def changeGlobalOption(self, options: dict):
+        with self.lock:
+            self.globalOptions.update({key: str(value) for key, value in options.items()})
+            if "max-overall-download-limit" in options:
+                self.overallLimiter.setRate(parseSize(str(options["max-overall-download-limit"])))
+        self._schedule()
+
+    def getGlobalOption(self) -> dict:
+        with self.lock:
+            return dict(self.globalOptions)
+
+    def purgeDownloadResult(self):
+        with self.lock:
+            for gid in self.stoppedGids:
+                self.tasks.pop(gid)
+            self.stoppedGids.clear()
+
+    def removeDownloadResult(self, gid: str):
+        with self.lock:
+            if gid not in self.stoppedGids:
+                raise Aria2RpcException(
+                    ERROR_UNKNOWN, f"Could not remove download result of GID#{gid}"
+                )
+            self.stoppedGids.remove(gid)
+            self.tasks.pop(gid)
+
+    # ---------------------------------------------------------------- 查询
+
+    @staticmethod
+    def _filterKeys(status: dict, keys: Optional[list]) -> dict:
+        if not keys:
+            return status
+        return {key: value for key, value in status.items() if key in keys}
+
+    def _statuses(self, gids: List[str], keys: Optional[list]) -> List[dict]:
+        return [self._filterKeys(self.tasks[gid].toStatus(), keys) for gid in gids]
+
+    def tellStatus(self, gid: str, keys: Optional[list] = None):
+        with self.lock:
+            return {"result": self._filterKeys(self._getTask(gid).toStatus(), keys)}
+
+    def tellActive(self, keys: Optional[list] = None):
+        with self.lock:
+            gids = [gid for gid, task in self.tasks.items() if task.status == "active"]
+            return {"result": self._statuses(gids, keys)}
+
+    def tellWaiting(self, offset: int, num: int, keys: Optional[list] = None):
+        with self.lock:
+            return {"result": self._statuses(self.waitingGids[offset : offset + num], keys)}
+
+    def tellStopped(self, offset: int, num: int, keys: Optional[list] = None):
+        with self.lock:
+            return {"result": self._statuses(self.stoppedGids[offset : offset + num], keys)}
+
+    def iterWaiting(self, keys: Optional[list] = None, pageSize: int = 100) -> Iterator[dict]:
+        with self.lock:
+            return iter(self._statuses(list(self.waitingGids), keys))
+
+    def iterStopped(self, keys: Optional[list] = None, pageSize: int = 100) -> Iterator[dict]:
+        with self.lock:
+            return iter(self._statuses(list(self.stoppedGids), keys))
+
+    def tellAll(
+        self, keys: Optional[list] = None, pageSize: int = 100
+    ) -> Tuple[List[dict], List[dict], List[dict]]:
+        """获取下载中、等待中和已停止的全部任务（同一时刻的状态）"""
+        with self.lock:
+            return (
+                self.tellActive(keys)["result"],
+                self._statuses(self.waitingGids, keys),
+                self._statuses(self.stoppedGids, keys),
+            )
+
+    def getGlobalStat(self):
+        with self.lock:
+            activeTasks = [task for task in self.tasks.values() if task.status == "active"]
+            return {
+                "result": {
+                    "downloadSpeed": str(sum(task.downloadSpeed for task in activeTasks)),
+                    "uploadSpeed": "0",
+                    "numActive": str(len(activeTasks)),
+                    "numWaiting": str(len(self.waitingGids)),
+                    "numStopped": str(len(self.stoppedGids)),
+                    "numStoppedTotal": str(len(self.stoppedGids)),
+                }
+            }
+
+    def multicall(self, *calls: Tuple[Any, ...]) -> List[Any]:
+        """依次调用多个方法，格式与Aria2Client.multicall相同（方法名带有`aria2.`前缀）
+
+        与aria2一样，某个方法出错时其余的方法仍会执行，全部执行完后再抛出第一个错误。
+        """
+        results = []
+        firstError: Aria2RpcException | None = None
+        for method, *params in calls:
+            name = method.removeprefix("aria2.")
+            func = getattr(self, name, None)
+            try:
+                if func is None or name.startswith("_"):
+                    raise Aria2RpcException(ERROR_UNKNOWN, f"No such method: {method}")
+                result = func(*params)
+            except Aria2RpcException as e:
+                firstError = firstError or e
+                results.append(None)
+                continue
+            results.append(result["result"] if name in self._WRAPPED_METHODS else result)
+        if firstError is not None:
+            raise firstError
+        return results
+
+    # ---------------------------------------------------------------- 调度
+
+    def _emit(self, method: str, gid: str):
+        if self.onEvent:
+            self.onEvent(method, gid)
+
+    def _saveSessionQuietly(self):
+        try:
+            self.saveSession()
+        except OSError as e:
+            AppLogger().warning(f"保存下载会话时发生错误：{e}")
+
+    def _cancel(self, task: _DownloadTask):
+        """让任务的运行线程尽快退出，需要持有self.lock"""
+        task.cancelEvent.set()
+        with task.lock:
+            # 关闭正在读取的响应，否则工作线程要等到读取超时才能退出
+            for response in task.responses:
+                response.close()
+
+    def _schedule(self):
+        """按队列顺序开始等待中的任务，直到达到max-concurrent-downloads"""
+        with self.lock:
+            if self.isShutdown:
+                return
+            activeCount = sum(1 for task in self.tasks.values() if task.status == "active")
+            maxConcurrent = int(self.globalOptions["max-concurrent-downloads"])
+            for gid in list(self.waitingGids):
+                if activeCount >= maxConcurrent:
+                    break
+                task = self.tasks[gid]
+                if task.status != "waiting":
+                    continue
+                self.waitingGids.remove(gid)
+                task.status = "active"
+                task.cancelEvent = threading.Event()
+                previousThread = task.thread
+                task.thread = threading.Thread(
+                    target=self._runTask,
+                    args=(task, task.cancelEvent, previousThread),
+                    name=f"HttpDownloader-{gid}",
+                    daemon=True,
+                )
+                task.thread.start()
+                activeCount += 1
+
+    def _runTask(
+        self,
+        task: _DownloadTask,
+        cancelEvent: threading.Event,
+        previousThread: threading.Thread | None,
+    ):
+        # 同一个任务被暂停后马上继续时，上一次运行可能还没有退出，等它保存完控制文件
+        if previousThread:
+            previousThread.join()
+        self._emit("aria2.onDownloadStart", task.gid)
+        event = "aria2.onDownloadComplete"
+        try:
+            self._download(task, cancelEvent)
+        except _Cancelled:
+            # 状态已经由pause或remove修改，事件也已经发出
+            return
+        except _DownloadError as e:
+            if cancelEvent.is_set():
+                return
+            AppLogger().warning(f"下载任务{task.gid}失败：{e.message}")
+            task.errorCode, task.errorMessage = e.code, e.message
+            event = "aria2.onDownloadError"
+        except OSError as e:
+            if cancelEvent.is_set():
+                return
+            AppLogger().warning(f"下载任务{task.gid}写入文件失败：{e}")
+            task.errorCode, task.errorMessage = ERROR_FILE_IO, str(e)
+            event = "aria2.onDownloadError"
+        with self.lock:
+            if cancelEvent.is_set():
+                return
+            task.status = "complete" if event == "aria2.onDownloadComplete" else "error"
+            self.stoppedGids.append(task.gid)
+        self._saveSessionQuietly()
+        self._emit(event, task.gid)
+        self._schedule()
+
+    # ---------------------------------------------------------------- 下载
+
+    def _probe(self, task: _DownloadTask):
+        """请求第一个字节，得到文件大小、文件名以及服务器是否支持Range"""
+        lastError = _DownloadError(ERROR_UNKNOWN, "No URI available.")
+        for uri in task.uris:
+            try:
+                with self.session.get(
+                    uri, headers={"Range": "bytes=0-0"}, stream=True, timeout=self.TIMEOUT
+                ) as response:
+                    if response.status_code == 206:
+                        contentRange = response.headers.get("Content-Range", "")
+                        task.totalLength = int(contentRange.rsplit("/", 1)[1])
+                        task.isRangeSupported = True
+                    elif response.status_code == 200:
+                        task.totalLength = int(response.headers.get("Content-Length", -1))
+                        task.isRangeSupported = False
+                    else:
+                        code = (
+                            ERROR_RESOURCE_NOT_FOUND
+                            if response.status_code == 404
+                            else ERROR_UNKNOWN
+                        )
+                        raise _DownloadError(code, f"{uri}: HTTP {response.status_code}")
+                    if not task.path:
+                        fileName = self._fileNameFromResponse(response)
+                        task.path = self._uniquePath(os.path.join(task.dir, fileName))
+                    return
+            except requests.exceptions.RequestException as e:
+                lastError = _DownloadError(ERROR_NETWORK, f"{uri}: {e}")
+            except (_DownloadError, ValueError, IndexError) as e:
+                lastError = (
+                    e
+                    if isinstance(e, _DownloadError)
+                    else _DownloadError(ERROR_UNKNOWN, f"{uri}: {e}")
+                )
+            task.uriFailures[uri] = self.MAX_URI_FAILURES
+        raise lastError
+
+    @staticmethod
+    def _fileNameFromResponse(response: requests.Response) -> str:
+        disposition = response.headers.get("Content-Disposition", "")
+        match = re.search(r"filename\*=UTF-8''([^;]+)", disposition, re.IGNORECASE)
+        if match:
+            return os.path.basename(unquote(match.group(1)))
+        match = re.search(r'filename="?([^";]+)"?', disposition, re.IGNORECASE)
+        if match:
+            return os.path.basename(match.group(1))
+        # 重定向后的地址中的文件名
+        return os.path.basename(unquote(urlparse(response.url).path)) or "index.html"
+
+    def _uniquePath(self, path: str) -> str:
+        """与aria2的auto-file-renaming一样，文件已存在时在文件名后加上.1、.2等"""
+        with self.lock:
+            usedPaths = {task.path for task in self.tasks.values()}
+        candidate = path
+        root, ext = os.path.splitext(path)
+        index = 1
+        while candidate in usedPaths or os.path.exists(candidate):
+            candidate = f"{root}.{index}{ext}"
+            index += 1
+        return candidate
+
+    def _loadControlFile(self, task: _DownloadTask) -> bool:
+        """从控制文件中恢复进度，成功时返回True"""
+        if not (os.path.exists(task.controlFilePath) and os.path.exists(task.path)):
+            return False
+        try:
+            with open(task.controlFilePath, "r", encoding="utf-8") as f:
+                obj: dict = json.load(f)
+            if obj["totalLength"] != task.totalLength or not task.isRangeSupported:
+                return False
+            task.segments = [_Segment(start, end, pos) for start, end, pos in obj["segments"]]
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        AppLogger().info(f"下载任务{task.gid}从断点继续：{task.completedLength}/{task.totalLength}")
+        return True
+
+    def _saveControlFile(self, task: _DownloadTask):
+        with task.lock:
+            segments = [[s.start, s.end, s.pos] for s in task.segments if s.remaining > 0]
+        tempPath = task.controlFilePath + ".tmp"
+        with open(tempPath, "w", encoding="utf-8") as f:
+            json.dump({"totalLength": task.totalLength, "segments": segments}, f)
+        os.replace(tempPath, task.controlFilePath)
+
+    def _prepareSegments(self, task: _DownloadTask):
+        os.makedirs(os.path.dirname(task.path), exist_ok=True)
+        if self._loadControlFile(task):
+            return
+        # 预先分配文件大小，各个连接直接写入各自的位置
+        with open(task.path, "wb") as f:
+            if task.totalLength > 0:
+                f.truncate(task.totalLength)
+        if not task.isRangeSupported or task.totalLength <= 0:
+            # 不支持Range（或不知道大小）时只能用一个连接从头下载
+            end = task.totalLength if task.totalLength >= 0 else math.inf
+            task.segments = [_Segment(0, end)]  # type: ignore
+            return
+        count = max(1, min(int(task.options["split"]), task.totalLength // self.MIN_SPLIT_SIZE))
+        size = math.ceil(task.totalLength / count)
+        task.segments = [
+            _Segment(start, min(start + size, task.totalLength))
+            for start in range(0, task.totalLength, size)
+        ]
+
+    def _download(self, task: _DownloadTask, cancelEvent: threading.Event):
+        if not task.segments:
+            task.uriFailures.clear()
+            self._probe(task)
+            self._prepareSegments(task)
+        else:
+            # 暂停后继续，保留已经下载的段
+            with task.lock:
+                task.uriFailures.clear()
+                for segment in task.segments:
+                    segment.isAssigned = False
+
+        if task.isRangeSupported:
+            connectionCount = min(
+                int(task.options["split"]),
+                int(task.options["max-connection-per-server"]) * len(task.uris),
+            )
+        else:
+            connectionCount = 1
+        task.speedSamples.clear()
+        lastSaveTime = time.monotonic()
+        with ThreadPoolExecutor(connectionCount, f"HttpDownloader-{task.gid}") as executor:
+            futures = [
+                executor.submit(self._worker, task, cancelEvent) for _ in range(connectionCount)
+            ]
+            try:
+                while not all(future.done() for future in futures):
+                    cancelEvent.wait(self.MONITOR_INTERVAL)
+                    self._updateSpeed(task)
+                    if task.isRangeSupported and time.monotonic() - lastSaveTime >= 1:
+                        self._saveControlFile(task)
+                        lastSaveTime = time.monotonic()
+                    if cancelEvent.is_set():
+                        break
+            finally:
+                if task.isRangeSupported:
+                    self._saveControlFile(task)
+            for future in futures:
+                # 传播工作线程中的异常
+                future.result()
+        if cancelEvent.is_set():
+            raise _Cancelled()
+        with task.lock:
+            isCompleted = all(segment.remaining == 0 for segment in task.segments)
+        if not isCompleted:
+            raise _DownloadError(ERROR_NETWORK, "All URIs failed.")
+        if os.path.exists(task.controlFilePath):
+            os.remove(task.controlFilePath)
+        task.downloadSpeed = 0
+        self._verifyChecksum(task)
+
+    @staticmethod
+    def _verifyChecksum(task: _DownloadTask):
+        """与aria2的checksum选项一样，下载完成后校验文件的哈希值（格式为`md5=...`）"""
+        checksum = task.options.get("checksum")
+        if not checksum:
+            return
+        algorithm, expected = checksum.split("=", 1)
+        if hashFile(task.path, algorithm.replace("-", "")).lower() != expected.lower():
+            raise _DownloadError(ERROR_CHECKSUM, "Checksum validation failed.")
+
+    def _updateSpeed(self, task: _DownloadTask):
+        now = time.monotonic()
+        task.speedSamples.append((now, task.completedLength))
+        oldestTime, oldestLength = task.speedSamples[0]
+        if now > oldestTime:
+            task.downloadSpeed = int((task.speedSamples[-1][1] - oldestLength) / (now - oldestTime))
+
+    def _acquireUri(self, task: _DownloadTask) -> str | None:
+        """选择一个可用且连接数最少的URI，每个主机的连接数不超过max-connection-per-server"""
+        maxPerServer = int(task.options["max-connection-per-server"])
+        with task.lock:
+            hostConnections: Dict[str, int] = {}
+            for uri, count in task.uriConnections.items():
+                host = urlparse(uri).netloc
+                hostConnections[host] = hostConnections.get(host, 0) + count
+            candidates = [
+                uri
+                for uri in task.uris
+                if task.uriFailures.get(uri, 0) < self.MAX_URI_FAILURES
+                and hostConnections.get(urlparse(uri).netloc, 0) < maxPerServer
+            ]
+            if not candidates:
+                return None
+            # min会返回第一个最小值，因此连接数相同时靠前的URI优先
+            uri = min(candidates, key=lambda u: task.uriConnections.get(u, 0))
+            task.uriConnections[uri] = task.uriConnections.get(uri, 0) + 1
+            task.usedUris.add(uri)
+            return uri
+
+    def _releaseUri(self, task: _DownloadTask, uri: str, isFailed: bool):
+        with task.lock:
+            task.uriConnections[uri] -= 1
+            if isFailed:
+                task.uriFailures[uri] = task.uriFailures.get(uri, 0) + 1
+
+    def _nextSegment(self, task: _DownloadTask) -> _Segment | None:
+        """取一个没有连接在下载的段，没有的话把剩余最多的段拆成两半"""
+        with task.lock:
+            for segment in task.segments:
+                if not segment.isAssigned and segment.remaining > 0:
+                    segment.isAssigned = True
+                    return segment
+            if not task.isRangeSupported:
+                return None
+            largest = max(task.segments, key=lambda s: s.remaining, default=None)
+            if largest is None or largest.remaining < 2 * self.MIN_SPLIT_SIZE:
+                return None
+            middle = largest.pos + largest.remaining // 2
+            newSegment = _Segment(middle, largest.end)
+            # 原来的连接读到middle就会停止
+            largest.end = middle
+            newSegment.isAssigned = True
+            task.segments.append(newSegment)
+            return newSegment
+
+    def _worker(self, task: _DownloadTask, cancelEvent: threading.Event):
+        """一个连接：不断地取段来下载，直到没有可下载的段或者没有可用的URI"""
+        segment: _Segment | None = None
+        with open(task.path, "r+b") as f:
+            while not cancelEvent.is_set():
+                uri = self._acquireUri(task)
+                if uri is None:
+                    break
+                if segment is None or segment.remaining == 0:
+                    segment = self._nextSegment(task)
+                if segment is None:
+                    self._releaseUri(task, uri, False)
+                    break
+                try:
+                    self._fetchSegment(task, segment, uri, f, cancelEvent)
+                except (requests.exceptions.RequestException, _DownloadError) as e:
+                    if cancelEvent.is_set():
+                        break
+                    AppLogger().debug(f"下载任务{task.gid}的连接出错（{uri}）：{e}")
+                    self._releaseUri(task, uri, True)
+                    continue
+                self._releaseUri(task, uri, False)
+        if segment is not None:
+            # 还没下载完的段（例如URI全都失败了）交还给其他连接
+            with task.lock:
+                segment.isAssigned = False
+
+    def _fetchSegment(
+        self, task: _DownloadTask, segment: _Segment, uri: str, f, cancelEvent: threading.Event
+    ):
+        headers = {}
+        if task.isRangeSupported:
+            headers["Range"] = f"bytes={segment.pos}-{segment.end - 1}"
+        elif segment.pos > 0:
+            # 不支持Range时只能从头开始
+            with task.lock:
+                segment.pos = 0
+        response = self.session.get(uri, headers=headers, stream=True, timeout=self.TIMEOUT)
+        with task.lock:
+            task.responses.add(response)
+        try:
+            expectedStatus = 206 if task.isRangeSupported else 200
+            if response.status_code != expectedStatus:
+                raise _DownloadError(ERROR_UNKNOWN, f"HTTP {response.status_code}")
+            f.seek(segment.pos)
+            for chunk in response.iter_content(self.CHUNK_SIZE):
+                if cancelEvent.is_set():
+                    return
+                with task.lock:
+                    # 段可能在下载过程中被拆分，end会变小
+                    length = min(len(chunk), segment.end - segment.pos)
+                if length <= 0:
+                    return
+                f.write(chunk[:length])
+                with task.lock:
+                    segment.pos += length
+                task.limiter.consume(length)
+                self.overallLimiter.consume(length)
+                if segment.remaining == 0:
+                    return
+        finally:
+            with task.lock:
+                task.responses.discard(response)
+            response.close()
+        if segment.end == math.inf:
+            # 不知道大小的文件，读到结尾就是下载完了
+            with task.lock:
+                segment.end = segment.pos
+            task.totalLength = segment.pos
+        elif segment.remaining > 0 and not cancelEvent.is_set():
+            raise _DownloadError(
+                ERROR_NETWORK, "Connection closed before the segment was finished."
+            )
+
+
+def benchmark():
+    """在本地的Range服务器上比较不同分段数的下载速度，服务器限制了单个连接的速度"""
+    import hashlib
+    import tempfile
+    from http_downloader.range_server import RangeHTTPServer
+
+    fileSize = 32 * 1024 * 1024
+    connectionRate = 4 * 1024 * 1024
+    with tempfile.TemporaryDirectory() as serveDir, tempfile.TemporaryDirectory() as downloadDir:
+        data = os.urandom(fileSize)
+        expectedMd5 = hashlib.md5(data).hexdigest()
+        with open(os.path.join(serveDir, "mod.zip"), "wb") as f:
+            f.write(data)
+        server = RangeHTTPServer(serveDir, connectionRate).startInBackground()
+        url = f"{server.baseUrl}/mod.zip"
+        print(
+            f"文件大小{fileSize // 1024 // 1024}MiB，服务器单连接限速{connectionRate // 1024 // 1024}MiB/s"
+        )
+
+        for split in (1, 2, 4, 8, 16):
+            downloader = HttpDownloader(downloadDir)
+            options = {"split": str(split), "max-connection-per-server": str(split)}
+            startTime = time.monotonic()
+            gid = downloader.addUri([url], options)
+            while downloader.tellStatus(gid, ["status"])["result"]["status"] == "active":
+                time.sleep(0.05)
+            elapsed = time.monotonic() - startTime
+            status = downloader.tellStatus(gid)["result"]
+            path = status["files"][0]["path"]
+            with open(path, "rb") as f:
+                md5 = hashlib.md5(f.read()).hexdigest()
+            print(
+                f"split={split:2d}: {elapsed:6.2f}s, {fileSize / elapsed / 1024 / 1024:6.2f}MiB/s, "
+                f"status={status['status']}, md5{'一致' if md5 == expectedMd5 else '不一致'}"
+            )
+            os.remove(path)
+            downloader.shutdown()
+
+        # 暂停后继续，以及重启后从控制文件恢复
+        sessionPath = os.path.join(downloadDir, "session.json")
+        downloader = HttpDownloader(downloadDir, sessionPath)
+        gid = downloader.addUri([url], {"split": "4", "max-connection-per-server": "4"})
+        time.sleep(1)
+        downloader.pause(gid)
+        print(f"暂停时已下载：{downloader.tellStatus(gid)['result']['completedLength']}")
+        downloader.saveSession()
+        downloader.shutdown()
+        servedBefore = server.servedBytes
+        downloader = HttpDownloader(downloadDir, sessionPath)
+        downloader.start()
+        downloader.unpause(gid)
+        while downloader.tellStatus(gid, ["status"])["result"]["status"] in ("active", "waiting"):
+            time.sleep(0.05)
+        path = downloader.tellStatus(gid)["result"]["files"][0]["path"]
+        with open(path, "rb") as f:
+            md5 = hashlib.md5(f.read()).hexdigest()
+        print(
+            f"恢复后下载完成：md5{'一致' if md5 == expectedMd5 else '不一致'}，"
+            f"恢复后服务器发送了{(server.servedBytes - servedBefore) // 1024}KiB"
+        )
+        downloader.shutdown()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,159 @@
+import email.utils
+import os
+import re
+import shutil
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """支持Range请求的静态文件处理器（http.server自带的SimpleHTTPRequestHandler不支持Range）
+
+    只支持单个范围（`bytes=a-b`、`bytes=a-`、`bytes=-n`），足够模拟Mod下载站。
+    服务器的directory和connectionRate属性分别为文件所在的目录和每个连接的速度上限（字节/秒，0为不限速），
+    限速用于模拟单个连接速度有限的服务器。
+    """
+
+    server: "RangeHTTPServer"
+    # 保持连接，模拟真实服务器，也能测试客户端的连接复用
+    protocol_version = "HTTP/1.1"
+    CHUNK_SIZE = 64 * 1024
+
+    def log_message(self, format, *args):
+        # 测试时不需要输出每个请求
+        pass
+
+    def _resolvePath(self) -> str | None:
+        relativePath = self.path.split("?", 1)[0].lstrip("/")
+        path = os.path.realpath(os.path.join(self.server.directory, relativePath))
+        if not path.startswith(os.path.realpath(self.server.directory)) or not os.path.isfile(path):
+            return None
+        return path
+
+    def _parseRange(self, fileSize: int) -> Tuple[int, int] | None:
+        """返回[start, end)，没有Range头时返回None；范围不合法时抛出ValueError"""
+        header = self.headers.get("Range")
+        if not header:
+            return None
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+        if not match or match.group(1) == match.group(2) == "":
+            raise ValueError(header)
+        if match.group(1) == "":
+            # bytes=-n表示最后n个字节
+            start = max(0, fileSize - int(match.group(2)))
+            end = fileSize
+        else:
+            start = int(match.group(1))
+            end = min(fileSize, int(match.group(2)) + 1) if match.group(2) else fileSize
+        if start >= fileSize or start >= end:
+            raise ValueError(header)
+        return start, end
+
+    def do_HEAD(self):
+        self._handle(isSendBody=False)
+
+    def do_GET(self):
+        try:
+            self._handle(isSendBody=True)
+        except ConnectionError:
+            # 客户端不需要剩下的数据时会直接断开连接（例如分段被拆分了）
+            self.close_connection = True
+
+    def _handle(self, isSendBody: bool):
+        self.server.requestCount += 1
+        path = self._resolvePath()
+        if path is None:
+            self.send_error(404)
+            return
+        fileSize = os.path.getsize(path)
+        try:
+            byteRange = self._parseRange(fileSize)
+        except ValueError:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{fileSize}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        start, end = byteRange if byteRange else (0, fileSize)
+        self.send_response(206 if byteRange else 200)
+        if byteRange:
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{fileSize}")
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(end - start))
+        self.send_header("Accept-Ranges", "bytes")
+        mtime = os.path.getmtime(path)
+        self.send_header("Last-Modified", email.utils.formatdate(mtime, usegmt=True))
+        self.send_header("ETag", f'"{int(mtime)}-{fileSize}"')
+        self.end_headers()
+        if not isSendBody:
+            return
+        self.server.servedBytes += end - start
+        with open(path, "rb") as f:
+            f.seek(start)
+            if self.server.connectionRate <= 0:
+                shutil.copyfileobj(_LimitedReader(f, end - start), self.wfile, self.CHUNK_SIZE)
+                return
+            remaining = end - start
+            startTime = time.monotonic()
+            sent = 0
+            while remaining > 0:
+                chunk = f.read(min(self.CHUNK_SIZE, remaining))
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+                sent += len(chunk)
+                # 按照connectionRate计算此时最多应该发送了多少字节，发多了就等一等
+                delay = sent / self.server.connectionRate - (time.monotonic() - startTime)
+                if delay > 0:
+                    time.sleep(delay)
+
+
+class _LimitedReader:
+    """只读取前size个字节的文件包装，配合shutil.copyfileobj使用"""
+
+    def __init__(self, f, size: int) -> None:
+        self.f = f
+        self.remaining = size
+
+    def read(self, n: int = -1) -> bytes:
+        if self.remaining <= 0:
+            return b""
+        n = self.remaining if n < 0 else min(n, self.remaining)
+        data = self.f.read(n)
+        self.remaining -= len(data)
+        return data
+
+
+class RangeHTTPServer(ThreadingHTTPServer):
+    """支持Range请求的本地HTTP服务器，用于测试和基准测试下载器"""
+
+    daemon_threads = True
+
+    def __init__(self, directory: str, connectionRate: int = 0) -> None:
+        super().__init__(("127.0.0.1", 0), RangeRequestHandler)
+        self.directory = directory
+        self.connectionRate = connectionRate
+        # 统计信息，用于测试时检查实际发出了多少请求、传输了多少数据
+        self.requestCount = 0
+        self.servedBytes = 0
+
+    @property
+    def baseUrl(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def startInBackground(self) -> "RangeHTTPServer":
+        """在后台线程中运行服务器，返回自身，使用shutdown()停止"""
+        threading.Thread(target=self.serve_forever, name="RangeHTTPServer", daemon=True).start()
+        return self
+
+
+if __name__ == "__main__":
+    import sys
+
+    server = RangeHTTPServer(sys.argv[1] if len(sys.argv) > 1 else ".").startInBackground()
+    print(f"serving at {server.baseUrl}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
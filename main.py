@@ -16,6 +16,7 @@ from qfluentwidgets import (
 from app_config import VERSION, Version
 from common.common_ui import ChineseMessageBox
 from common.mod.installation.mod_download_manager import ModDownloadManager
+from common.mod.installation.mod_trash import ModTrashCollector
 from common.path import getResourcePath
 from common.qrequest import QRequestReady
 from common.log import AppLogger, initAppLogEnvironment
@@ -164,14 +165,8 @@ class AppMainWindow(FluentWindow):
         )
 
     def closeEvent(self, e):
-        aria2 = ModDownloadManager.getInstance().aria2c
-        # 终止aria2进程
-        aria2.process.terminate()
-        # 等待aria2的进程结束（否则打包后清理临时资源时会出错（应该是因为aria2c.exe占用））
-        aria2.process.wait(timeout=3)  # 设置3秒超时
-        # 如果进程还在运行，则kill
-        if aria2.process.poll() is None:
-            aria2.process.kill()
+        # 保存下载任务并关闭aria2，未完成的下载会在下次启动时继续
+        ModDownloadManager.getInstance().shutdown()
         e.accept()
         AppLogger().info(f"App关闭")
 
@@ -179,6 +174,8 @@ class AppMainWindow(FluentWindow):
 if __name__ == "__main__":
     initAppLogEnvironment()
     AppLogger().info(f"App启动")
+    # 继续删除上次没有删完的旧Mod目录
+    ModTrashCollector.getInstance().resume()
     app = QApplication()
     window = AppMainWindow()
     window.show()
@@ -1,6 +1,6 @@
 from logging import info
 from turtle import down
-from typing import List, cast
+from typing import Any, Callable, List, cast
 from PySide6.QtCore import QTimer
 
 from common.mod.installation.download_info import ModDownloadTaskInfo
@@ -27,6 +27,10 @@ def formatMirrorStationsPrompt(dlInfo: ModDownloadTaskInfo) -> str:
         prompt = f"通过{mirrorsStationsText}加速下载"
     else:
         prompt = ""
+    interventionCount = ModDownloadManager.getInstance().watchdog.interventionCount(dlInfo.gid)
+    if interventionCount:
+        stallPrompt = f"下载缓慢，已自动处理{interventionCount}次"
+        prompt = f"{prompt}（{stallPrompt}）" if prompt else stallPrompt
     return prompt
 
 
@@ -37,6 +41,16 @@ def formatProgressInfo(dlInfo: ModDownloadTaskInfo):
     return f"{completedNum}{completedUnit} / {totalNum}{totalUnit}  {speedNum} {speedUnit}/s"
 
 
+def formatImportProgressInfo(importStatus: ModImportTaskStatus) -> str:
+    if importStatus.isQueued:
+        return f"等待导入（共{ModImportTaskDispatcher.getInstance().queueDepth}个Mod排队中）"
+    if not importStatus.totalBytes:
+        return "解压并导入中..."
+    completedNum, completedUnit = byteLengthToHumanReadable(importStatus.completedBytes)
+    totalNum, totalUnit = byteLengthToHumanReadable(importStatus.totalBytes)
+    return f"解压并导入中 {completedNum}{completedUnit} / {totalNum}{totalUnit}"
+
+
 def convertInstallationInfoToCardOptions(
     status: ModInstallationStatus,
 ) -> ModInstallationCardOptions:
@@ -70,12 +84,22 @@ def convertInstallationInfoToCardOptions(
         case ModInstallationStage.importing:
             importStatus = cast(ModImportTaskStatus, status.importTaskStatus)
             return ModInstallationCardOptions(
-                progressBarPercentage=-1,
+                progressBarPercentage=(
+                    calculateProgressPercentage(
+                        importStatus.completedBytes, importStatus.totalBytes, 3
+                    )
+                    if importStatus.totalBytes
+                    else -1
+                ),
                 progressBarColor=None,
-                closeButtonClickedCallback=None,
+                closeButtonClickedCallback=(
+                    (lambda: ModImportTaskDispatcher.getInstance().cancelTask(importStatus.gid))
+                    if importStatus.isCancellable
+                    else None
+                ),
                 modName=importStatus.installationInfo.modName,
                 prompt="",
-                progressInfo="解压并导入中...",
+                progressInfo=formatImportProgressInfo(importStatus),
             )
         case ModInstallationStage.succeed:
             importStatus = cast(ModImportTaskStatus, status.importTaskStatus)
@@ -137,22 +161,86 @@ CARD_ORDER = [
 ]
 
 
+# 存在这些阶段的任务时，需要轮询以更新进度
+IN_PROGRESS_STAGES = {
+    ModInstallationStage.waiting,
+    ModInstallationStage.downloading,
+    ModInstallationStage.importing,
+}
+# 存在这些阶段的任务时，轮询时需要刷新下载任务快照
+DOWNLOADING_STAGES = {
+    ModInstallationStage.waiting,
+    ModInstallationStage.downloading,
+}
+
+
 class ModInstallationPresenter:
+    """安装任务界面的Presenter
+
+    下载任务的开始、完成等事件由ModDownloadManager推送，
+    只有在界面显示且存在进行中的任务时才会轮询进度，空闲时不产生任何请求。
+
+    轮询时只会请求下载管理器异步刷新快照，刷新完成后（snapshotUpdated）再渲染，不会阻塞主线程。
+    """
+
     def __init__(self, view) -> None:
         from ui.installation.view import ModInstallationManagerView
 
         self.view: ModInstallationManagerView = view
 
         self.isShow = False
+        self.hasDownloadingTasks = False
         self.timer = QTimer()
         self.timer.setInterval(500)
         self.timer.timeout.connect(self.pollingUpdate)
-        self.timer.start()
+        ModDownloadManager.getInstance().snapshotUpdated.connect(self.onSnapshotUpdated)
+
+    def refresh(self):
+        self.isShow = True
+        ModDownloadManager.getInstance().refresh()
+        self.render()
+
+    def freeze(self):
+        self.isShow = False
+        self.timer.stop()
+
+    def onSnapshotUpdated(self):
+        if self.isShow:
+            self.render()
+
+    def _updateAfter(self, callback: Callable[..., Any]) -> Callable[..., Any]:
+        """包装卡片的回调，在回调执行完后立即更新一次界面（轮询可能已经停止）"""
+
+        def wrapper(*args, **kwargs):
+            callback(*args, **kwargs)
+            self.render()
+
+        return wrapper
 
     def pollingUpdate(self):
+        if self.hasDownloadingTasks:
+            # 下载进度在快照更新后渲染
+            ModDownloadManager.getInstance().refresh()
+        else:
+            # 只剩导入任务时不需要请求aria2
+            self.render()
+
+    def render(self):
         statusList = aggregateModInstallationStatus()
+        self.hasDownloadingTasks = any(status.stage in DOWNLOADING_STAGES for status in statusList)
         if self.isShow:
             # 为status排序
             statusList.sort(key=lambda status: CARD_ORDER.index(status.stage))
             optsList = [convertInstallationInfoToCardOptions(status) for status in statusList]
+            for opts in optsList:
+                if opts.closeButtonClickedCallback:
+                    opts.closeButtonClickedCallback = self._updateAfter(
+                        opts.closeButtonClickedCallback
+                    )
             self.view.renderCards(optsList)
+        # 没有进行中的任务时停止轮询，直到下一次快照更新或界面刷新
+        if self.isShow and any(status.stage in IN_PROGRESS_STAGES for status in statusList):
+            if not self.timer.isActive():
+                self.timer.start()
+        else:
+            self.timer.stop()
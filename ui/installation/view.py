@@ -38,11 +38,11 @@ class ModInstallationManagerView(QWidget, IRefreshable, IFreezable):
 
     def refresh(self):
         # AppLogger().debug("ModInstallationManagerView refresh")
-        self.presenter.isShow = True
+        self.presenter.refresh()
 
     def freeze(self):
         # AppLogger().debug("ModInstallationManagerView freeze")
-        self.presenter.isShow = False
+        self.presenter.freeze()
 
     def renderCards(self, optsList: List[ModInstallationCardOptions]):
         # VBox中还有一个弹簧，因此要-1
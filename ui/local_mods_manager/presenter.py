@@ -27,7 +27,7 @@ class LocalModsManagerPresenter:
 
     def install(self, modData: ModData):
         self.view.showInstallMsg()
-        ModDownloadManager.getInstance().addTask(modData)
+        ModDownloadManager.getInstance().addTask(modData, isPriority=True)
 
     def installAll(self):
         if self.lastTableData is None:
@@ -35,4 +35,4 @@ class SearchPresenter:
         self.model.searchMode = mode
 
     def install(self, modData: ModData):
-        ModDownloadManager.getInstance().addTask(modData)
+        ModDownloadManager.getInstance().addTask(modData, isPriority=True)
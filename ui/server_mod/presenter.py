@@ -60,7 +60,7 @@ class ServerModPresenter:
         self.view.showAddJobInfo()
         button.setText("安装中")
         button.setEnabled(False)
-        ModDownloadManager.getInstance().addTask(modData)
+        ModDownloadManager.getInstance().addTask(modData, isPriority=True)
 
     def installAllMod(self):
         self.view.disableAllButtonInTable()
@@ -5,6 +5,8 @@ from PySide6.QtCore import QUrl
 from PySide6.QtGui import QDesktopServices
 
 import app_config
+from common.mod.installation.mod_download_manager import ModDownloadManager
+from common.mod.installation.mod_import_dispatcher import ModImportTaskDispatcher
 from common.utils import byteLengthToHumanReadable
 
 
@@ -32,3 +34,21 @@ class SettingsPresenter:
 
     def openLogDir(self):
         subprocess.run(["explorer", f"/select,{app_config.LOG_FILE_PATH}"])
+
+    def getBandwidthLimitMB(self) -> int:
+        return ModDownloadManager.getInstance().scheduler.bandwidthLimit // (1024 * 1024)
+
+    def setBandwidthLimitMB(self, limit: int):
+        ModDownloadManager.getInstance().scheduler.setBandwidthLimit(limit * 1024 * 1024)
+
+    def isLowImpactModeEnabled(self) -> bool:
+        return ModDownloadManager.getInstance().scheduler.isLowImpactModeEnabled
+
+    def setLowImpactModeEnabled(self, isEnabled: bool):
+        ModDownloadManager.getInstance().scheduler.setLowImpactModeEnabled(isEnabled)
+
+    def getMaxImportsPerVolume(self) -> int:
+        return ModImportTaskDispatcher.getInstance().maxImportsPerVolume
+
+    def setMaxImportsPerVolume(self, n: int):
+        ModImportTaskDispatcher.getInstance().setMaxImportsPerVolume(n)
@@ -1,11 +1,14 @@
-from PySide6.QtWidgets import QApplication, QWidget
-from qfluentwidgets import InfoBar, InfoBarPosition
+from PySide6.QtCore import QTimer
+from PySide6.QtWidgets import QApplication, QHBoxLayout, QLabel, QWidget
+from qfluentwidgets import InfoBar, InfoBarPosition, SpinBox, SwitchButton
 
 from ui.interfaces.i_refreshable import IRefreshable
 from ui.settings.presenter import SettingsPresenter
 from ui_design.settings_interface_ui import Ui_SettingsInterface
 
 CLEAN_DOWNLOAD_TMP_TEXT = "清理软件缓存（共计%s）"
+# 数值框停止变化多久（毫秒）后才应用设置，连续调整时只保存一次
+SETTING_APPLY_DELAY = 500
 
 
 class SettingsView(QWidget, Ui_SettingsInterface, IRefreshable):
@@ -15,6 +18,41 @@ class SettingsView(QWidget, Ui_SettingsInterface, IRefreshable):
         self.setupUi(self)
         self.cleanTmpButton.clicked.connect(self.presenter.cleanTempFile)
         self.openLogDirButton.clicked.connect(self.presenter.openLogDir)
+        self._setupDownloadSettings()
+
+    def _setupDownloadSettings(self):
+        """下载限速、低影响模式和导入并发数的设置（不在Qt Designer中设计，因为需要与下载管理器交互）"""
+        layout = QHBoxLayout()
+        layout.addWidget(QLabel("下载限速（MB/s，0为不限速）", self))
+        self.bandwidthLimitSpinBox = SpinBox(self)
+        self.bandwidthLimitSpinBox.setRange(0, 1000)
+        self.bandwidthLimitSpinBox.setValue(self.presenter.getBandwidthLimitMB())
+        self._connectDelayed(self.bandwidthLimitSpinBox, self.presenter.setBandwidthLimitMB)
+        layout.addWidget(self.bandwidthLimitSpinBox)
+        self.lowImpactModeSwitch = SwitchButton(self)
+        self.lowImpactModeSwitch.setOnText("游戏运行时降低下载速度")
+        self.lowImpactModeSwitch.setOffText("游戏运行时降低下载速度")
+        self.lowImpactModeSwitch.setChecked(self.presenter.isLowImpactModeEnabled())
+        self.lowImpactModeSwitch.checkedChanged.connect(self.presenter.setLowImpactModeEnabled)
+        layout.addWidget(self.lowImpactModeSwitch)
+        layout.addWidget(QLabel("每个磁盘同时导入的Mod数量", self))
+        self.maxImportsPerVolumeSpinBox = SpinBox(self)
+        self.maxImportsPerVolumeSpinBox.setRange(1, 8)
+        self.maxImportsPerVolumeSpinBox.setValue(self.presenter.getMaxImportsPerVolume())
+        self._connectDelayed(self.maxImportsPerVolumeSpinBox, self.presenter.setMaxImportsPerVolume)
+        layout.addWidget(self.maxImportsPerVolumeSpinBox)
+        layout.addStretch(1)
+        # 放在清理缓存按钮的下面
+        self.verticalLayout.insertLayout(2, layout)
+
+    def _connectDelayed(self, spinBox: SpinBox, apply):
+        """数值停止变化SETTING_APPLY_DELAY毫秒后才调用apply，
+        避免按住箭头或输入多位数时每一步都写设置文件并调用aria2"""
+        timer = QTimer(self)
+        timer.setSingleShot(True)
+        timer.setInterval(SETTING_APPLY_DELAY)
+        timer.timeout.connect(lambda: apply(spinBox.value()))
+        spinBox.valueChanged.connect(lambda _: timer.start())
 
     def refresh(self):
         self.presenter.refreshTmpSize()